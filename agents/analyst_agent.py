@@ -1,20 +1,34 @@
 from agents.base_agent import BaseAgent
+from google.genai import types
+import asyncio
 import pandas as pd
 import os
-from servers.config_server import load_config
+from utils.sandbox_pool import get_sandbox_pool, dataset_version
+from utils.query_cache import get_query_cache
+from utils.safe_eval import get_in_process_queries
+from utils.cubes import get_cube_store
+from utils.payload import PayloadEncoder
+from utils.metrics import metrics
 
 class DataAnalystAgent(BaseAgent):
     def __init__(self):
         super().__init__(name="DataAnalystAgent")
-        self.register_tool(self.get_data_summary)
-        self.register_tool(self.query_data)
+        self.register_tool(self.get_data_summary, concurrent=True)
+        self.register_tool(self.query_data, concurrent=True)
+        self.register_tool(self.lookup_cube, concurrent=True)
         
-        self.sales_data = None
-        self.final_plan = None
-        self._load_data()
+        # CSVs are read on first use, not when the agent is built, and shared with the
+        # in-process query path; assigning sales_data/final_plan pins a frame instead
+        self._sales_data = None
+        self._final_plan = None
         
-        # Load policy for context injection
-        policy = load_config("config.yaml")
+        self._set_policy_instruction()
+
+    def _set_policy_instruction(self):
+        """System instruction with the current policy values baked in."""
+        # Policy for context injection (the runtime's parsed config.yaml)
+        self.policy_version = self.runtime.policy.version
+        policy = self.config
         constraints = policy.get('constraints', {})
         
         self.set_system_instruction(
@@ -39,6 +53,10 @@ class DataAnalystAgent(BaseAgent):
             4. **Policy**: Use the Policy Context above to answer questions about limits or guardrails.
             
             **Tool Usage**:
+            - For common aggregates, use 'lookup_cube' first (precomputed at the end of each planning cycle):
+              sales_by_week, sales_by_month, sales_by_sku, sales_by_sku_month, sales_by_segment_month,
+              plan_by_week, plan_by_month, plan_by_sku, plan_by_sku_month, plan_by_segment.
+              Plan cubes have Baseline_P50, Plan, Constrained_Plan, Upside and Cut (per SKU/segment also Cut_Weeks).
             - Use 'query_data' to execute Python pandas code.
             - The dataframes are available as `self.sales_data`, `self.final_plan`, and `self.segmentation`.
             - RETURN ONLY THE CODE STRING.
@@ -52,14 +70,32 @@ class DataAnalystAgent(BaseAgent):
             """
         )
 
-    def _load_data(self):
+    def _dataset(self, name: str):
         try:
-            if os.path.exists("data/sales_data.csv"):
-                self.sales_data = pd.read_csv("data/sales_data.csv")
-            if os.path.exists("data/final_plan.csv"):
-                self.final_plan = pd.read_csv("data/final_plan.csv")
+            return get_in_process_queries(self.config).frames()[name]
         except Exception as e:
             print(f"[{self.name}] Error loading data: {e}")
+            return None
+
+    @property
+    def sales_data(self):
+        if self._sales_data is not None:
+            return self._sales_data
+        return self._dataset('sales_data')
+
+    @sales_data.setter
+    def sales_data(self, value):
+        self._sales_data = value
+
+    @property
+    def final_plan(self):
+        if self._final_plan is not None:
+            return self._final_plan
+        return self._dataset('final_plan')
+
+    @final_plan.setter
+    def final_plan(self, value):
+        self._final_plan = value
 
     def get_data_summary(self) -> str:
         """Returns a summary of the available data columns and types."""
@@ -72,169 +108,165 @@ class DataAnalystAgent(BaseAgent):
 
     def query_data(self, query_code: str) -> str:
         """
-        Executes a single line of Python pandas code inside a Docker container.
+        Executes a single line of Python pandas code: in-process when it is a plain,
+        validated pandas expression over the datasets, otherwise in a sandboxed worker.
         """
-        import subprocess
-        
-        # 1. Create the script content
-        # We need to load the data inside the container. 
-        # The container will have /data mounted.
-        script_content = f"""
-import pandas as pd
-import os
-
-try:
-    sales_data = pd.read_csv('/data/sales_data.csv') if os.path.exists('/data/sales_data.csv') else None
-    final_plan = pd.read_csv('/data/final_plan.csv') if os.path.exists('/data/final_plan.csv') else None
-    segmentation = pd.read_csv('/data/segmentation.csv') if os.path.exists('/data/segmentation.csv') else None
-    
-    if final_plan is not None and 'Negotiation_Log' in final_plan.columns:
-        final_plan['Negotiation_Log'] = final_plan['Negotiation_Log'].fillna('').astype(str)
-    
-    # Define 'self' mock for compatibility with the query string if it uses 'self.sales_data'
-    class MockSelf:
-        def __init__(self, s, f, seg):
-            self.sales_data = s
-            self.final_plan = f
-            self.segmentation = seg
-    
-    self = MockSelf(sales_data, final_plan, segmentation)
-    
-    # Execute the query
-    result = {query_code}
-    print(result)
-except Exception as e:
-    print(f"Error: {{e}}")
-"""
-        
-        # 2. Write script to a temporary file accessible to Docker
-        # We'll use the current directory's 'sandbox' folder
-        script_path = os.path.abspath("sandbox/temp_query.py")
-        with open(script_path, "w") as f:
-            f.write(script_content)
-            
-        # 3. Run Docker
-        # Mount current data dir to /data
-        # Mount script to /app/script.py
-        data_dir = os.path.abspath("data")
-        
-        cmd = [
-            "docker", "run", "--rm",
-            "-v", f"{data_dir}:/data",
-            "-v", f"{script_path}:/app/script.py",
-            "pandas-sandbox",
-            "python", "/app/script.py"
-        ]
-        
+        # Repeated questions against unchanged data are answered from the cache
+        query_cache = get_query_cache(self.config)
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            if result.returncode != 0:
-                return f"Error executing in Docker: {result.stderr}"
-            return result.stdout.strip()
+            version = dataset_version(self.sandbox.data_dir)
+            cached = query_cache.get(query_code, version)
+            if cached is not None:
+                print(f"[{self.name}] Query cache hit.")
+                metrics.inc('analyst_query_cache_hits_total')
+                return cached
+            # Plain pandas expressions skip the sandbox round trip
+            output = get_in_process_queries(self.config).query(query_code, version)
+            if output is not None:
+                metrics.inc('analyst_queries_total', path="in_process")
+            else:
+                # Warm Docker workers with the CSVs already loaded (local subprocesses only if opted in)
+                output = self.sandbox.query(query_code, version)
+                metrics.inc('analyst_queries_total', path="sandbox")
         except Exception as e:
             return f"System Error: {e}"
+        query_cache.put(query_code, version, output)
+        return output
+
+    def lookup_cube(self, name: str, sku: str = "", segment: str = "") -> str:
+        """
+        Reads a precomputed aggregate (e.g. 'plan_by_sku', 'sales_by_month'), optionally
+        for one SKU or segment.
+        """
+        cube = get_cube_store(self.config).lookup(name, SKU=sku or None, Segment=segment or None)
+        if cube is None:
+            return f"Error: Cube '{name}' is not available or out of date; use query_data instead."
+        metrics.inc('analyst_queries_total', path="cube")
+        return PayloadEncoder.from_config(self.config).encode(cube)
+
+    @property
+    def sandbox(self):
+        """The process-wide pool of sandbox workers, started on the first query."""
+        return get_sandbox_pool(self.config)
     
     def run(self, prompt: str) -> str:
         """
         Override base run() to handle multi-turn tool execution.
         The agent may call query_data, and we need to feed the result back for interpretation.
         """
-        if not self.client:
+        if not self.runtime.backend.ready:
             return "Error: GOOGLE_API_KEY not set."
 
         print(f"[{self.name}] Thinking...")
+        # Policy edits since the instruction was built apply without a restart
+        if self.runtime.policy.changed_since(self.policy_version):
+            self._set_policy_instruction()
         
-        from google.genai import types
-        
-        # Prepare tools
-        tool_list = [func for func in self.tools.values()] if self.tools else None
-        
-        # Create chat session
-        chat = self.client.chats.create(
-            model=self.model_name,
-            config=types.GenerateContentConfig(
-                temperature=self.model_config.get('temperature', 0.2),
-                max_output_tokens=self.model_config.get('max_output_tokens', 2048),
-                tools=tool_list,
-                system_instruction=self.system_instruction
-            ),
-            history=self.history
-        )
+        contents = list(self.history) + [types.Content(role="user", parts=[types.Part(text=prompt)])]
 
         try:
-            # First turn: Send user question
-            response = chat.send_message(prompt)
+            # First turn: Send user question (served from the response cache when seen before)
+            response = self._generate(contents)
             
             # Check for valid response
             if not response.candidates or not response.candidates[0].content:
                 print(f"[{self.name}] Warning: Empty response from model.")
                 return "Error: Model returned empty content."
             
-            candidate = response.candidates[0]
-            
             # Check if model called query_data tool
-            tool_results = []
-            for part in candidate.content.parts:
-                if part.function_call:
-                    func_name = part.function_call.name
-                    args = part.function_call.args
-                    
-                    print(f"[{self.name}] Tool Call: {func_name}")
-                    
-                    if func_name in self.tools:
-                        try:
-                            tool_args = self._to_python_types(args)
-                            result = self.tools[func_name](**tool_args)
-                            tool_results.append({
-                                "name": func_name,
-                                "result": str(result)
-                            })
-                        except Exception as e:
-                            print(f"[{self.name}] Tool Execution Error: {e}")
-                            tool_results.append({
-                                "name": func_name,
-                                "result": f"Error: {e}"
-                            })
+            tool_results = self._run_tools(response.candidates[0])
             
             # If tools were called, send results back and get final answer
             if tool_results:
-                # Build function response
-                function_response_parts = []
-                for tr in tool_results:
-                    function_response_parts.append(
-                        types.Part(function_response=types.FunctionResponse(
-                            name=tr["name"],
-                            response={"result": tr["result"]}
-                        ))
-                    )
-                
-                # Send tool results back
-                response2 = chat.send_message(
-                    types.Content(parts=function_response_parts)
-                )
-                
-                if response2.candidates and response2.candidates[0].content:
-                    text_response = response2.text
-                else:
-                    # Fallback: just return the tool result
-                    text_response = tool_results[0]["result"]
+                self._append_tool_results(contents, response.candidates[0], tool_results)
+                response2 = self._generate(contents)
+                text_response = self._final_text(response2, tool_results)
             else:
                 # No tool call, just return text
                 text_response = response.text if response.text else "Error: No response generated."
             
-            # Update history
-            self.history.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
-            self.history.append(types.Content(role="model", parts=[types.Part(text=text_response)]))
+            return self._record(prompt, text_response)
+
+        except Exception as e:
+            print(f"[{self.name}] Error during generation: {e}")
+            return f"Error: {e}"
+
+    async def arun(self, prompt: str) -> str:
+        """Async run() for the API: model calls on the async client, queries in a worker thread."""
+        if not self.runtime.backend.ready:
+            return "Error: GOOGLE_API_KEY not set."
+
+        print(f"[{self.name}] Thinking...")
+        # Policy edits since the instruction was built apply without a restart
+        if self.runtime.policy.changed_since(self.policy_version):
+            self._set_policy_instruction()
+        
+        contents = list(self.history) + [types.Content(role="user", parts=[types.Part(text=prompt)])]
+
+        try:
+            response = await self._agenerate(contents)
+            
+            if not response.candidates or not response.candidates[0].content:
+                print(f"[{self.name}] Warning: Empty response from model.")
+                return "Error: Model returned empty content."
             
-            # Log to memory
-            self.memory_store.log_interaction(prompt, text_response, self.name)
+            tool_results = await asyncio.to_thread(self._run_tools, response.candidates[0])
             
-            print(f"[{self.name}] Response: {text_response[:100]}...")
-            return text_response
+            if tool_results:
+                self._append_tool_results(contents, response.candidates[0], tool_results)
+                response2 = await self._agenerate(contents)
+                text_response = self._final_text(response2, tool_results)
+            else:
+                text_response = response.text if response.text else "Error: No response generated."
+            
+            return await asyncio.to_thread(self._record, prompt, text_response)
 
         except Exception as e:
             print(f"[{self.name}] Error during generation: {e}")
             return f"Error: {e}"
+
+    def _run_tools(self, candidate) -> list:
+        """
+        Executes every function call in the candidate (queries in parallel) and returns this
+        request's [{name, args, result, seconds}].
+        """
+        calls = [part.function_call for part in candidate.content.parts or [] if part.function_call]
+        # Unknown tools are skipped, as before
+        calls = [call for call in calls if call.name in self.tools]
+        return self._execute_tool_calls(calls)
+
+    @staticmethod
+    def _append_tool_results(contents: list, candidate, tool_results: list):
+        # Build function response
+        function_response_parts = []
+        for tr in tool_results:
+            function_response_parts.append(
+                types.Part(function_response=types.FunctionResponse(
+                    name=tr["name"],
+                    response={"result": tr["result"]}
+                ))
+            )
+        
+        # Send tool results back
+        contents.append(candidate.content)
+        contents.append(types.Content(role="user", parts=function_response_parts))
+
+    @staticmethod
+    def _final_text(response, tool_results: list) -> str:
+        if response.candidates and response.candidates[0].content:
+            return response.text
+        # Fallback: just return the tool result
+        return tool_results[0]["result"]
+
+    def _record(self, prompt: str, text_response: str) -> str:
+        # Update history
+        self.history_manager.add_turn(prompt, text_response)
+        
+        # Log to memory
+        self.memory_store.log_interaction(prompt, text_response, self.name)
+        
+        print(f"[{self.name}] Response: {text_response[:100]}...")
+        return text_response
     
     def _to_python_types(self, obj):
         """Recursively converts Protobuf Map/List to native Python dict/list."""
@@ -1,53 +1,92 @@
-import os
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Callable, Dict, Any, Optional
-from google import genai
 from google.genai import types
-import yaml
-import inspect
 from utils.memory_store import MemoryStore
-from dotenv import load_dotenv
+from utils.llm_cache import make_cache_key
+from utils.metrics import metrics, current_step
+from utils.runtime import AgentRuntime, get_runtime
+from utils.history import HistoryManager, SessionHistories
+
+# Tools are mostly I/O-bound (MCP, Docker, file reads), so one shared pool serves every agent
+_tool_pool: Optional[ThreadPoolExecutor] = None
+_tool_pool_lock = threading.Lock()
+
+
+def _get_tool_pool(max_workers: int) -> ThreadPoolExecutor:
+    global _tool_pool
+    # Agents on different threads can make their first tool batch at the same time
+    with _tool_pool_lock:
+        if _tool_pool is None:
+            _tool_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-tool")
+        return _tool_pool
+
 
 class BaseAgent:
-    def __init__(self, name: str, config_path: str = "config.yaml"):
-        # Load environment variables from .env file
-        load_dotenv()
-        
+    def __init__(self, name: str, config_path: str = "config.yaml", runtime: AgentRuntime = None):
         self.name = name
         self.config_path = config_path
-        self.config = self._load_config()
+        
+        # Config, client and response cache are shared by all agents in the process
+        self.runtime = runtime or get_runtime(config_path)
         self.model_config = self.config.get('model_config', {})
+        self.response_cache = self.runtime.response_cache
         
         # Initialize Memory Store
         self.memory_store = MemoryStore()
         
-        # Initialize Gemini Client
-        api_key = os.environ.get("GOOGLE_API_KEY")
-        if not api_key:
+        if not self.runtime.backend.ready:
             print(f"[{self.name}] WARNING: GOOGLE_API_KEY not found. Agent will fail if it tries to call Gemini.")
-            self.client = None
-        else:
-            self.client = genai.Client(api_key=api_key)
             
         self.model_name = self.model_config.get('model_name', 'gemini-2.5-flash-lite')
         self.tools: Dict[str, Callable] = {}
-        self.history: List[types.Content] = []
+        # Tools that are safe to run alongside other calls from the same response
+        self.concurrent_tools = set()
+        # Model round-trips per run before we stop feeding tool results back
+        self.max_tool_steps = self.model_config.get('max_tool_steps', 10)
+        self.tool_workers = self.model_config.get('tool_workers', 8)
+        # Past turns per chat session, windowed and summarized to stay within a token budget
+        self.histories = SessionHistories.from_config(self.config)
         self.system_instruction: str = ""
         
         # Register Memory Tools
         self.register_tool(self.save_insight)
-        self.register_tool(self.get_insight)
+        self.register_tool(self.get_insight, concurrent=True)
 
-    def _load_config(self) -> Dict:
-        try:
-            with open(self.config_path, 'r') as f:
-                return yaml.safe_load(f)
-        except Exception as e:
-            print(f"[{self.name}] Error loading config: {e}")
-            return {}
+    @property
+    def config(self) -> Dict[str, Any]:
+        """The current config.yaml (a shared snapshot, reloaded when the file changes)."""
+        return self.runtime.config
 
-    def register_tool(self, func: Callable):
-        """Registers a Python function as a tool for the agent."""
+    @property
+    def history_manager(self) -> HistoryManager:
+        """History of the current chat session (see utils.history.session)."""
+        return self.histories.get()
+
+    @property
+    def history(self) -> List[types.Content]:
+        """The conversation history sent with the next request."""
+        return self.history_manager.contents()
+
+    @property
+    def client(self):
+        """Gemini client shared through the runtime (None without an API key)."""
+        return self.runtime.client
+
+    def register_tool(self, func: Callable, concurrent: bool = False):
+        """
+        Registers a Python function as a tool for the agent.
+        concurrent: the tool only reads state (or only does I/O), so several calls to it
+                    in one model response can run in parallel. Other tools run one at a time.
+        """
         self.tools[func.__name__] = func
+        if concurrent:
+            self.concurrent_tools.add(func.__name__)
+        else:
+            self.concurrent_tools.discard(func.__name__)
 
     def set_system_instruction(self, instruction: str):
         self.system_instruction = instruction
@@ -65,95 +104,252 @@ class BaseAgent:
         """
         Sends a prompt to the model, handles tool calls, and returns the text response.
         """
-        if not self.client:
+        if not self.runtime.backend.ready:
             return "Error: GOOGLE_API_KEY not set."
 
         print(f"[{self.name}] Thinking...")
         
-        # Prepare tools for the API
-        tool_list = [func for func in self.tools.values()] if self.tools else None
-        
-        # Create chat session if not exists (or continue history)
-        # Note: In a real ADK, we might manage session state more explicitly.
-        # Here we use a simple generate_content with history management manually or via ChatSession.
-        
-        # We will use a fresh chat session for each 'run' in this simple PoC, 
-        # but pre-load it with history if we wanted persistent memory.
-        # For this PoC, we'll treat 'run' as a single turn or a continuation.
-        
-        chat = self.client.chats.create(
-            model=self.model_name,
-            config=types.GenerateContentConfig(
-                temperature=self.model_config.get('temperature', 0.2),
-                max_output_tokens=self.model_config.get('max_output_tokens', 2048),
-                tools=tool_list,
-                system_instruction=self.system_instruction
-            ),
-            history=self.history
-        )
+        contents = list(self.history) + [types.Content(role="user", parts=[types.Part(text=prompt)])]
 
         try:
-            response = chat.send_message(prompt)
-            
-            # The response might be a tool call.
-            # If using automatic function calling (not yet fully standard in all SDK versions without setup),
-            # we might need to loop. 
-            # Check for valid candidates
-            if not response.candidates:
-                print(f"[{self.name}] Error: No candidates returned. Likely safety filter or empty response.")
-                return "Error: No response generated by the model."
+            response = self._generate(contents)
             
-            candidate = response.candidates[0]
+            # Tools run locally (not through the SDK) so cached responses still trigger them.
+            # Every call in a response is executed and all results go back in one message,
+            # until the model answers in text or the step limit is reached.
+            for _ in range(self.max_tool_steps - 1):
+                if not self._has_tool_calls(response):
+                    break
+                results = [r['result'] for r in self._execute_tool_calls(response.function_calls)]
+                self._append_tool_round(contents, response, results)
+                response = self._generate(contents)
             
-            # Check for valid content
-            if not candidate.content or not candidate.content.parts:
-                 print(f"[{self.name}] Warning: Candidate content is empty. Finish reason: {candidate.finish_reason}")
-                 return "Error: Model returned empty content."
-
-            # Check for function calls
-            for part in candidate.content.parts:
-                if part.function_call:
-                    func_name = part.function_call.name
-                    args = part.function_call.args
-                    
-                    print(f"[{self.name}] Tool Call: {func_name}")
-                    
-                    if func_name in self.tools:
-                        try:
-                            # Convert args to native python types recursively
-                            # The SDK returns MapComposite and RepeatedComposite which json.dumps hates.
-                            tool_args = self._to_python_types(args)
-                            result = self.tools[func_name](**tool_args)
-                            return str(result)
-                        except Exception as e:
-                            print(f"[{self.name}] Tool Execution Error: {e}")
-                            return f"Error executing tool {func_name}: {e}"
-                    else:
-                        return f"Error: Tool {func_name} not found."
-
-            # Simple return for text
-            text_response = response.text
-            if text_response is None:
-                 text_response = "Error: Model returned None text."
-            
-            # Update history
-            # Update history manually since chat.history might not be accessible or standard
-            # We know what we sent and what we got.
-            self.history.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
-            self.history.append(types.Content(role="model", parts=[types.Part(text=text_response)]))
+            return self._finish(prompt, response)
+
+        except Exception as e:
+            return self._generation_error(prompt, e)
+
+    async def arun(self, prompt: str) -> str:
+        """
+        Async version of run() on the SDK's async client, so callers on an event loop
+        (FastAPI, the orchestrator) keep serving while the model thinks. Tools run in
+        worker threads since they are plain blocking functions.
+        """
+        if not self.runtime.backend.ready:
+            return "Error: GOOGLE_API_KEY not set."
+
+        print(f"[{self.name}] Thinking...")
+        
+        contents = list(self.history) + [types.Content(role="user", parts=[types.Part(text=prompt)])]
+
+        try:
+            response = await self._agenerate(contents)
             
-            # Log to Memory Store
-            self.memory_store.log_interaction(prompt, text_response, self.name)
+            for _ in range(self.max_tool_steps - 1):
+                if not self._has_tool_calls(response):
+                    break
+                records = await asyncio.to_thread(self._execute_tool_calls, response.function_calls)
+                self._append_tool_round(contents, response, [r['result'] for r in records])
+                response = await self._agenerate(contents)
             
-            print(f"[{self.name}] Response: {text_response[:100]}...")
-            return text_response
+            # May run leftover tool calls and writes the memory store
+            return await asyncio.to_thread(self._finish, prompt, response)
 
         except Exception as e:
-            print(f"[{self.name}] Error during generation: {e}")
-            if "API key not valid" in str(e) or "API_KEY_INVALID" in str(e):
-                print(f"[{self.name}] FALLBACK: Simulating response for PoC.")
-                return self._mock_response(prompt)
-            return f"Error: {e}"
+            return self._generation_error(prompt, e)
+
+    @staticmethod
+    def _has_tool_calls(response: types.GenerateContentResponse) -> bool:
+        return bool(response.candidates and response.candidates[0].content and response.function_calls)
+
+    @staticmethod
+    def _append_tool_round(contents: List[types.Content], response: types.GenerateContentResponse, results: List[str]):
+        """Adds the model's function calls and our results to the conversation."""
+        contents.append(response.candidates[0].content)
+        contents.append(types.Content(role="user", parts=[
+            types.Part(function_response=types.FunctionResponse(name=call.name, response={"result": result}))
+            for call, result in zip(response.function_calls, results)
+        ]))
+
+    def _finish(self, prompt: str, response: types.GenerateContentResponse) -> str:
+        """Turns the final model response into the text answer and records the turn."""
+        # Check for valid candidates
+        if not response.candidates:
+            print(f"[{self.name}] Error: No candidates returned. Likely safety filter or empty response.")
+            return "Error: No response generated by the model."
+        
+        candidate = response.candidates[0]
+        
+        # Check for valid content
+        if not candidate.content or not candidate.content.parts:
+             print(f"[{self.name}] Warning: Candidate content is empty. Finish reason: {candidate.finish_reason}")
+             return "Error: Model returned empty content."
+
+        # Still calling tools at the step limit: run them and return their results
+        if response.function_calls:
+            print(f"[{self.name}] Tool step limit ({self.max_tool_steps}) reached.")
+            return "\n".join(r['result'] for r in self._execute_tool_calls(response.function_calls))
+
+        # Simple return for text
+        text_response = response.text
+        if text_response is None:
+             text_response = "Error: Model returned None text."
+        
+        # Update history (data payloads in the prompt are stripped before it is kept)
+        self.history_manager.add_turn(prompt, text_response)
+        
+        # Log to Memory Store
+        self.memory_store.log_interaction(prompt, text_response, self.name)
+        
+        print(f"[{self.name}] Response: {text_response[:100]}...")
+        return text_response
+
+    def _generation_error(self, prompt: str, e: Exception) -> str:
+        print(f"[{self.name}] Error during generation: {e}")
+        if "API key not valid" in str(e) or "API_KEY_INVALID" in str(e):
+            print(f"[{self.name}] FALLBACK: Simulating response for PoC.")
+            return self._mock_response(prompt)
+        return f"Error: {e}"
+
+    def _tool_declarations(self) -> List[Dict]:
+        """Function declarations for the registered tools (also part of the cache key)."""
+        return [self.runtime.tool_declaration(func) for func in self.tools.values()]
+
+    def _prepare_request(self, contents: List[types.Content]):
+        """Returns (cache key, generate config, cached response or None) for one model call."""
+        declarations = self._tool_declarations()
+        temperature = self.model_config.get('temperature', 0.2)
+        max_output_tokens = self.model_config.get('max_output_tokens', 2048)
+        key = make_cache_key(
+            model=self.model_name,
+            system_instruction=self.system_instruction,
+            contents=[c.model_dump(mode='json', exclude_none=True) for c in contents],
+            tools=declarations,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+        )
+        config = types.GenerateContentConfig(
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            tools=[types.Tool(function_declarations=declarations)] if declarations else None,
+            system_instruction=self.system_instruction or None,
+            automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True)
+        )
+        # Recording must reach the model, otherwise cache hits would leave gaps in the cassettes
+        cached = self.response_cache.get(key) if self.runtime.backend.mode != "record" else None
+        if cached is not None:
+            print(f"[{self.name}] Cache hit.")
+            metrics.inc('agent_cache_hits_total', agent=self.name, step=current_step.get())
+            cached = types.GenerateContentResponse.model_validate(cached)
+        return key, config, cached
+
+    def _record_model_call(self, response: Optional[types.GenerateContentResponse], seconds: float):
+        """Latency and token usage of one model call (response is None when it failed)."""
+        step = current_step.get()
+        if response is None:
+            metrics.inc('agent_errors_total', agent=self.name, step=step)
+            return
+        metrics.observe('agent_model_latency_seconds', seconds, agent=self.name, step=step)
+        usage = response.usage_metadata
+        if usage is not None:
+            metrics.inc('agent_prompt_tokens_total', usage.prompt_token_count or 0, agent=self.name, step=step)
+            metrics.inc('agent_response_tokens_total', usage.candidates_token_count or 0, agent=self.name, step=step)
+
+    def _store_response(self, key: str, response: types.GenerateContentResponse):
+        # Only cache usable answers; errors and empty candidates are retried next time
+        if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+            self.response_cache.put(
+                key, response.model_dump(mode='json', exclude_none=True, exclude={'sdk_http_response'}), self.model_name
+            )
+
+    def _generate(self, contents: List[types.Content]) -> types.GenerateContentResponse:
+        """
+        One model call, served from the response cache when the model, system instruction,
+        history, tools, prompt and sampling settings are identical to a previous call.
+        """
+        key, config, cached = self._prepare_request(contents)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.runtime.scheduler.call(
+                lambda: self.runtime.backend.generate(key, self.model_name, contents, config), agent=self.name
+            )
+        finally:
+            self._record_model_call(response, time.perf_counter() - start)
+        self._store_response(key, response)
+        return response
+
+    async def _agenerate(self, contents: List[types.Content]) -> types.GenerateContentResponse:
+        """Async _generate() through the backend's async path."""
+        key, config, cached = self._prepare_request(contents)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.runtime.scheduler.acall(
+                lambda: self.runtime.backend.agenerate(key, self.model_name, contents, config), agent=self.name
+            )
+        finally:
+            self._record_model_call(response, time.perf_counter() - start)
+        self._store_response(key, response)
+        return response
+
+    def _call_tool(self, function_call) -> Dict[str, Any]:
+        """
+        Executes one function call from the model. Returns its record for this request:
+        {name, args, result (as a string), seconds}.
+        """
+        func_name = function_call.name
+        print(f"[{self.name}] Tool Call: {func_name}")
+        # Convert args to native python types recursively
+        # The SDK returns MapComposite and RepeatedComposite which json.dumps hates.
+        tool_args = self._to_python_types(function_call.args or {})
+        start = time.perf_counter()
+        if func_name not in self.tools:
+            result = f"Error: Tool {func_name} not found."
+        else:
+            try:
+                result = str(self.tools[func_name](**tool_args))
+            except Exception as e:
+                print(f"[{self.name}] Tool Execution Error: {e}")
+                metrics.inc('agent_tool_errors_total', agent=self.name, tool=func_name, step=current_step.get())
+                result = f"Error executing tool {func_name}: {e}"
+        seconds = time.perf_counter() - start
+        metrics.observe('agent_tool_duration_seconds', seconds, agent=self.name, tool=func_name, step=current_step.get())
+        # Returned, not kept on the agent: concurrent requests share the agent
+        return {'name': func_name, 'args': tool_args, 'result': result, 'seconds': seconds}
+
+    def _execute_tool_calls(self, function_calls) -> List[Dict[str, Any]]:
+        """
+        Executes all function calls from one model response, returning their records in call order.
+        Consecutive calls to concurrent tools run in parallel on the shared tool pool; any
+        other tool acts as a barrier and runs on its own, so state changes keep their order.
+        """
+        results = [None] * len(function_calls)
+        batch = []
+
+        def flush():
+            if len(batch) == 1:
+                results[batch[0]] = self._call_tool(function_calls[batch[0]])
+            elif batch:
+                pool = _get_tool_pool(self.tool_workers)
+                # Copy the context so per-step output capture and priorities follow the call
+                futures = {i: pool.submit(contextvars.copy_context().run, self._call_tool, function_calls[i]) for i in batch}
+                for i, future in futures.items():
+                    results[i] = future.result()
+            batch.clear()
+
+        for i, call in enumerate(function_calls):
+            if call.name in self.concurrent_tools:
+                batch.append(i)
+            else:
+                flush()
+                results[i] = self._call_tool(call)
+        flush()
+        return results
 
     def _to_python_types(self, obj):
         """Recursively converts Protobuf Map/List to native Python dict/list."""
@@ -185,4 +381,4 @@ class BaseAgent:
         return "Mock response."
 
     def reset_memory(self):
-        self.history = []
+        self.history_manager.clear()
@@ -1,13 +1,14 @@
 from agents.base_agent import BaseAgent
 import pandas as pd
 import numpy as np
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
 
 class BaselineForecastAgent(BaseAgent):
     def __init__(self):
         super().__init__(name="BaselineAgent")
         self.forecasts = []
         
+        # Sequential: it appends to self.forecasts, and the order of those rows has to follow
+        # the calls (fitting is GIL-bound, so threads gained little anyway)
         self.register_tool(self.run_forecast_model)
         
         self.set_system_instruction(
@@ -32,6 +33,8 @@ class BaselineForecastAgent(BaseAgent):
         
         try:
             if model_family == 'ETS':
+                # statsmodels is slow to import, so only load it when a forecast needs it
+                from statsmodels.tsa.holtwinters import ExponentialSmoothing
                 # Check if enough data for seasonal
                 if len(series) < 52 * 2:
                      model = ExponentialSmoothing(series, trend='add').fit()
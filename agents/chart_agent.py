@@ -1,13 +1,18 @@
 from agents.base_agent import BaseAgent
 import pandas as pd
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import math
+import asyncio
+from utils.payload import PayloadEncoder
+from utils.cubes import get_cube_store
 
 class ChartAgent(BaseAgent):
     def __init__(self):
         super().__init__(name="ChartAgent")
-        self.register_tool(self.generate_chart_config)
+        self.register_tool(self.generate_chart_config, concurrent=True)
+        self.payload_encoder = PayloadEncoder.from_config(self.config)
+        self.cube_store = get_cube_store(self.config)
         
         self.set_system_instruction(
             """
@@ -61,10 +66,64 @@ class ChartAgent(BaseAgent):
         }
         return json.dumps(config)
 
-    def run(self, query: str, data_context: pd.DataFrame) -> str:
+    def run(self, query: str, data_context: Optional[pd.DataFrame] = None, cube: Optional[pd.DataFrame] = None) -> str:
         """
         Analyzes the data and generates a chart config based on the query.
+        data_context may be None when cube_context(query) answers it; pass that result
+        as `cube` when it is already at hand so the cube isn't looked up twice.
         """
+        prompt, data_context = self._prepare(query, data_context, cube)
+        response = super().run(prompt)
+        return self._chart_from_response(response, data_context)
+
+    async def arun(self, query: str, data_context: Optional[pd.DataFrame] = None,
+                   cube: Optional[pd.DataFrame] = None) -> str:
+        """Async run(): data prep in a worker thread, model call on the async client."""
+        prompt, data_context = await asyncio.to_thread(self._prepare, query, data_context, cube)
+        response = await super().arun(prompt)
+        return self._chart_from_response(response, data_context)
+
+    def cube_context(self, query: str) -> Optional[pd.DataFrame]:
+        """
+        Monthly/quarterly charts (optionally for one SKU and year) straight from the cubes
+        materialised at the end of the planning cycle. None when the query needs the raw
+        data (relative date ranges) or the cubes are out of date.
+        """
+        import re
+        q = query.lower()
+        if 'monthly' in q or 'month' in q:
+            grain = 'month'
+        elif 'quarterly' in q or 'quarter' in q:
+            grain = 'quarter'
+        else:
+            return None
+        if re.search(r'(last|next) (\d+) month', query, re.IGNORECASE):
+            return None
+
+        data_context = None
+        sku_match = re.search(r'(SKU_\d+)', query, re.IGNORECASE)
+        if sku_match:
+            data_context = self.cube_store.lookup(f"history_and_plan_by_sku_{grain}", SKU=sku_match.group(1).upper())
+            data_context = data_context.drop(columns='SKU') if data_context is not None and not data_context.empty else None
+        if data_context is None:
+            data_context = self.cube_store.load(f"history_and_plan_by_{grain}")
+            if data_context is None:
+                return None
+
+        year_match = re.search(r'\b(202[0-9])\b', query)
+        if year_match:
+            data_context = data_context[data_context['Date'].dt.year == int(year_match.group(1))]
+        print(f"[{self.name}] Using the materialised {grain}ly cube.")
+        return data_context.reset_index(drop=True)
+
+    def _prepare(self, query: str, data_context: Optional[pd.DataFrame], cube: Optional[pd.DataFrame] = None):
+        """Filters/aggregates the data for the query. Returns (prompt, data_context)."""
+        # 0. Already aggregated at the end of the planning cycle
+        if cube is None:
+            cube = self.cube_context(query)
+        if cube is not None:
+            return self._prompt(query, cube), cube
+        
         # 1. Pre-filter data if specific SKU is mentioned
         # Simple heuristic to find SKU_XXX
         import re
@@ -135,15 +194,16 @@ class ChartAgent(BaseAgent):
                 numeric_cols = data_context.select_dtypes(include=['number']).columns
                 data_context = data_context.set_index('Date').resample('QS')[numeric_cols].sum().reset_index()
 
-        # 3. Convert dataframe to JSON
-        # Increase limit to allow for full history (104 weeks is ~2 years)
-        # 500 rows is safe for a single SKU (104 rows)
-        data_str = data_context.head(500).to_json(orient='records')
+        return self._prompt(query, data_context), data_context
+
+    def _prompt(self, query: str, data_context: pd.DataFrame) -> str:
+        # 3. Encode as compact CSV; over the token budget it gets aggregated or sampled
+        data_str = self.payload_encoder.encode(data_context)
         
         prompt = f"""
         User Query: "{query}"
         
-        Data (first 500 rows):
+        Data (CSV):
         {data_str}
         
         Instructions:
@@ -151,9 +211,9 @@ class ChartAgent(BaseAgent):
         2. Use the 'generate_chart_config' tool to create the chart configuration.
         3. IMPORTANT: Your final response MUST be ONLY the JSON string returned by the tool. Do not add any explanation or markdown formatting.
         """
-        
-        response = super().run(prompt)
-        
+        return prompt
+
+    def _chart_from_response(self, response: str, data_context: pd.DataFrame) -> str:
         # Fallback for PoC if LLM fails or no key
         if "{" not in response and "}" not in response:
              print(f"[{self.name}] FALLBACK: Generating default chart.")
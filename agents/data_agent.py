@@ -12,7 +12,7 @@ class DataAndSignalAgent(BaseAgent):
         self.register_tool(self.load_data)
         self.register_tool(self.detect_anomalies)
         self.register_tool(self.clean_data)
-        self.register_tool(self.get_data_summary)
+        self.register_tool(self.get_data_summary, concurrent=True)
         
         self.set_system_instruction(
             """
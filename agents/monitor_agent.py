@@ -6,8 +6,8 @@ class MonitorExplainLearnAgent(BaseAgent):
         super().__init__(name="MonitorAgent")
         self.final_plan = None
         
-        self.register_tool(self.get_metrics)
-        self.register_tool(self.get_cuts_summary)
+        self.register_tool(self.get_metrics, concurrent=True)
+        self.register_tool(self.get_cuts_summary, concurrent=True)
         
         self.set_system_instruction(
             """
@@ -1,13 +1,27 @@
 from agents.base_agent import BaseAgent
+from utils.capacity import CapacityModel
+from utils.negotiation import CUT_LOG_DTYPE, CutLedger
+from utils.negotiation_state import NegotiationState
+from utils.policy_compiler import CompiledPolicy
+from typing import List, Dict, Any
+import os
+import numpy as np
 import pandas as pd
 
 class MicroNegotiationAgent(BaseAgent):
     def __init__(self, policy_context: dict = None):
         super().__init__(name="NegotiationAgent")
         self.policy_context = policy_context or {}
+        # Guardrail arrays for the cycle (set by the orchestrator; compiled from policy_context otherwise)
+        self.compiled_policy = None
         self.constrained_plan = None
+        self.state = None
+        self.ledger = CutLedger()
+        self._row_lookup = None
+        self._lookup_plan = None
         
-        self.register_tool(self.check_capacity)
+        self.register_tool(self.check_capacity, concurrent=True)
+        self.register_tool(self.cut_allocations)
         self.register_tool(self.cut_allocation)
         
         self.set_system_instruction(
@@ -16,118 +30,203 @@ class MicroNegotiationAgent(BaseAgent):
             Your goal is to ensure the demand plan respects capacity constraints.
             1. Check capacity for each week.
             2. If capacity is exceeded, identify which SKUs to cut based on priority.
-            3. Use 'cut_allocation' to reduce the plan.
+            3. Use 'cut_allocations' to reduce the plan, passing every cut in a single call.
             Strategic SKUs (in policy) should be protected if possible.
             """
         )
 
     def check_capacity(self, week_date: str) -> str:
-        """Checks if total demand exceeds capacity for a given week."""
+        """Checks one week for capacity violations on every resource."""
         if self.constrained_plan is None: return "Error: Plan not loaded."
         
-        # Parse date
         try:
             date = pd.to_datetime(week_date)
-        except:
+        except (ValueError, TypeError):
             return "Invalid date format."
-            
-        # Filter for week
-        # Exact match might be tricky with strings, so let's assume the agent iterates through unique dates provided in prompt
-        # Or simpler: we check ALL weeks and return the ones with issues.
-        pass 
+        
+        week = self.constrained_plan[pd.to_datetime(self.constrained_plan['Date']) == date]
+        if week.empty:
+            return f"No plan rows for week {date.date()}."
+        model = CapacityModel.from_policy(self.policy_context)
+        issues = self._format_violations(model, model.violations(week))
+        if not issues:
+            return f"Week {date.date()}: no capacity violations."
+        return "\n".join(issues)
 
     def check_all_weeks(self) -> str:
-        """Checks all weeks for capacity violations."""
-        capacity_limit = self.policy_context.get('constraints', {}).get('capacity_limit_total', 10000)
-        
-        issues = []
-        for date, group in self.constrained_plan.groupby('Date'):
-            total_demand = group['Constrained_Plan'].sum()
-            if total_demand > capacity_limit:
-                shortage = total_demand - capacity_limit
-                issues.append(f"Week {date.date()}: Demand {total_demand:.0f} > Cap {capacity_limit}. Shortage: {shortage:.0f}")
-        
+        """Checks all weeks for capacity violations on every resource."""
+        model = CapacityModel.from_policy(self.policy_context)
+        issues = self._format_violations(model, model.violations(self.constrained_plan))
         if not issues:
             return "No capacity violations found."
         return "\n".join(issues)
 
+    @staticmethod
+    def _format_violations(model: CapacityModel, violations: pd.DataFrame) -> List[str]:
+        issues = []
+        for v in violations.itertuples(index=False):
+            if model.is_single_total:
+                issues.append(f"Week {v.Date.date()}: Demand {v.Load:.0f} > Cap {v.Limit:g}. Shortage: {v.Shortage:.0f}")
+            else:
+                issues.append(f"Week {v.Date.date()} [{v.Type} {v.Resource}]: Load {v.Load:.0f} > Cap {v.Limit:g}. Shortage: {v.Shortage:.0f}")
+        return issues
+
+    def _row_positions(self, skus, dates) -> np.ndarray:
+        """Plan row positions for (SKU, Date) pairs, -1 where missing. The lookup is built once per plan."""
+        if self._lookup_plan is not self.constrained_plan:
+            self._row_lookup = pd.MultiIndex.from_arrays([
+                self.constrained_plan['SKU'], pd.to_datetime(self.constrained_plan['Date'])
+            ])
+            self._lookup_plan = self.constrained_plan
+        return self._row_lookup.get_indexer(pd.MultiIndex.from_arrays([skus, pd.to_datetime(dates)]))
+
+    def cut_allocations(self, cuts: List[Dict[str, Any]]) -> str:
+        """
+        Cuts the allocation for many SKU-weeks in one call.
+        Args:
+            cuts: List of cuts, each a dictionary with 'sku', 'week_date', 'amount'
+                  and optionally 'reason'.
+                  Example: [{'sku': 'SKU_002', 'week_date': '2026-01-05', 'amount': 150, 'reason': 'capacity'}]
+        """
+        if self.constrained_plan is None: return "Error: Plan not loaded."
+        
+        try:
+            requested = pd.DataFrame(cuts, columns=['sku', 'week_date', 'amount', 'reason'])
+            if requested.empty:
+                return "No cuts provided."
+            requested['amount'] = pd.to_numeric(requested['amount'], errors='coerce').fillna(0.0)
+            requested['reason'] = requested['reason'].fillna("")
+            positions = self._row_positions(requested['sku'], requested['week_date'])
+        except Exception as e:
+            return f"Error cutting allocations: {e}"
+        
+        missing = requested[positions < 0]
+        found = requested[positions >= 0].assign(row=positions[positions >= 0])
+        
+        # Several cuts on the same SKU-week apply one after the other
+        per_row = found.groupby('row', sort=False).agg(
+            amount=('amount', 'sum'), reason=('reason', lambda r: "; ".join(x for x in r if x))
+        )
+        rows = per_row.index.to_numpy()
+        col = self.constrained_plan.columns.get_loc('Constrained_Plan')
+        current = self.constrained_plan['Constrained_Plan'].to_numpy(dtype=float)[rows]
+        new_values = np.maximum(0, current - per_row['amount'].to_numpy())
+        self.constrained_plan.iloc[rows, col] = new_values
+        
+        records = np.empty(len(rows), dtype=CUT_LOG_DTYPE)
+        records['row'] = rows
+        records['date'] = pd.to_datetime(self.constrained_plan['Date'].to_numpy()[rows])
+        records['sku'] = self.constrained_plan['SKU'].to_numpy()[rows]
+        records['cut'] = current - new_values
+        records['resource'] = ""
+        records['reason'] = per_row['reason'].to_numpy()
+        records['actor'] = "Agent"
+        self.ledger.append(records[records['cut'] > 0])
+        
+        summary = f"Applied {len(found)} cuts to {len(rows)} SKU-weeks, totalling {records['cut'].sum():.0f} units."
+        if len(missing):
+            summary += f" Not found: {missing[['sku', 'week_date']].astype(str).values.tolist()}."
+        return summary
+
     def cut_allocation(self, sku: str, week_date: str, amount: float) -> str:
         """Cuts the allocation for a SKU in a specific week."""
-        # Implementation similar to previous logic but triggered by LLM
-        # For PoC simplicity, let's assume the LLM calls this with specific instructions
+        if self.constrained_plan is None: return "Error: Plan not loaded."
         
         try:
-            date = pd.to_datetime(week_date)
-            mask = (self.constrained_plan['Date'] == date) & (self.constrained_plan['SKU'] == sku)
-            
-            if not mask.any():
+            row = self._row_positions([sku], [week_date])[0]
+            if row < 0:
                 return f"SKU {sku} not found in week {week_date}."
-                
-            current_plan = self.constrained_plan.loc[mask, 'Constrained_Plan'].values[0]
-            new_plan = max(0, current_plan - amount)
-            
-            self.constrained_plan.loc[mask, 'Constrained_Plan'] = new_plan
-            self.constrained_plan.loc[mask, 'Negotiation_Log'] += f" Cut {amount} by Agent."
-            
-            return f"Cut {sku} by {amount} in week {week_date}. New plan: {new_plan}."
-            
         except Exception as e:
             return f"Error cutting allocation: {e}"
+        
+        self.cut_allocations([{'sku': sku, 'week_date': week_date, 'amount': amount}])
+        new_plan = self.constrained_plan['Constrained_Plan'].iat[row]
+        return f"Cut {sku} by {amount} in week {week_date}. New plan: {new_plan}."
 
     def run(self, scenarios: pd.DataFrame, prompt: str = None) -> pd.DataFrame:
         self.constrained_plan = scenarios.copy()
-        self.constrained_plan['Constrained_Plan'] = self.constrained_plan['Plan']
-        self.constrained_plan['Negotiation_Log'] = ""
+        self.constrained_plan['Constrained_Plan'] = self.constrained_plan['Plan'].astype(float)
+        self.ledger = CutLedger()
         
         # Register the bulk check tool instead of single week for efficiency
         self.tools = {} # Reset tools to avoid confusion
-        self.register_tool(self.check_all_weeks)
+        self.register_tool(self.check_all_weeks, concurrent=True)
+        self.register_tool(self.cut_allocations)
         self.register_tool(self.cut_allocation)
         
         prompt = f"""
         Please check all weeks for capacity violations using 'check_all_weeks'.
         If there are violations, decide which SKUs to cut to resolve the shortage.
         Strategic SKUs: {self.policy_context.get('strategic_skus', [])}
-        Use 'cut_allocation' to apply cuts.
+        Use 'cut_allocations' to apply all cuts in a single call.
         """
         
         super().run(prompt)
         
+        model = CapacityModel.from_policy(self.policy_context)
+        strategic_skus = self.policy_context.get('strategic_skus', [])
+        # Cut order for every row in one lookup
+        row_priority = self._compiled(self.policy_context).priority_weights(self.constrained_plan['SKU'])
+        
         # Fallback for PoC
-        if (self.constrained_plan['Negotiation_Log'] == "").all():
+        if len(self.ledger) == 0:
              print(f"[{self.name}] FALLBACK: Manually checking and cutting capacity violations.")
-             capacity_limit = self.policy_context.get('constraints', {}).get('capacity_limit_total', 10000)
-             strategic_skus = self.policy_context.get('strategic_skus', [])
-             
-             # Check each week and cut if needed
-             for date, group in self.constrained_plan.groupby('Date'):
-                 total_demand = group['Constrained_Plan'].sum()
-                 if total_demand > capacity_limit:
-                     shortage = total_demand - capacity_limit
-                     print(f"[{self.name}] Week {date.date()}: Demand {total_demand:.0f} > Cap {capacity_limit}. Cutting {shortage:.0f} units.")
-                     
-                     # Sort SKUs by priority (non-strategic first, then by volume)
-                     week_data = group.copy()
-                     week_data['is_strategic'] = week_data['SKU'].isin(strategic_skus)
-                     week_data = week_data.sort_values(['is_strategic', 'Constrained_Plan'], ascending=[True, False])
-                     
-                     # Cut from lowest priority SKUs
-                     remaining_to_cut = shortage
-                     for idx, row in week_data.iterrows():
-                         if remaining_to_cut <= 0:
-                             break
-                         
-                         sku = row['SKU']
-                         current_plan = row['Constrained_Plan']
-                         cut_amount = min(current_plan, remaining_to_cut)
-                         
-                         if cut_amount > 0:
-                             # Apply the cut
-                             self.constrained_plan.at[idx, 'Constrained_Plan'] -= cut_amount
-                             self.constrained_plan.at[idx, 'Negotiation_Log'] = f"Cut {cut_amount:.0f} due to capacity limit"
-                             remaining_to_cut -= cut_amount
+             cuts, cut_log, violations = model.negotiate(self.constrained_plan, strategic_skus, row_priority=row_priority)
+             for v in violations:
+                 scope = "" if model.is_single_total else f" [{v['resource']}]"
+                 print(f"[{self.name}] Week {pd.Timestamp(v['date']).date()}{scope}: Demand {v['demand']:.0f} > Cap {v['limit']:g}. Cutting {v['shortage']:.0f} units.")
              
+             # Apply all cuts in one update
+             if len(cut_log):
+                 self.constrained_plan['Constrained_Plan'] = self.constrained_plan['Constrained_Plan'].to_numpy(dtype=float) - cuts
+                 self.ledger.append(cut_log)
+        
+        # Text log for downstream readers, built once from the ledger
+        negotiation_log = np.full(len(self.constrained_plan), "", dtype=object)
+        if len(self.ledger):
+            messages = self.ledger.messages()
+            negotiation_log[messages.index.to_numpy()] = messages.to_numpy()
+        self.constrained_plan['Negotiation_Log'] = negotiation_log
+        
+        # Keep slack and the cut ledger around so later plan edits only re-solve what they touch
+        self.state = NegotiationState(self.constrained_plan, model, strategic_skus, self.ledger.to_array(), row_priority)
         return self.constrained_plan
 
+    def load_state(self, plan: pd.DataFrame, ledger_path: str = "data/negotiation_ledger.csv") -> NegotiationState:
+        """
+        Adopts an already constrained plan (e.g. loaded from disk) for incremental edits,
+        with the cut ledger saved next to it so manual cuts stay manual.
+        """
+        policy = self.policy_context or self.config
+        self.constrained_plan = plan
+        row_priority = self._compiled(policy).priority_weights(plan['SKU'])
+        cut_log = None
+        if ledger_path and os.path.exists(ledger_path):
+            try:
+                cut_log = CutLedger.from_frame(pd.read_csv(ledger_path)).to_array()
+            except Exception as e:
+                print(f"[{self.name}] Could not read the cut ledger {ledger_path}: {e}")
+        self.state = NegotiationState(plan, CapacityModel.from_policy(policy), policy.get('strategic_skus', []),
+                                      cut_log=cut_log, row_priority=row_priority)
+        return self.state
+
+    def _compiled(self, policy: dict) -> CompiledPolicy:
+        # The cycle's arrays only while config.yaml is unchanged since they were compiled
+        # (load_state/renegotiate can run long after the cycle)
+        if self.compiled_policy is not None and self.compiled_policy.is_current(self.runtime.policy):
+            return self.compiled_policy
+        return CompiledPolicy.compile(policy, segment_rules=self.config.get('segments'))
+
+    def renegotiate(self, changes) -> dict:
+        """
+        Applies plan edits (rows of SKU, Date, Plan) and re-solves only the affected weeks.
+        The constrained plan is patched in place.
+        """
+        if self.state is None:
+            if self.constrained_plan is None:
+                raise ValueError("No negotiated plan to edit. Run negotiation first.")
+            self.load_state(self.constrained_plan)
+        return self.state.apply_changes(changes)
+
 if __name__ == "__main__":
     pass
@@ -1,16 +1,18 @@
 from agents.base_agent import BaseAgent
+from utils.mcp_pool import get_mcp_pool
+from typing import List
 import asyncio
-import sys
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+import json
 
 class PolicyAndGuardrailAgent(BaseAgent):
     def __init__(self):
         super().__init__(name="PolicyAgent")
         
         # We no longer load config directly.
-        # We register a tool that calls the MCP server.
-        self.register_tool(self.get_policy_value)
+        # We register a tool that calls the MCP server, over sessions kept open for the process.
+        self.mcp_pool = get_mcp_pool(self.config)
+        self.register_tool(self.get_policy_value, concurrent=True)
+        self.register_tool(self.get_policy_values, concurrent=True)
         
         self.set_system_instruction(
             """
@@ -24,6 +26,7 @@ class PolicyAndGuardrailAgent(BaseAgent):
             - For questions about constraints (limits, uplifts, capacity): call get_policy_value("constraints")
             - For questions about priorities: call get_policy_value("priorities")
             - For questions about strategic SKUs: call get_policy_value("strategic_skus")
+            - For questions spanning several sections: call get_policy_values(["constraints", "priorities"]) once
             
             **Examples:**
             - "What is the max promo uplift?" → call get_policy_value("constraints") → look for max_promo_uplift
@@ -37,27 +40,6 @@ class PolicyAndGuardrailAgent(BaseAgent):
             """
         )
 
-    async def _call_mcp_tool(self, key: str) -> str:
-        # Define server parameters
-        server_params = StdioServerParameters(
-            command=sys.executable, # Use current python
-            args=["servers/config_server.py"], # Path to server script
-            env=None
-        )
-        
-        async with stdio_client(server_params) as (read, write):
-            async with ClientSession(read, write) as session:
-                # Initialize
-                await session.initialize()
-                
-                # Call the tool
-                result = await session.call_tool("get_policy_config", arguments={"key": key})
-                
-                # Result is a list of content, we want the text
-                if result.content:
-                    return result.content[0].text
-                return "No content returned."
-
     def get_policy_value(self, key: str) -> str:
         """
         Retrieves a specific value from the policy configuration via MCP.
@@ -65,21 +47,20 @@ class PolicyAndGuardrailAgent(BaseAgent):
             key: The configuration key to look up.
         """
         try:
-            # Check if we are already in an event loop
-            try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                loop = None
+            return self.mcp_pool.call_tool("get_policy_config", {"key": key})
+        except Exception as e:
+            return f"Error calling MCP server: {e}"
 
-            if loop and loop.is_running():
-                # We are in a loop (e.g. FastAPI). Run async code in a separate thread.
-                from concurrent.futures import ThreadPoolExecutor
-                with ThreadPoolExecutor() as pool:
-                    future = pool.submit(asyncio.run, self._call_mcp_tool(key))
-                    return future.result()
-            else:
-                # No loop running, use asyncio.run
-                return asyncio.run(self._call_mcp_tool(key))
+    def get_policy_values(self, keys: List[str]) -> str:
+        """
+        Retrieves several values from the policy configuration in one MCP call.
+        Args:
+            keys: The configuration keys to look up.
+        Returns:
+            A JSON object mapping each key to its value (null if not found).
+        """
+        try:
+            return self.mcp_pool.call_tool("get_policy_values", {"keys": list(keys)})
         except Exception as e:
             return f"Error calling MCP server: {e}"
 
@@ -88,28 +69,33 @@ class PolicyAndGuardrailAgent(BaseAgent):
         Answers a query about policy and returns the context.
         """
         response_text = super().run(prompt)
-        
-        # For the context, we'll just fetch the main sections to pass downstream
-        # This is a bit inefficient (spinning up server again), but fine for PoC
-        priorities = self.get_policy_value("priorities")
-        constraints = self.get_policy_value("constraints")
-        strategic_skus = self.get_policy_value("strategic_skus")
-        
-        # Parse strings back to dicts/lists if possible, or just pass strings
-        # For PoC, let's try to eval safely if they look like python structures
-        context = {}
-        try:
-            context['priorities'] = eval(priorities) if priorities.startswith("{") else priorities
-            context['constraints'] = eval(constraints) if constraints.startswith("{") else constraints
-            context['strategic_skus'] = eval(strategic_skus) if strategic_skus.startswith("[") else strategic_skus
-        except:
-            context = {'raw_policy': response_text}
+        return {
+            "explanation": response_text,
+            "policy_context": self._policy_context(response_text)
+        }
 
+    async def arun(self, prompt: str = "What are the current strategic priorities?") -> dict:
+        """Async run(); the MCP lookup for the context runs in a worker thread."""
+        response_text = await super().arun(prompt)
         return {
             "explanation": response_text,
-            "policy_context": context
+            "policy_context": await asyncio.to_thread(self._policy_context, response_text)
         }
 
+    def _policy_context(self, response_text: str) -> dict:
+        # For the context, we fetch the main sections to pass downstream in one round-trip
+        context = {}
+        try:
+            values = json.loads(self.get_policy_values(["priorities", "constraints", "strategic_skus", "capacity"]))
+            for key in ("priorities", "constraints", "strategic_skus"):
+                context[key] = values[key] if values[key] is not None else "Not found"
+            # Optional multi-resource capacity model (plants, lines, lanes)
+            if isinstance(values.get("capacity"), dict):
+                context['capacity'] = values["capacity"]
+        except Exception:
+            context = {'raw_policy': response_text}
+        return context
+
 if __name__ == "__main__":
     agent = PolicyAndGuardrailAgent()
     print(agent.run("What is the max allowed promo uplift?"))
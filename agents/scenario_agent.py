@@ -1,10 +1,14 @@
 from agents.base_agent import BaseAgent
+from utils.policy_compiler import CompiledPolicy
+import numpy as np
 import pandas as pd
 
 class EventAndScenarioAgent(BaseAgent):
     def __init__(self, policy_context: dict = None):
         super().__init__(name="ScenarioAgent")
         self.policy_context = policy_context or {}
+        # Guardrail arrays for the cycle (set by the orchestrator; compiled from policy_context otherwise)
+        self.compiled_policy = None
         self.scenarios = None
         
         self.register_tool(self.apply_event_uplift)
@@ -23,38 +27,48 @@ class EventAndScenarioAgent(BaseAgent):
         """
         if self.scenarios is None: return "Error: Scenarios not initialized."
         
-        # Find the row
-        # Assuming scenarios is sorted by Date
-        # We need to find the date corresponding to week_offset (0-indexed from start of forecast)
-        
-        sku_mask = self.scenarios['SKU'] == sku
-        sku_indices = self.scenarios[sku_mask].index
-        
-        if week_offset >= len(sku_indices):
+        applied, capped, found = self.apply_event_uplifts([sku], [week_offset], [uplift_pct])
+        if not found[0]:
             return f"Week offset {week_offset} out of bounds for {sku}."
-            
-        idx = sku_indices[week_offset]
+        msg = f"Uplift capped at {applied[0]:g} due to policy." if capped[0] else "Uplift applied."
+        return f"Applied {applied[0]:g} uplift to {sku} at week {week_offset}. {msg}"
+
+    def apply_event_uplifts(self, skus, week_offsets, uplifts):
+        """
+        Applies many events at once. Each uplift is capped by the SKU's policy cap
+        (global max_promo_uplift, tightened by its segment's allowed_uplift) and the
+        Plan/Upside/Downside columns are updated in one pass.
+        Returns (applied uplift, capped flag, found flag) arrays aligned with the events.
+        """
+        skus = np.asarray(skus, dtype=object)
+        week_offsets = np.asarray(week_offsets, dtype=np.int64)
+        uplifts = np.asarray(uplifts, dtype=float)
         
-        # Check guardrails
-        constraints = self.policy_context.get('constraints', {})
-        if not isinstance(constraints, dict):
-            constraints = {}
-            
-        max_uplift = constraints.get('max_promo_uplift', 0.5)
-        if uplift_pct > max_uplift:
-            uplift_pct = max_uplift
-            msg = f"Uplift capped at {max_uplift} due to policy."
-        else:
-            msg = "Uplift applied."
-            
-        base_plan = self.scenarios.at[idx, 'Plan']
-        uplift_val = base_plan * uplift_pct
+        # Row of each event: the week_offset-th row of its SKU (scenarios are sorted by Date)
+        week_rank = self.scenarios.groupby('SKU', sort=False).cumcount().to_numpy()
+        lookup = pd.MultiIndex.from_arrays([self.scenarios['SKU'].to_numpy(), week_rank])
+        positions = lookup.get_indexer(pd.MultiIndex.from_arrays([skus, week_offsets]))
+        found = positions >= 0
         
-        self.scenarios.at[idx, 'Plan'] += uplift_val
-        self.scenarios.at[idx, 'Upside'] += uplift_val * 1.2
-        self.scenarios.at[idx, 'Downside'] += uplift_val * 0.8
+        caps = self._policy().uplift_caps(skus)
+        applied = np.minimum(uplifts, caps)
+        capped = uplifts > caps
         
-        return f"Applied {uplift_pct} uplift to {sku} at week {week_offset}. {msg}"
+        # Events on the same row compound, exactly as if applied one after another
+        factor = np.ones(len(self.scenarios))
+        np.multiply.at(factor, positions[found], 1 + applied[found])
+        plan = self.scenarios['Plan'].to_numpy(dtype=float)
+        uplift_val = plan * (factor - 1)
+        self.scenarios['Plan'] = plan + uplift_val
+        self.scenarios['Upside'] = self.scenarios['Upside'].to_numpy(dtype=float) + uplift_val * 1.2
+        self.scenarios['Downside'] = self.scenarios['Downside'].to_numpy(dtype=float) + uplift_val * 0.8
+        return applied, capped, found
+
+    def _policy(self) -> CompiledPolicy:
+        # The cycle's arrays only while config.yaml is unchanged since they were compiled
+        if self.compiled_policy is not None and self.compiled_policy.is_current(self.runtime.policy):
+            return self.compiled_policy
+        return CompiledPolicy.compile(self.policy_context, segment_rules=self.config.get('segments'))
 
     def run(self, baseline_forecasts: pd.DataFrame, prompt: str = None) -> pd.DataFrame:
         self.scenarios = baseline_forecasts.copy()
@@ -78,32 +92,19 @@ class EventAndScenarioAgent(BaseAgent):
              events = self.policy_context.get('events', [])
              if not events:
                  # Default hardcoded if no context events
-                 self.apply_event_uplift('SKU_001', 4, 0.3)
-                 self.apply_event_uplift('SKU_005', 1, 0.5)
+                 self.apply_event_uplifts(['SKU_001', 'SKU_005'], [4, 1], [0.3, 0.5])
              else:
-                 # Apply events from context
-                 # We need to calculate week_offset. 
-                 # Assuming scenarios is sorted by Date and we can find the index.
-                 # But apply_event_uplift takes week_offset.
-                 # Let's try to find the date match.
-                 for event in events:
-                     sku = event['SKU']
-                     uplift = event['Uplift']
-                     date_str = event['Date']
-                     try:
-                         event_date = pd.to_datetime(date_str)
-                         # Find offset for this SKU
-                         sku_data = self.scenarios[self.scenarios['SKU'] == sku]
-                         if not sku_data.empty:
-                             # Assuming sorted
-                             start_date = sku_data['Date'].min()
-                             # Calculate offset in weeks
-                             days_diff = (event_date - start_date).days
-                             offset = int(days_diff / 7)
-                             if offset >= 0:
-                                 self.apply_event_uplift(sku, offset, uplift)
-                     except Exception as e:
-                         print(f"Error applying fallback event: {e}")
+                 # Apply events from context, all in one pass.
+                 # The week offset is counted from the SKU's first forecast week.
+                 try:
+                     events = pd.DataFrame(events)
+                     event_dates = pd.to_datetime(events['Date'], errors='coerce')
+                     start_dates = events['SKU'].map(self.scenarios.groupby('SKU')['Date'].min())
+                     offsets = np.trunc((event_dates - start_dates).dt.days.to_numpy(dtype=float) / 7)
+                     valid = ~np.isnan(offsets) & (offsets >= 0)
+                     self.apply_event_uplifts(events['SKU'][valid], offsets[valid].astype(np.int64), events['Uplift'][valid])
+                 except Exception as e:
+                     print(f"Error applying fallback events: {e}")
              
         return self.scenarios
 
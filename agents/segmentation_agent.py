@@ -1,5 +1,6 @@
 from agents.base_agent import BaseAgent
 import pandas as pd
+from utils.payload import PayloadEncoder
 
 class SegmentationAndPlaybookAgent(BaseAgent):
     def __init__(self, policy_context: dict = None):
@@ -8,8 +9,11 @@ class SegmentationAndPlaybookAgent(BaseAgent):
         self.sku_metrics = None
         self.playbooks = {}
         
-        self.register_tool(self.calculate_metrics)
+        self.register_tool(self.calculate_metrics, concurrent=True)
+        # Sequential: it writes self.playbooks, whose order has to follow the calls
         self.register_tool(self.assign_segment)
+        # One row per SKU is needed to assign segments; SKUs sampled out get the fallback rule
+        self.payload_encoder = PayloadEncoder.from_config(self.config, policy="sample")
         
         self.set_system_instruction(
             """
@@ -31,7 +35,7 @@ class SegmentationAndPlaybookAgent(BaseAgent):
         if self.sku_metrics is None:
             return "Error: Data not provided to agent yet."
             
-        return self.sku_metrics.to_string()
+        return self.payload_encoder.encode(self.sku_metrics, index=True)
 
     def assign_segment(self, sku: str, segment: str) -> str:
         """Assigns a segment to a SKU and creates a playbook."""
@@ -58,8 +62,8 @@ class SegmentationAndPlaybookAgent(BaseAgent):
         self.sku_metrics.columns = ['mean_sales', 'std_sales', 'zero_proportion']
         self.sku_metrics['cv'] = self.sku_metrics['std_sales'] / self.sku_metrics['mean_sales']
         
-        # Convert metrics to a readable string for the LLM
-        metrics_str = self.sku_metrics.to_string()
+        # Compact CSV of the metrics for the LLM
+        metrics_str = self.payload_encoder.encode(self.sku_metrics, index=True)
         
         prompt = f"""
         Here are the metrics for the SKUs:
@@ -74,11 +78,12 @@ class SegmentationAndPlaybookAgent(BaseAgent):
         
         super().run(prompt)
         
-        # Fallback for PoC
-        if not self.playbooks:
+        # Fallback for PoC (also covers SKUs the model didn't assign)
+        missing = self.sku_metrics.loc[~self.sku_metrics.index.isin(list(self.playbooks))]
+        if not missing.empty:
             print(f"[{self.name}] FALLBACK: Manually assigning segments.")
             # Simple heuristic
-            for sku, row in self.sku_metrics.iterrows():
+            for sku, row in missing.iterrows():
                 if row['zero_proportion'] > 0.5: seg = 'intermittent'
                 elif row['cv'] < 0.3: seg = 'stable_seasonal'
                 else: seg = 'promo_sensitive'
@@ -1,11 +1,12 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from pydantic import BaseModel
-import pandas as pd
+from typing import List, Optional
+import time
 import os
-from orchestrator import OrchestratorAgent
-from agents.chart_agent import ChartAgent
+from utils.metrics import metrics
+from utils.history import session
 
 app = FastAPI()
 
@@ -13,17 +14,43 @@ app = FastAPI()
 app.mount("/ui", StaticFiles(directory="ui"), name="ui")
 
 # Global state
-orchestrator = OrchestratorAgent()
-chart_agent = ChartAgent()
+# Agents (and pandas, google-genai, statsmodels, mcp behind them) load on first use,
+# so importing this module and serving the UI stays fast
+_orchestrator = None
+_chart_agent = None
 final_plan = None
 sales_data = None
 
+def get_orchestrator():
+    global _orchestrator
+    if _orchestrator is None:
+        from orchestrator import OrchestratorAgent
+        _orchestrator = OrchestratorAgent()
+    return _orchestrator
+
+def get_chart_agent():
+    global _chart_agent
+    if _chart_agent is None:
+        from agents.chart_agent import ChartAgent
+        _chart_agent = ChartAgent()
+    return _chart_agent
+
 class ChatRequest(BaseModel):
     message: str
+    # Each chat session keeps its own conversation history on the shared agents
+    session_id: Optional[str] = None
 
 class ChartRequest(BaseModel):
     query: str
 
+class PlanEdit(BaseModel):
+    sku: str
+    date: str
+    plan: float
+
+class PlanEditRequest(BaseModel):
+    edits: List[PlanEdit]
+
 @app.get("/")
 async def read_root():
     return FileResponse('ui/index.html')
@@ -31,6 +58,7 @@ async def read_root():
 @app.get("/api/init")
 async def init_system():
     global final_plan, sales_data
+    import pandas as pd
     try:
         # Load data
         sales_data = pd.read_csv("data/sales_data.csv")
@@ -43,7 +71,7 @@ async def init_system():
             # In a real app, we might trigger a run here, but it takes time.
             # For now, let's assume the user runs main.py first or we trigger it.
             # Let's trigger a quick run (mock mode likely if no key)
-            final_plan, _ = orchestrator.run()
+            final_plan, _ = await get_orchestrator().arun()
             return {"status": "Generated new plan"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -51,8 +79,14 @@ async def init_system():
 @app.get("/api/dashboard")
 async def get_dashboard_data():
     global final_plan, sales_data
+    import pandas as pd
     if final_plan is None or sales_data is None:
         await init_system()
+    
+    # Precomputed at the end of the last planning cycle, while the data is unchanged
+    dashboard = dashboard_from_cubes()
+    if dashboard is not None:
+        return dashboard
         
     # 1. Historical Sales (Last 12 weeks)
     last_date = pd.to_datetime(sales_data['Date']).max()
@@ -78,6 +112,31 @@ async def get_dashboard_data():
         "top_products": top_products.to_dict(orient='records')
     }
 
+def cube_store():
+    from utils.cubes import get_cube_store
+    from utils.runtime import get_runtime
+    return get_cube_store(get_runtime().config)
+
+def dashboard_from_cubes():
+    """The dashboard payload as lookups on the materialised cubes, or None if they are stale."""
+    cubes = cube_store()
+    weekly_sales = cubes.load("sales_by_week")
+    weekly_plan = cubes.load("plan_by_week")
+    sku_plan = cubes.load("plan_by_sku")
+    if weekly_sales is None or weekly_plan is None or sku_plan is None:
+        return None
+    import pandas as pd
+    
+    start_date = weekly_sales['Date'].max() - pd.Timedelta(weeks=12)
+    hist_sales = weekly_sales.loc[weekly_sales['Date'] > start_date, ['Date', 'Sales']]
+    forecast_df = weekly_plan[['Date', 'Constrained_Plan']]
+    top_products = sku_plan.sort_values('Constrained_Plan', ascending=False).head(5)[['SKU', 'Constrained_Plan']]
+    return {
+        "historical": hist_sales.assign(Date=hist_sales['Date'].dt.strftime('%Y-%m-%d')).to_dict(orient='records'),
+        "forecast": forecast_df.assign(Date=forecast_df['Date'].dt.strftime('%Y-%m-%d')).to_dict(orient='records'),
+        "top_products": top_products.to_dict(orient='records')
+    }
+
 @app.get("/api/table")
 async def get_table_data():
     global final_plan
@@ -97,7 +156,8 @@ async def get_table_data():
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
     # Use the Orchestrator to route the request to the right agent
-    response = orchestrator.route_request(request.message)
+    with session(request.session_id):
+        response = await get_orchestrator().aroute_request(request.message)
     
     # If response is a dict (from our previous refactor), extract text
     if isinstance(response, dict):
@@ -107,8 +167,17 @@ async def chat(request: ChatRequest):
 @app.post("/api/chart")
 async def generate_chart(request: ChartRequest):
     global final_plan, sales_data
+    import pandas as pd
     if final_plan is None or sales_data is None:
         await init_system()
+    
+    # Monthly/quarterly charts come from the materialised cubes
+    chart_agent = get_chart_agent()
+    cube = chart_agent.cube_context(request.query)
+    if cube is not None:
+        config = await chart_agent.arun(request.query, cube=cube)
+        print(f"[API] Chart Config Generated: {config}")
+        return {"config": config}
         
     # Combine data for the agent
     # We want a single view of history + forecast
@@ -127,7 +196,7 @@ async def generate_chart(request: ChartRequest):
     combined_df = combined_df.sort_values('Date')
     
     # Use ChartAgent with combined data
-    config = chart_agent.run(request.query, combined_df)
+    config = await chart_agent.arun(request.query, combined_df)
     print(f"[API] Chart Config Generated: {config}")
     return {"config": config}
 
@@ -136,7 +205,7 @@ async def run_planning():
     global final_plan
     try:
         # Run the orchestrator
-        final_plan_df, result = orchestrator.run()
+        final_plan_df, result = await get_orchestrator().arun()
         
         # Update global state
         final_plan = final_plan_df
@@ -151,6 +220,28 @@ async def run_planning():
         print(f"[API] Error running planning: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/plan/edit")
+async def edit_plan(request: PlanEditRequest):
+    """Applies planner edits and re-negotiates only the affected weeks, patching the plan in place."""
+    global final_plan
+    if final_plan is None:
+        await init_system()
+    
+    negotiation_agent = get_orchestrator().negotiation_agent
+    state = negotiation_agent.state
+    if state is None or state.plan is not final_plan:
+        negotiation_agent.load_state(final_plan)
+    
+    start = time.perf_counter()
+    try:
+        summary = negotiation_agent.renegotiate([{'SKU': e.sku, 'Date': e.date, 'Plan': e.plan} for e in request.edits])
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    summary['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    # Cubes describe the plan on disk; the edited one is only in memory until the next cycle
+    cube_store().mark_stale()
+    return summary
+
 from utils.memory_store import MemoryStore
 
 # ... (existing imports)
@@ -160,6 +251,11 @@ memory_store = MemoryStore()
 
 # ... (existing code)
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Agent, tool and orchestrator metrics in Prometheus text format."""
+    return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/history")
 async def get_history():
     return memory_store.get_all_interactions()
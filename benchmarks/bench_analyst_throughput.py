@@ -0,0 +1,162 @@
+"""
+Throughput benchmark for concurrent analyst chat sessions.
+
+Simulates many chat sessions at once, each going through DataAnalystAgent.arun (the
+/api/chat path) under its own session id. The Gemini backend is replaced by a scripted
+one: the first turn asks for query_data with the session's query, the second answers
+with the tool result, each after a simulated model latency. Every query carries a
+session-specific constant. The run checks that:
+
+- each answer matches the same query run on its own (no session got another's output);
+- each session's history holds only its own turns.
+
+Runs once with one session at a time and once with all sessions together, on the
+in-process fast path and/or the sandbox workers. The query and response caches are
+off, so every query executes.
+
+Usage (from the project root):
+    python -m benchmarks.bench_analyst_throughput --sessions 16 --queries 5 --workers 4 --path both
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from google.genai import types
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.safe_eval as safe_eval
+import utils.sandbox_pool as sandbox_pool
+from agents.analyst_agent import DataAnalystAgent
+from utils.history import session
+from utils.query_cache import get_query_cache
+from utils.scheduler import RequestScheduler
+
+QUERIES = [
+    "self.final_plan['Constrained_Plan'].sum() + {tag}",
+    "self.sales_data.groupby('SKU')['Sales'].sum().sort_values(ascending=False).head(3) + {tag}",
+    "self.final_plan.assign(Cut=self.final_plan['Plan']-self.final_plan['Constrained_Plan']).groupby('SKU')['Cut'].sum().max() + {tag}",
+    "self.sales_data[self.sales_data['Promo_Flag'] == 1]['Sales'].mean() + {tag}",
+]
+PROMPT_PREFIX = "Run this query: "
+ANSWER_PREFIX = "The result is:\n"
+
+
+def response(*parts) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[
+        types.Candidate(content=types.Content(role="model", parts=list(parts)))
+    ])
+
+
+class ScriptedBackend:
+    """Stands in for Gemini: asks for the prompt's query, then repeats the tool result."""
+
+    mode = "replay"
+    ready = True
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+
+    def _respond(self, contents):
+        last = contents[-1].parts[0]
+        if last.function_response is not None:
+            return response(types.Part(text=ANSWER_PREFIX + last.function_response.response['result']))
+        code = last.text[len(PROMPT_PREFIX):]
+        return response(types.Part(function_call=types.FunctionCall(name="query_data", args={"query_code": code})))
+
+    def generate(self, key, model, contents, config):
+        time.sleep(self.latency)
+        return self._respond(contents)
+
+    async def agenerate(self, key, model, contents, config):
+        await asyncio.sleep(self.latency)
+        return self._respond(contents)
+
+
+async def run_sessions(agent, sessions: int, queries: int, concurrent: bool, run_id: str):
+    latencies = []
+
+    async def chat_session(s):
+        results = []
+        with session(f"{run_id}-{s}"):
+            for q in range(queries):
+                code = QUERIES[q % len(QUERIES)].format(tag=s * 1000 + q)
+                start = time.perf_counter()
+                answer = await agent.arun(PROMPT_PREFIX + code)
+                latencies.append(time.perf_counter() - start)
+                results.append((code, answer))
+        return results
+
+    start = time.perf_counter()
+    # Keep the agent's per-call logging out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        if concurrent:
+            outputs = await asyncio.gather(*(chat_session(s) for s in range(sessions)))
+        else:
+            outputs = [await chat_session(s) for s in range(sessions)]
+    return time.perf_counter() - start, np.array(latencies) * 1000, outputs
+
+
+def histories_isolated(agent, run_id: str, outputs) -> bool:
+    """Every session's history holds exactly its own prompts, in order."""
+    for s, results in enumerate(outputs):
+        turns = agent.histories.get(f"{run_id}-{s}")._turns
+        if [user for user, _ in turns] != [PROMPT_PREFIX + code for code, _ in results][-len(turns):]:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=5, help="Questions per session")
+    parser.add_argument("--workers", type=int, default=4, help="Sandbox workers (and in-process slots)")
+    parser.add_argument("--model-latency-ms", type=float, default=50.0, help="Simulated latency per model call")
+    parser.add_argument("--mode", default="local", choices=["auto", "docker", "local"])
+    parser.add_argument("--path", default="both", choices=["in_process", "sandbox", "both"])
+    args = parser.parse_args()
+
+    agent = DataAnalystAgent()
+    runtime = agent.runtime
+    runtime._backend = ScriptedBackend(args.model_latency_ms)
+    # Measure query execution, not the model quota or the caches
+    runtime.scheduler = RequestScheduler(requests_per_minute=10**6, max_concurrent=2 * args.sessions)
+    runtime.response_cache.enabled = False
+    get_query_cache(agent.config).enabled = False
+    agent.memory_store.filepath = os.path.join(tempfile.mkdtemp(), "memory_store.json")
+    # The benchmark's own concurrency instead of config.yaml's
+    config = {'sandbox': {**agent.config.get('sandbox', {}), 'mode': args.mode,
+                          'workers': args.workers, 'fast_path_max_concurrent': args.workers}}
+    fast_path = safe_eval._runner = safe_eval.InProcessQueries.from_config(config)
+    sandbox_pool._pool = sandbox_pool.SandboxPool.from_config(config)
+
+    paths = ["in_process", "sandbox"] if args.path == "both" else [args.path]
+    total = args.sessions * args.queries
+    for path in paths:
+        fast_path.enabled = path == "in_process"
+        # Warm up (loads frames / starts workers) and record the expected answers one at a time
+        _, _, outputs = asyncio.run(run_sessions(agent, args.sessions, args.queries, False, f"{path}-expected"))
+        expected = dict(r for out in outputs for r in out)
+        print(f"\n{path} ({total} chats, {args.sessions} sessions, {args.workers} workers, "
+              f"{args.model_latency_ms:g}ms per model call)")
+        for concurrent in (False, True):
+            run_id = f"{path}-{'concurrent' if concurrent else 'sequential'}"
+            elapsed, latencies, outputs = asyncio.run(run_sessions(agent, args.sessions, args.queries, concurrent, run_id))
+            results = [r for out in outputs for r in out]
+            mismatches = sum(answer != expected[code] for code, answer in results)
+            errors = sum(not answer.startswith(ANSWER_PREFIX) or "Error" in answer for _, answer in results)
+            isolated = mismatches == 0 and histories_isolated(agent, run_id, outputs)
+            print(f"  {'concurrent' if concurrent else 'sequential':<10} {total / elapsed:8.1f} chats/s  "
+                  f"p50 {np.median(latencies):6.1f}ms  p95 {np.percentile(latencies, 95):6.1f}ms  "
+                  f"errors {errors}  isolation: {'OK' if isolated else f'FAILED ({mismatches} mismatched answers)'}")
+    sandbox_pool._pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark for the multi-resource capacity model (utils/capacity.py).
+
+Builds a synthetic network of plants, lines and lanes, routes every SKU through
+one plant, one line and one lane, then times the sparse violation check and the
+resource-by-resource greedy negotiation.
+
+Usage (from the project root):
+    python -m benchmarks.bench_capacity --skus 100000 --weeks 52
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_negotiation import make_plan
+from utils.capacity import CapacityModel
+
+
+def make_network(skus, plants: int, lines_per_plant: int, lanes: int, weekly_demand: float, seed: int = 7) -> dict:
+    rng = np.random.default_rng(seed)
+    resources, routings = [], {}
+    for p in range(plants):
+        resources.append({'name': f"PLANT_{p}", 'type': 'plant', 'weekly_limit': weekly_demand / plants * 0.9})
+        for l in range(lines_per_plant):
+            resources.append({'name': f"PLANT_{p}_LINE_{l}", 'type': 'line',
+                              'weekly_limit': weekly_demand / (plants * lines_per_plant) * 0.95})
+    for lane in range(lanes):
+        resources.append({'name': f"LANE_{lane}", 'type': 'lane', 'weekly_limit': weekly_demand / lanes * 0.5})
+
+    plant = rng.integers(0, plants, len(skus))
+    line = rng.integers(0, lines_per_plant, len(skus))
+    lane = rng.integers(0, lanes, len(skus))
+    rate = rng.uniform(0.8, 1.5, len(skus))
+    for i, sku in enumerate(skus):
+        routings[sku] = {
+            f"PLANT_{plant[i]}": 1.0,
+            f"PLANT_{plant[i]}_LINE_{line[i]}": float(rate[i]),
+            f"LANE_{lane[i]}": 0.5,
+        }
+    return {'resources': resources, 'routings': routings}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--plants", type=int, default=8)
+    parser.add_argument("--lines", type=int, default=6, help="Lines per plant")
+    parser.add_argument("--lanes", type=int, default=20)
+    args = parser.parse_args()
+
+    plan = make_plan(args.skus, args.weeks)
+    skus = plan['SKU'].unique()
+    weekly_demand = plan.groupby('Date')['Constrained_Plan'].sum().mean()
+    policy = {'strategic_skus': list(skus[::50]),
+              'capacity': make_network(skus, args.plants, args.lines, args.lanes, weekly_demand)}
+
+    model = CapacityModel.from_policy(policy)
+    print(f"{len(plan):,} plan rows, {len(model.resource_names)} resources")
+
+    start = time.perf_counter()
+    model.consumption_matrix(skus)
+    print(f"  build SKU x resource matrix: {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    violations = model.violations(plan)
+    print(f"  violation check (one sparse multiply): {time.perf_counter() - start:.3f}s "
+          f"({len(violations):,} violated resource-weeks)")
+
+    start = time.perf_counter()
+    cuts, cut_log, _ = model.negotiate(plan, policy['strategic_skus'])
+    print(f"  resource-by-resource negotiation: {time.perf_counter() - start:.3f}s ({len(cut_log):,} cuts)")
+
+    plan['Constrained_Plan'] = plan['Constrained_Plan'] - cuts
+    print(f"  violations after negotiation: {len(model.violations(plan))}")
+
+
+if __name__ == "__main__":
+    main()
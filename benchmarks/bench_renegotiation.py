@@ -0,0 +1,74 @@
+"""
+Benchmark for incremental re-negotiation (utils/negotiation_state.py).
+
+Negotiates a full-size plan once, then applies single-SKU edits and checks that the
+patched plan matches a full re-negotiation of the edited plan.
+
+Usage (from the project root):
+    python -m benchmarks.bench_renegotiation --skus 100000 --weeks 52 --edits 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_negotiation import make_plan
+from utils.capacity import CapacityModel
+from utils.negotiation_state import NegotiationState
+
+
+def negotiate_full(plan, model, strategic):
+    plan = plan.copy()
+    plan['Constrained_Plan'] = plan['Plan']
+    cuts, cut_log, _ = model.negotiate(plan, strategic)
+    plan['Constrained_Plan'] = plan['Constrained_Plan'] - cuts
+    return plan, cut_log
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--edits", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    plan = make_plan(args.skus, args.weeks).rename(columns={'Constrained_Plan': 'Plan'})
+    strategic = list(plan['SKU'].unique()[::50])
+    cap = plan.groupby('Date')['Plan'].sum().mean() * 0.8
+    model = CapacityModel.from_policy({'constraints': {'capacity_limit_total': cap}})
+
+    start = time.perf_counter()
+    negotiated, cut_log = negotiate_full(plan, model, strategic)
+    negotiated['Negotiation_Log'] = ""
+    state = NegotiationState(negotiated, model, strategic, cut_log)
+    print(f"Full negotiation + state build ({len(plan):,} rows): {time.perf_counter() - start:.3f}s")
+
+    rng = np.random.default_rng(0)
+    timings = []
+    for _ in range(args.edits):
+        row = negotiated.iloc[rng.integers(len(negotiated))]
+        change = [{'SKU': row['SKU'], 'Date': row['Date'], 'Plan': row['Plan'] * rng.uniform(0.5, 2.0)}]
+        start = time.perf_counter()
+        state.apply_changes(change)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings = np.array(timings)
+    print(f"Incremental edit: median {np.median(timings):.1f}ms, p95 {np.percentile(timings, 95):.1f}ms, "
+          f"max {timings.max():.1f}ms (budget {args.budget_ms:.0f}ms: "
+          f"{'OK' if np.percentile(timings, 95) <= args.budget_ms else 'EXCEEDED'})")
+
+    expected, _ = negotiate_full(negotiated[['Date', 'SKU', 'Plan']], model, strategic)
+    assert np.allclose(negotiated['Constrained_Plan'].to_numpy(), expected['Constrained_Plan'].to_numpy()), \
+        "Incremental plan differs from a full re-negotiation"
+    slack_ok = np.allclose(state.slack.to_numpy().ravel(),
+                           cap - expected.groupby('Date')['Constrained_Plan'].sum().to_numpy(), atol=1e-6 * cap)
+    print(f"Matches full re-negotiation: OK (slack consistent: {slack_ok})")
+
+
+if __name__ == "__main__":
+    main()
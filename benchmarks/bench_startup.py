@@ -0,0 +1,70 @@
+"""
+Benchmark for cold start of the API and the orchestrator.
+
+Each measurement runs in a fresh interpreter so nothing is already imported:
+  - `import api` must stay within the import budget and must not pull in the heavy
+    modules (pandas, google-genai, statsmodels, mcp, scipy) that agents load on use.
+  - `OrchestratorAgent()` must not build any agent until one is used.
+
+Exits with status 1 when the budget is exceeded or a heavy module loads eagerly.
+
+Usage (from the project root):
+    python -m benchmarks.bench_startup --runs 5 --budget-ms 1000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'google.genai', 'statsmodels', 'mcp', 'scipy']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{setup}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules], 'extra': {extra}}}))
+"""
+
+
+def probe(setup: str, extra: str = "None") -> dict:
+    code = PROBE.format(setup=setup, heavy=HEAVY_MODULES, extra=extra)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="Budget for `import api` (median)")
+    args = parser.parse_args()
+
+    checks = [
+        ("import api", "import api", "None"),
+        ("import orchestrator + OrchestratorAgent()",
+         "from orchestrator import OrchestratorAgent\no = OrchestratorAgent()", "len(o._agents)"),
+    ]
+
+    ok = True
+    for label, setup, extra in checks:
+        results = [probe(setup, extra) for _ in range(args.runs)]
+        ms = np.array([r['seconds'] for r in results]) * 1000
+        loaded = sorted({m for r in results for m in r['loaded']})
+        print(f"{label}: median {np.median(ms):.0f}ms, max {ms.max():.0f}ms; heavy modules loaded: {loaded or 'none'}"
+              + (f"; agents built: {results[0]['extra']}" if results[0]['extra'] is not None else ""))
+        if label == "import api":
+            within = np.median(ms) <= args.budget_ms
+            print(f"  budget {args.budget_ms:.0f}ms: {'OK' if within else 'EXCEEDED'}")
+            ok &= within and not loaded
+        elif results[0]['extra']:
+            ok = False
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,7 @@ from agents.scenario_agent import EventAndScenarioAgent
 from agents.negotiation_agent import MicroNegotiationAgent
 from agents.monitor_agent import MonitorExplainLearnAgent
 from evals.llm_judge import LLMJudge
-from servers.config_server import load_config
+from utils.policy_snapshot import get_policy_snapshot
 
 def load_test_specs(suite_filter=None):
     specs = []
@@ -128,7 +128,10 @@ def run_deterministic_check(test, agent, result):
 def run_evals():
     parser = argparse.ArgumentParser()
     parser.add_argument("--suite", help="Filter for specific test suite (e.g., 'analyst', 'policy')")
+    parser.add_argument("--policy-transport", choices=["inprocess", "stdio"], default="inprocess",
+                        help="How agents reach the policy server (inprocess skips the subprocess)")
     args = parser.parse_args()
+    os.environ["POLICY_SERVER_TRANSPORT"] = args.policy_transport
 
     print("🚀 Starting Evaluation Run...")
     
@@ -151,7 +154,7 @@ def run_evals():
     sales_data = pd.read_csv("data/sales_data.csv") if os.path.exists("data/sales_data.csv") else pd.DataFrame()
     final_plan = pd.read_csv("data/final_plan.csv") if os.path.exists("data/final_plan.csv") else pd.DataFrame()
     segmentation = pd.read_csv("data/segmentation.csv") if os.path.exists("data/segmentation.csv") else pd.DataFrame()
-    policy_config = load_config("config.yaml")
+    policy_config = get_policy_snapshot("config.yaml").get()
 
     # 3. Run Tests
     if "GOOGLE_API_KEY" not in os.environ:
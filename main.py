@@ -19,8 +19,8 @@ def main():
     for learn in report['learnings']:
         print(f"  - {learn}")
         
-    # Save outputs
-    final_plan.to_csv("data/final_plan.csv", index=False)
+    # The orchestrator already committed the plan (and built the cubes from that file);
+    # writing it again here would only make the cubes look out of date
     print("\nFinal plan saved to data/final_plan.csv")
 
 if __name__ == "__main__":
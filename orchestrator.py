@@ -1,28 +1,89 @@
-from agents.policy_agent import PolicyAndGuardrailAgent
-from agents.data_agent import DataAndSignalAgent
-from agents.segmentation_agent import SegmentationAndPlaybookAgent
-from agents.baseline_agent import BaselineForecastAgent
-from agents.scenario_agent import EventAndScenarioAgent
-from agents.negotiation_agent import MicroNegotiationAgent
-from agents.monitor_agent import MonitorExplainLearnAgent
-from agents.analyst_agent import DataAnalystAgent
+import importlib
+from utils.plan_stability import apply_plan_stability, load_committed_plan, commit_plan
+from utils.metrics import metrics, current_step
+from utils.scheduler import priority, BATCH
+from utils.policy_compiler import CompiledPolicy
+from utils.query_cache import invalidate_query_cache
+from utils.cubes import get_cube_store
+from utils.runtime import get_runtime
 import pandas as pd
 import os
+import io
+import sys
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Output buffer of the step running in the current context (None outside steps)
+_step_buffer = contextvars.ContextVar('step_buffer', default=None)
+
+
+class _StepOutput(io.TextIOBase):
+    """
+    Stand-in for sys.stdout during a planning cycle. Prints from a step go to that step's
+    buffer (a context variable, so it follows the step into tool threads), and steps
+    running side by side don't capture each other's output.
+    """
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, s):
+        buffer = _step_buffer.get()
+        return (buffer if buffer is not None else self.fallback).write(s)
+
+    def flush(self):
+        self.fallback.flush()
+
+
+_step_output_lock = threading.Lock()
+
+
+def _install_step_output():
+    """
+    Routes sys.stdout through _StepOutput, once per process. Swapping sys.stdout per cycle
+    (it is process-global) would race between overlapping cycles and chat requests; with
+    the proxy always installed, a cycle only sets its own _step_buffer per step.
+    """
+    with _step_output_lock:
+        if not isinstance(sys.stdout, _StepOutput):
+            sys.stdout = _StepOutput(sys.stdout)
+
 
 class OrchestratorAgent:
+    # Agents are imported and built on first use, so a chat request doesn't pay for
+    # statsmodels or the MCP client and startup doesn't build eight agents up front
+    AGENTS = {
+        'policy_agent': ('agents.policy_agent', 'PolicyAndGuardrailAgent'),
+        'data_agent': ('agents.data_agent', 'DataAndSignalAgent'),
+        'segmentation_agent': ('agents.segmentation_agent', 'SegmentationAndPlaybookAgent'),
+        'baseline_agent': ('agents.baseline_agent', 'BaselineForecastAgent'),
+        'scenario_agent': ('agents.scenario_agent', 'EventAndScenarioAgent'),
+        'negotiation_agent': ('agents.negotiation_agent', 'MicroNegotiationAgent'),
+        'monitor_agent': ('agents.monitor_agent', 'MonitorExplainLearnAgent'),
+        'analyst_agent': ('agents.analyst_agent', 'DataAnalystAgent'),
+    }
+
     def __init__(self):
-        self.policy_agent = PolicyAndGuardrailAgent()
-        self.data_agent = DataAndSignalAgent()
-        self.segmentation_agent = SegmentationAndPlaybookAgent()
-        self.baseline_agent = BaselineForecastAgent()
-        self.scenario_agent = EventAndScenarioAgent()
-        self.negotiation_agent = MicroNegotiationAgent()
-        self.monitor_agent = MonitorExplainLearnAgent()
-        self.analyst_agent = DataAnalystAgent()
+        self._agents = {}
+        self._agents_lock = threading.Lock()
+        _install_step_output()
 
-    def route_request(self, user_message: str) -> str:
+    def __getattr__(self, attr):
+        # Only called when normal lookup fails, i.e. for agents not built yet
+        if attr not in OrchestratorAgent.AGENTS:
+            raise AttributeError(attr)
+        with self._agents_lock:
+            if attr not in self._agents:
+                module, class_name = OrchestratorAgent.AGENTS[attr]
+                self._agents[attr] = getattr(importlib.import_module(module), class_name)()
+            return self._agents[attr]
+
+    def _route_agent(self, user_message: str):
         """
-        Routes the user message to the appropriate agent based on intent.
+        Picks the agent for a user message based on intent.
         """
         msg_lower = user_message.lower()
         
@@ -30,20 +91,36 @@ class OrchestratorAgent:
         # In a real system, we'd use an LLM to classify intent.
         
         if any(k in msg_lower for k in ["policy", "strategy", "rule", "guardrail", "priority"]):
-            return self.policy_agent.run(user_message)
+            return self.policy_agent
             
         if any(k in msg_lower for k in ["data", "sales", "sell", "sold", "forecast", "plan", "sku", "trend", "volume", "how many", "how much"]):
             # This is likely a data question
-            return self.analyst_agent.run(user_message)
+            return self.analyst_agent
             
         # Default to Policy/General agent for generic questions
-        return self.policy_agent.run(user_message)
+        return self.policy_agent
+
+    def route_request(self, user_message: str) -> str:
+        """
+        Routes the user message to the appropriate agent based on intent.
+        """
+        return self._route_agent(user_message).run(user_message)
+
+    async def aroute_request(self, user_message: str) -> str:
+        """Async route_request() for the API."""
+        return await self._route_agent(user_message).arun(user_message)
 
     def run(self):
-        import io
-        import contextlib
-        import sys
+        return self._run_cycle()
+
+    async def arun(self):
+        """
+        Async run() for the API: the cycle runs in a worker thread so the event loop keeps
+        serving, and the policy and data steps (which don't depend on each other) overlap.
+        """
+        return await asyncio.to_thread(self._run_cycle, True)
 
+    def _run_cycle(self, overlap_prep: bool = False):
         logs = []
         
         def log(msg):
@@ -54,11 +131,16 @@ class OrchestratorAgent:
             log(f"[Orchestrator] {step_name}...")
             f = io.StringIO()
             result = None
+            token = _step_buffer.set(f)
+            step_token = current_step.set(step_name)
             try:
-                with contextlib.redirect_stdout(f):
+                with metrics.timer('orchestrator_step_duration_seconds', step=step_name):
                     result = func(*args, **kwargs)
             except Exception as e:
                 print(f"Error in {step_name}: {e}")
+            finally:
+                current_step.reset(step_token)
+                _step_buffer.reset(token)
             
             output = f.getvalue()
             if output:
@@ -68,9 +150,31 @@ class OrchestratorAgent:
                         sys.__stdout__.write(line + "\n")
             return result
 
+        # Step output is captured through the process-wide _StepOutput proxy
+        _install_step_output()
+        run_start = metrics.snapshot()
+        start = time.perf_counter()
+        # Planning calls queue behind interactive chat for the shared model quota
+        with priority(BATCH):
+            result = self._run_steps(log, run_step, logs, overlap_prep)
+        
+        # Where this cycle's time went, per agent and step
+        metrics.inc('orchestrator_runs_total')
+        metrics.write_report("data/run_report.json", since=run_start, total_seconds=round(time.perf_counter() - start, 3))
+        log("[Orchestrator] Run report saved to data/run_report.json.")
+        return result
+
+    def _run_steps(self, log, run_step, logs, overlap_prep: bool):
         log("[Orchestrator] Starting Demand Planning Cycle...")
         
+        # Data & Signals doesn't need the policy, so it can start alongside it
+        def data_step():
+            return run_step("Step 2: Processing Data & Signals", self.data_agent.run, prompt="Load data, detect anomalies, and clean if necessary.")
+        prep_pool = ThreadPoolExecutor(max_workers=1) if overlap_prep else None
+        data_future = prep_pool.submit(contextvars.copy_context().run, data_step) if prep_pool else None
+        
         # 1. Policy & Guardrails
+        policy_version = get_runtime().policy.version
         policy_context = run_step("Step 1: Retrieving Policy & Guardrails", self.policy_agent.run, "Retrieve current policies and guardrails.")
         
         # Handle Policy Context
@@ -87,7 +191,11 @@ class OrchestratorAgent:
         self.negotiation_agent.policy_context = policy_context
         
         # 2. Data & Signals
-        clean_data_df = run_step("Step 2: Processing Data & Signals", self.data_agent.run, prompt="Load data, detect anomalies, and clean if necessary.")
+        if data_future is not None:
+            clean_data_df = data_future.result()
+            prep_pool.shutdown()
+        else:
+            clean_data_df = data_step()
         if clean_data_df is None: clean_data_df = pd.DataFrame()
         log(f"[Orchestrator] Data Loaded. Shape: {clean_data_df.shape}")
         
@@ -107,6 +215,17 @@ class OrchestratorAgent:
         else:
             playbooks, metrics = {}, {}
         
+        # Guardrails as SKU-indexed arrays (segment uplift caps, strategic flags, cut
+        # priority), compiled once and shared by the scenario and negotiation steps
+        compiled_policy = CompiledPolicy.compile(
+            policy_context,
+            sku_segments={sku: pb.get('segment') for sku, pb in playbooks.items() if isinstance(pb, dict)},
+            segment_rules=self.scenario_agent.config.get('segments'),
+            policy_version=policy_version,
+        )
+        self.scenario_agent.compiled_policy = compiled_policy
+        self.negotiation_agent.compiled_policy = compiled_policy
+        
         # 4. Baseline Forecast
         baseline_forecast = run_step("Step 4: Generating Baseline Forecast", self.baseline_agent.run, clean_data_df, playbooks, prompt="Generate baseline forecasts for all SKUs.")
         if baseline_forecast is None: baseline_forecast = pd.DataFrame()
@@ -117,15 +236,31 @@ class OrchestratorAgent:
         if scenario_plan is None: scenario_plan = pd.DataFrame()
         log(f"[Orchestrator] Scenarios Applied.")
         
+        # 5b. Plan Stability vs the last committed plan
+        constraints = policy_context.get('constraints', {})
+        max_change = constraints.get('max_plan_change_per_week') if isinstance(constraints, dict) else None
+        if max_change is not None and not scenario_plan.empty:
+            prior_plan = load_committed_plan("data/final_plan.csv")
+            stable_plan = run_step("Step 5b: Enforcing Plan Stability", apply_plan_stability, scenario_plan, prior_plan, max_change)
+            if stable_plan is not None:
+                scenario_plan = stable_plan
+                log(f"[Orchestrator] Plan Stability: {int(scenario_plan['Stability_Dampened'].sum())} SKU-weeks dampened to within {max_change:.0%} of the committed plan.")
+        
         # 6. Micro-Negotiation
         final_plan = run_step("Step 6: Optimizing & Negotiating", self.negotiation_agent.run, scenario_plan, prompt="Check capacity constraints and adjust plan if needed.")
         if final_plan is None: final_plan = pd.DataFrame()
         log(f"[Orchestrator] Final Plan Optimized.")
         
-        # Save to disk so AnalystAgent can see it
+        # Commit to disk so AnalystAgent can see it (previous plan is archived, not overwritten)
         try:
-            final_plan.to_csv("data/final_plan.csv", index=False)
+            archived = commit_plan(final_plan, "data/final_plan.csv")
+            # Analyst answers about the old plan are stale now
+            invalidate_query_cache()
             log(f"[Orchestrator] Final Plan Saved to Disk.")
+            if archived:
+                log(f"[Orchestrator] Previous plan archived to {archived}.")
+            # Structured record of every cut (who, why, how much) next to the plan
+            self.negotiation_agent.ledger.to_frame().to_csv("data/negotiation_ledger.csv", index=False)
         except Exception as e:
             log(f"[Orchestrator] Error saving plan: {e}")
 
@@ -134,6 +269,13 @@ class OrchestratorAgent:
         if final_report is None: final_report = "Error generating report."
         log(f"[Orchestrator] Report Generated.")
         
+        # 8. Precompute the aggregates the analyst, charts and dashboard read
+        cube_store = get_cube_store(get_runtime().config)
+        if cube_store.enabled:
+            cube_index = run_step("Step 8: Materialising Analytic Cubes", cube_store.materialise)
+            if cube_index:
+                log(f"[Orchestrator] {len(cube_index['cubes'])} cubes saved to {cube_store.directory}.")
+        
         log("[Orchestrator] Cycle Complete.")
         
         # Format the report for the UI
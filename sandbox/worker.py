@@ -0,0 +1,137 @@
+"""
+Long-lived query worker for DataAnalystAgent.query_data.
+
+Loads the datasets once, then answers one query per line on stdin:
+    {"id": 1, "code": "self.final_plan['Plan'].sum()"}
+with one JSON line on stdout:
+    {"id": 1, "output": "123456.0"}
+
+Runs inside the pandas-sandbox container (data mounted at /data) or, when
+explicitly configured, as a local subprocess. Each query gets a time limit and the
+process an address-space limit, so a runaway query fails on its own instead of
+taking the worker down. Queries see only the datasets, pd, np and a small set of
+builtins; dunder names and attributes are rejected before anything runs.
+
+Usage:
+    python worker.py /data --timeout 30 --memory-mb 1024
+"""
+import argparse
+import ast
+import builtins
+import contextlib
+import io
+import json
+import os
+import signal
+import sys
+
+import numpy as np
+import pandas as pd
+
+DATASETS = ('sales_data', 'final_plan', 'segmentation')
+
+# Queries get shallow copies; with copy-on-write their edits never reach the loaded frames
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+# No __import__, open, eval/exec, getattr or globals: queries compute, they don't reach out
+SAFE_BUILTINS = {
+    name: getattr(builtins, name) for name in (
+        'abs', 'all', 'any', 'bool', 'dict', 'enumerate', 'filter', 'float', 'int', 'isinstance',
+        'len', 'list', 'map', 'max', 'min', 'print', 'range', 'reversed', 'round', 'set', 'sorted',
+        'str', 'sum', 'tuple', 'zip',
+    )
+}
+
+
+def check_query(code: str):
+    """Rejects dunder names and attributes (the usual way out of restricted builtins)."""
+    for node in ast.walk(ast.parse(code, mode="eval")):
+        name = node.id if isinstance(node, ast.Name) else node.attr if isinstance(node, ast.Attribute) else None
+        if name is not None and name.startswith('__'):
+            raise ValueError(f"'{name}' is not allowed in queries")
+
+
+class MockSelf:
+    """Lets queries keep the agent's `self.sales_data` spelling."""
+
+    def __init__(self, frames):
+        for name, df in frames.items():
+            setattr(self, name, df)
+
+
+def load_frames(data_dir: str) -> dict:
+    frames = {}
+    for name in DATASETS:
+        path = os.path.join(data_dir, f"{name}.csv")
+        frames[name] = pd.read_csv(path) if os.path.exists(path) else None
+    final_plan = frames['final_plan']
+    if final_plan is not None and 'Negotiation_Log' in final_plan.columns:
+        final_plan['Negotiation_Log'] = final_plan['Negotiation_Log'].fillna('').astype(str)
+    return frames
+
+
+def limit_memory(memory_mb: int):
+    """Caps the address space at what is mapped now (interpreter + data) plus memory_mb."""
+    try:
+        import resource
+        with open('/proc/self/statm') as f:
+            mapped = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+        limit = mapped + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, OSError, ValueError):
+        pass  # Not Linux: rely on the pool's timeout (and Docker's --memory)
+
+
+def _timed_out(signum, frame):
+    raise TimeoutError("Query timed out")
+
+
+def run_query(code: str, frames: dict, timeout: float) -> str:
+    snapshot = {name: df.copy(deep=False) if df is not None else None for name, df in frames.items()}
+    namespace = {'__builtins__': SAFE_BUILTINS, 'pd': pd, 'np': np, 'self': MockSelf(snapshot), **snapshot}
+    printed = io.StringIO()
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        check_query(code)
+        # Anything the query prints comes before its value, as with a script
+        with contextlib.redirect_stdout(printed):
+            result = eval(compile(code, "<query>", "eval"), namespace)
+        return printed.getvalue() + str(result)
+    except MemoryError:
+        return "Error: Query exceeded the sandbox memory limit"
+    except Exception as e:
+        return f"Error: {e}"
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data_dir", nargs="?", default="/data")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--memory-mb", type=int, default=1024)
+    args = parser.parse_args()
+
+    frames = load_frames(args.data_dir)
+    signal.signal(signal.SIGALRM, _timed_out)
+    limit_memory(args.memory_mb)
+
+    # Only our protocol goes to stdout; stray output (e.g. warnings) goes to stderr
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    out.write(json.dumps({'ready': True}) + "\n")
+    out.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        output = run_query(request['code'], frames, args.timeout)
+        out.write(json.dumps({'id': request.get('id'), 'output': output}) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,20 @@
 from mcp.server.fastmcp import FastMCP
-import yaml
+from typing import List
+import json
 import os
+import sys
+
+# Run as a script, so make the project's utils importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.policy_snapshot import get_policy_snapshot
 
 # Initialize FastMCP server
-mcp = FastMCP("ConfigServer")
+# Per-request INFO logs would flood stderr now that sessions are long-lived
+mcp = FastMCP("ConfigServer", log_level="WARNING")
 
 def load_config(config_path="config.yaml"):
-    try:
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                return yaml.safe_load(f)
-        return {}
-    except Exception as e:
-        return {"error": str(e)}
+    # Parsed once; re-parsed only when the file's mtime and content change
+    return get_policy_snapshot(config_path).get()
 
 @mcp.tool()
 def get_policy_config(key: str) -> str:
@@ -23,18 +25,19 @@ def get_policy_config(key: str) -> str:
     Returns:
         The value as a string, or 'Not found'.
     """
-    config = load_config()
-    
-    # Flatten config for easier lookup or just return top-level sections
-    if key in config:
-        return str(config[key])
-    
-    # Search in sub-dictionaries
-    for section in config.values():
-        if isinstance(section, dict) and key in section:
-            return str(section[key])
-            
-    return "Not found"
+    return str(get_policy_snapshot().lookup(key, "Not found"))
+
+@mcp.tool()
+def get_policy_values(keys: List[str]) -> str:
+    """
+    Retrieves several values from the policy configuration in one call.
+    Args:
+        keys: The configuration keys to look up (e.g., ['priorities', 'constraints']).
+    Returns:
+        A JSON object mapping each key to its value (null if not found).
+    """
+    snapshot = get_policy_snapshot()
+    return json.dumps({key: snapshot.lookup(key) for key in keys}, default=str)
 
 if __name__ == "__main__":
     # Run the server
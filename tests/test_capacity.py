@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.capacity import CapacityModel
+
+POLICY = {'capacity': {
+    'resources': [
+        {'name': 'plant', 'type': 'plant', 'weekly_limit': 400},
+        {'name': 'line_1', 'type': 'line', 'weekly_limit': 150, 'weekly_limits': {'2026-01-12': 120}},
+        {'name': 'line_2', 'type': 'line', 'weekly_limit': 200},
+    ],
+    'routings': {
+        'default': {'plant': 1.0, 'line_1': 1.0},
+        'SKU_C': {'plant': 1.0, 'line_2': 2.0},
+        'SKU_D': {'plant': 0.5, 'line_1': 0.5, 'line_2': 0.5},
+    },
+}}
+RATES = {  # dense SKU x (plant, line_1, line_2) consumption, written out by hand
+    'SKU_A': [1.0, 1.0, 0.0],
+    'SKU_B': [1.0, 1.0, 0.0],
+    'SKU_C': [1.0, 0.0, 2.0],
+    'SKU_D': [0.5, 0.5, 0.5],
+}
+
+
+@pytest.fixture
+def plan():
+    rng = np.random.default_rng(7)
+    dates = pd.to_datetime(['2026-01-05', '2026-01-12', '2026-01-19'])
+    skus = list(RATES)
+    return pd.DataFrame({
+        'Date': np.repeat(dates, len(skus)),
+        'SKU': skus * len(dates),
+        'Constrained_Plan': rng.uniform(20, 140, len(dates) * len(skus)).round(1),
+    })
+
+
+def test_sparse_load_matches_dense_computation(plan):
+    model = CapacityModel.from_policy(POLICY)
+    weeks, load = model.resource_load(plan)
+
+    dense = np.array([RATES[sku] for sku in plan['SKU']]) * plan['Constrained_Plan'].to_numpy()[:, None]
+    expected = pd.DataFrame(dense).groupby(plan['Date'].to_numpy()).sum()
+    assert list(weeks) == list(expected.index)
+    np.testing.assert_allclose(load, expected.to_numpy())
+    # Row-level rates (used by NegotiationState) give the same load
+    _, row_load = model.resource_load(plan, row_rates=model.row_rates(plan))
+    np.testing.assert_allclose(row_load, load)
+
+
+def test_consumption_matrix_follows_the_sku_order():
+    model = CapacityModel.from_policy(POLICY)
+    skus = ['SKU_A', 'SKU_C', 'SKU_D']
+    first = model.consumption_matrix(skus)
+    np.testing.assert_allclose(first.toarray(), [RATES[s] for s in skus])
+    assert model.consumption_matrix(pd.Index(list(skus))) is first
+
+    reordered = ['SKU_D', 'SKU_C', 'SKU_A']
+    np.testing.assert_allclose(model.consumption_matrix(reordered).toarray(), [RATES[s] for s in reordered])
+    shorter = ['SKU_D', 'SKU_C']
+    np.testing.assert_allclose(model.consumption_matrix(shorter).toarray(), [RATES[s] for s in shorter])
+
+
+def test_negotiate_leaves_no_violations(plan):
+    model = CapacityModel.from_policy(POLICY)
+    assert not model.violations(plan).empty
+
+    cuts, cut_log, violations = model.negotiate(plan, strategic_skus=['SKU_C'])
+    negotiated = plan.assign(Constrained_Plan=plan['Constrained_Plan'] - cuts)
+
+    assert model.violations(negotiated).empty
+    assert (cuts >= 0).all() and (negotiated['Constrained_Plan'] >= 0).all()
+    np.testing.assert_allclose(np.bincount(cut_log['row'], weights=cut_log['cut'], minlength=len(plan)), cuts)
+    assert set(violations['resource']) <= {'plant', 'line_1', 'line_2'}
+
+
+def test_negotiate_resource_only_sees_routed_rows(plan):
+    model = CapacityModel.from_policy(POLICY)
+    row_rates = model.row_rates(plan)
+    row_rates.sort_indices()
+    weeks, _ = model.resource_load(plan)
+    values = plan['Constrained_Plan'].to_numpy(dtype=float)
+
+    rows, cuts, cut_log, _ = model.negotiate_resource(
+        2, values, plan['Date'].to_numpy(), plan['SKU'].to_numpy(), row_rates, weeks,
+        model.weekly_limits(weeks), strategic_skus=[]
+    )
+    assert set(plan['SKU'].to_numpy()[rows]) == {'SKU_C', 'SKU_D'}
+    assert set(cut_log['row']) <= set(rows)
+    assert (cut_log['resource'] == 'line_2').all()
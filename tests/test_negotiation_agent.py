@@ -0,0 +1,22 @@
+import pandas as pd
+
+from agents.negotiation_agent import MicroNegotiationAgent
+
+
+def agent_with_plan() -> MicroNegotiationAgent:
+    agent = MicroNegotiationAgent(policy_context={'constraints': {'capacity_limit_total': 100}})
+    agent.constrained_plan = pd.DataFrame({
+        'Date': pd.to_datetime(['2026-01-05', '2026-01-05', '2026-01-12']),
+        'SKU': ['SKU_A', 'SKU_B', 'SKU_A'],
+        'Plan': [80.0, 60.0, 50.0],
+        'Constrained_Plan': [80.0, 60.0, 50.0],
+    })
+    return agent
+
+
+def test_check_capacity_reports_the_weeks_shortage():
+    agent = agent_with_plan()
+    assert agent.check_capacity("2026-01-05") == "Week 2026-01-05: Demand 140 > Cap 100. Shortage: 40"
+    assert agent.check_capacity("2026-01-12") == "Week 2026-01-12: no capacity violations."
+    assert agent.check_capacity("2026-02-02") == "No plan rows for week 2026-02-02."
+    assert agent.check_capacity("not a date") == "Invalid date format."
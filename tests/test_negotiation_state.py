@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agents.negotiation_agent import MicroNegotiationAgent
+from utils.capacity import CapacityModel
+from utils.negotiation import CutLedger
+
+POLICY = {'constraints': {'capacity_limit_total': 100}, 'strategic_skus': ['SKU_B']}
+
+
+def negotiate_full(plan: pd.DataFrame, model: CapacityModel, strategic) -> pd.DataFrame:
+    plan = plan[['Date', 'SKU', 'Plan']].copy()
+    plan['Constrained_Plan'] = plan['Plan'].astype(float)
+    cuts, cut_log, _ = model.negotiate(plan, strategic)
+    plan['Constrained_Plan'] -= cuts
+    return plan, cut_log
+
+
+@pytest.fixture
+def committed(tmp_path):
+    """A two-SKU plan over capacity in its first week, negotiated and saved like the orchestrator does."""
+    plan = pd.DataFrame({
+        'Date': pd.to_datetime(['2026-01-05', '2026-01-05', '2026-01-12', '2026-01-12']),
+        'SKU': ['SKU_A', 'SKU_B', 'SKU_A', 'SKU_B'],
+        'Plan': [50.0, 100.0, 30.0, 40.0],
+    })
+    model = CapacityModel.from_policy(POLICY)
+    negotiated, cut_log = negotiate_full(plan, model, POLICY['strategic_skus'])
+    negotiated['Negotiation_Log'] = CutLedger(cut_log).messages().reindex(range(len(plan)), fill_value="").to_numpy()
+    plan_path, ledger_path = tmp_path / "final_plan.csv", tmp_path / "negotiation_ledger.csv"
+    negotiated.to_csv(plan_path, index=False)
+    CutLedger(cut_log).to_frame().to_csv(ledger_path, index=False)
+    return model, plan_path, ledger_path
+
+
+def reload_and_edit(plan_path, ledger_path, sku: str, plan_value: float) -> pd.DataFrame:
+    agent = MicroNegotiationAgent(policy_context=POLICY)
+    plan = pd.read_csv(plan_path)
+    agent.load_state(plan, ledger_path=str(ledger_path))
+    summary = agent.renegotiate([{'SKU': sku, 'Date': '2026-01-05', 'Plan': plan_value}])
+    return plan, summary
+
+
+@pytest.mark.parametrize("with_ledger", [True, False])
+def test_edit_after_reload_matches_full_resolve(committed, with_ledger):
+    model, plan_path, ledger_path = committed
+    if not with_ledger:
+        ledger_path.unlink()
+    assert pd.read_csv(plan_path)['Constrained_Plan'].iloc[0] == 0  # SKU_A was cut to fit
+
+    # Freeing 40 units on SKU_B gives SKU_A's earlier cut back in part
+    plan, summary = reload_and_edit(plan_path, ledger_path, 'SKU_B', 60.0)
+
+    expected, _ = negotiate_full(plan, model, POLICY['strategic_skus'])
+    assert summary['resources_resolved'] == ['total']
+    assert plan['Constrained_Plan'].iloc[0] == 40.0
+    np.testing.assert_allclose(plan['Constrained_Plan'], expected['Constrained_Plan'])
+    assert "Unknown" not in " ".join(plan['Negotiation_Log'])
+
+
+def test_reload_keeps_manual_cuts(committed):
+    model, plan_path, ledger_path = committed
+    # A planner cut on SKU_B in the second week, recorded in the saved ledger
+    plan = pd.read_csv(plan_path)
+    plan.loc[3, 'Constrained_Plan'] -= 10
+    plan.to_csv(plan_path, index=False)
+    ledger = pd.read_csv(ledger_path)
+    manual = {'Row': 3, 'SKU': 'SKU_B', 'Date': '2026-01-12', 'Amount': 10.0, 'Reason': 'promo pulled',
+              'Actor': 'Agent', 'Resource': ''}
+    pd.concat([ledger, pd.DataFrame([manual])]).to_csv(ledger_path, index=False)
+
+    agent = MicroNegotiationAgent(policy_context=POLICY)
+    plan = pd.read_csv(plan_path)
+    agent.load_state(plan, ledger_path=str(ledger_path))
+    agent.renegotiate([{'SKU': 'SKU_A', 'Date': '2026-01-12', 'Plan': 35.0}])
+
+    assert plan['Constrained_Plan'].iloc[3] == 30.0
+    assert plan['Negotiation_Log'].iloc[3] == "Cut 10 by Agent (promo pulled)"
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from utils.plan_stability import apply_plan_stability
+
+
+def frame(plan, constrained=None):
+    df = pd.DataFrame({
+        'Date': pd.to_datetime(['2026-01-05', '2026-01-12', '2026-01-19']),
+        'SKU': ['SKU_A', 'SKU_A', 'SKU_B'],
+        'Plan': plan,
+    })
+    if constrained is not None:
+        df['Constrained_Plan'] = constrained
+    return df
+
+
+def test_clamps_plan_against_prior_plan_not_prior_cuts():
+    # SKU_A was cut to 10 by capacity last cycle; its demand of 100 must not be held near 10
+    prior = frame([100.0, 100.0, 50.0], constrained=[10.0, 10.0, 50.0])
+    stable = apply_plan_stability(frame([105.0, 200.0, 50.0]), prior, max_change=0.2)
+
+    np.testing.assert_allclose(stable['Plan'], [105.0, 120.0, 50.0])
+    np.testing.assert_allclose(stable['Prior_Plan'], [100.0, 100.0, 50.0])
+    assert stable['Stability_Dampened'].tolist() == [False, True, False]
+    np.testing.assert_allclose(stable['Stability_Adjustment'], [0.0, -80.0, 0.0])
+
+
+def test_rows_without_prior_or_value_pass_through():
+    prior = frame([100.0, 100.0, 50.0]).iloc[:2]
+    stable = apply_plan_stability(frame([np.nan, 300.0, 500.0]), prior, max_change=0.1)
+
+    np.testing.assert_allclose(stable['Plan'], [np.nan, 110.0, 500.0])
+    assert stable['Stability_Dampened'].tolist() == [False, True, False]
+    np.testing.assert_allclose(stable['Stability_Adjustment'], [0.0, -190.0, 0.0])
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from utils.safe_eval import InProcessQueries, UnsafeExpression, load_datasets, validate_expression
+
+
+@pytest.mark.parametrize("code", [
+    "self.final_plan['SKU'].str.contains('SKU_00')",
+    "self.final_plan['SKU'].str.contains('(a+)+$', regex=False)",
+    "self.final_plan['SKU'].str.split('_')",
+    "self.final_plan.filter(like='Plan')",
+])
+def test_literal_patterns_stay_in_process(code):
+    validate_expression(code)
+
+
+@pytest.mark.parametrize("code", [
+    "self.final_plan['SKU'].str.contains('(a+)+$')",
+    "self.final_plan['SKU'].str.contains(pat='SKU.*')",
+    "self.final_plan['SKU'].str.count('a|b')",
+    "self.final_plan['SKU'].str.split('_', regex=True)",
+    "self.final_plan.filter(regex='^Plan')",
+])
+def test_regex_patterns_go_to_the_sandbox(code):
+    with pytest.raises(UnsafeExpression):
+        validate_expression(code)
+
+
+def test_fast_path_shares_one_copy_of_the_frames(tmp_path):
+    pd.DataFrame({'SKU': ['SKU_001', 'SKU_002'], 'Sales': [5, 7]}).to_csv(tmp_path / "sales_data.csv", index=False)
+    runner = InProcessQueries(data_dir=str(tmp_path))
+
+    assert runner.frames()['sales_data'] is load_datasets(str(tmp_path))['sales_data']
+    assert runner.query("self.sales_data['Sales'].sum()", "v1") == "12"
+    assert runner.query("self.sales_data['SKU'].str.contains('SKU_.*').sum()", "v1") is None
+
+
+@pytest.mark.parametrize("code", [
+    "self.final_plan.__class__",
+    "self.__dict__",
+    "self.final_plan._mgr",
+    "self.final_plan.merge(self.segmentation, on='SKU')",
+    "pd.merge(self.final_plan, self.segmentation)",
+    "self.final_plan.pivot(index='SKU', columns='Date', values='Plan')",
+    "self.final_plan.pivot_table(index='SKU', columns='Date')",
+    "self.final_plan.groupby(['SKU', 'Date'])['Plan'].sum().unstack()",
+    "self.final_plan.groupby('SKU').agg('pivot_table')",
+    "__import__('os')",
+])
+def test_rejects_private_access_and_row_multiplying_calls(code):
+    with pytest.raises(UnsafeExpression):
+        validate_expression(code)
@@ -1,5 +1,7 @@
 let rawData = [];
 let dynamicChartInstance = null;
+// One chat session (and conversation history on the server) per page load
+const SESSION_ID = (crypto.randomUUID ? crypto.randomUUID() : String(Date.now()) + Math.random());
 
 // Initialize
 document.addEventListener('DOMContentLoaded', async () => {
@@ -252,7 +254,7 @@ async function sendMessage() {
     const res = await fetch('/api/chat', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: msg })
+        body: JSON.stringify({ message: msg, session_id: SESSION_ID })
     });
     const data = await res.json();
     addMessage('agent', data.response);
@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from typing import Dict, List
+
+from utils.negotiation import greedy_capacity_cuts, CUT_LOG_DTYPE, VIOLATION_DTYPE
+
+
+class CapacityModel:
+    """
+    Capacity as a set of resources (plants, lines, lanes), each with its own weekly limit.
+
+    SKUs consume one or more resources at a rate per planned unit. Consumption is held
+    as a sparse SKU x resource matrix, so the load on every resource for every week is
+    a single sparse multiply of the (week x SKU) plan matrix with it.
+
+    Config (policy `capacity` section):
+        resources: [{name, type, weekly_limit, weekly_limits: {date: limit}}]
+        routings: {SKU or 'default': {resource: rate}}
+    Without a `capacity` section the model falls back to one 'total' resource with
+    `constraints.capacity_limit_total`, consumed 1:1 by every SKU.
+    """
+
+    def __init__(self, resources: List[Dict], routings: Dict[str, Dict[str, float]]):
+        self.resources = resources
+        self.resource_names = [r['name'] for r in resources]
+        self.resource_index = {name: i for i, name in enumerate(self.resource_names)}
+        self.routings = routings or {}
+        self._matrix_cache = None  # (skus, matrix) for the last SKU order
+
+    @classmethod
+    def from_policy(cls, policy_context: dict) -> "CapacityModel":
+        capacity = policy_context.get('capacity')
+        if isinstance(capacity, dict) and capacity.get('resources'):
+            return cls(capacity['resources'], capacity.get('routings', {}))
+
+        constraints = policy_context.get('constraints', {})
+        if not isinstance(constraints, dict):
+            constraints = {}
+        limit = constraints.get('capacity_limit_total', 10000)
+        return cls(
+            [{'name': 'total', 'type': 'total', 'weekly_limit': limit}],
+            {'default': {'total': 1.0}}
+        )
+
+    @property
+    def is_single_total(self) -> bool:
+        """True when this is just the scalar capacity_limit_total shared by every SKU."""
+        return self.resource_names == ['total'] and set(self.routings) == {'default'}
+
+    def consumption_matrix(self, skus) -> sparse.csr_matrix:
+        """Sparse SKU x resource matrix of consumption rates for the given SKU order."""
+        skus = pd.Index(skus)
+        # Only the last SKU order is kept, so compare against it directly: a vectorised
+        # equals is far cheaper than building and hashing a tuple (or hash_array) of strings
+        if self._matrix_cache is not None and self._matrix_cache[0].equals(skus):
+            return self._matrix_cache[1]
+
+        rows, cols, data = [], [], []
+        # Default routing applies to every SKU without its own entry
+        explicit = skus.isin([s for s in self.routings if s != 'default'])
+        default_rows = np.flatnonzero(~explicit)
+        for resource, rate in self.routings.get('default', {}).items():
+            if resource not in self.resource_index or not rate:
+                continue
+            rows.append(default_rows)
+            cols.append(np.full(len(default_rows), self.resource_index[resource]))
+            data.append(np.full(len(default_rows), float(rate)))
+
+        for row in np.flatnonzero(explicit):
+            for resource, rate in self.routings[skus[row]].items():
+                if resource not in self.resource_index or not rate:
+                    continue
+                rows.append([row])
+                cols.append([self.resource_index[resource]])
+                data.append([float(rate)])
+
+        matrix = sparse.csr_matrix(
+            (np.concatenate(data) if data else np.empty(0),
+             (np.concatenate(rows) if rows else np.empty(0, dtype=int),
+              np.concatenate(cols) if cols else np.empty(0, dtype=int))),
+            shape=(len(skus), len(self.resource_names))
+        )
+        self._matrix_cache = (skus, matrix)
+        return matrix
+
+    def weekly_limits(self, weeks) -> np.ndarray:
+        """Dense week x resource matrix of limits (inf where a resource has no limit)."""
+        weeks = pd.DatetimeIndex(weeks)
+        limits = np.full((len(weeks), len(self.resources)), np.inf)
+        for j, resource in enumerate(self.resources):
+            if resource.get('weekly_limit') is not None:
+                limits[:, j] = float(resource['weekly_limit'])
+            overrides = resource.get('weekly_limits') or {}
+            if overrides:
+                override = pd.Series(overrides, dtype=float)
+                override.index = pd.to_datetime(override.index)
+                hit = weeks.isin(override.index)
+                limits[hit, j] = override.reindex(weeks[hit]).to_numpy()
+        return limits
+
+    def row_rates(self, plan: pd.DataFrame) -> sparse.csc_matrix:
+        """Sparse plan-row x resource matrix of consumption rates (for repeated solves on one plan)."""
+        sku_codes, skus = pd.factorize(plan['SKU'])
+        return self.consumption_matrix(skus)[sku_codes].tocsc()
+
+    def resource_load(self, plan: pd.DataFrame, value_col: str = 'Constrained_Plan', row_rates=None):
+        """
+        Load on every resource for every week.
+        Returns (weeks, load) where load is a dense week x resource array.
+        `row_rates` (from row_rates()) skips re-deriving the SKU routing for this plan.
+        """
+        week_codes, weeks = pd.factorize(plan['Date'], sort=True)
+        values = np.nan_to_num(plan[value_col].to_numpy(dtype=float))
+        if row_rates is None:
+            sku_codes, skus = pd.factorize(plan['SKU'])
+            # Duplicate (week, SKU) entries are summed by the sparse constructor
+            plan_matrix = sparse.csr_matrix((values, (week_codes, sku_codes)), shape=(len(weeks), len(skus)))
+            load = plan_matrix @ self.consumption_matrix(skus)
+        else:
+            plan_matrix = sparse.csr_matrix((values, (week_codes, np.arange(len(plan)))), shape=(len(weeks), len(plan)))
+            load = plan_matrix @ row_rates
+        return pd.DatetimeIndex(weeks), np.asarray(load.todense())
+
+    @staticmethod
+    def _over_limit(load: np.ndarray, limits: np.ndarray) -> np.ndarray:
+        # Ignore float noise from summing the cut plan back up to exactly the limit
+        return (load > limits) & ~np.isclose(load, limits)
+
+    def violations(self, plan: pd.DataFrame, value_col: str = 'Constrained_Plan') -> pd.DataFrame:
+        """Every (week, resource) whose load exceeds its limit."""
+        weeks, load = self.resource_load(plan, value_col)
+        limits = self.weekly_limits(weeks)
+        week_idx, res_idx = np.nonzero(self._over_limit(load, limits))
+        return pd.DataFrame({
+            'Date': weeks[week_idx],
+            'Resource': np.array(self.resource_names, dtype=object)[res_idx],
+            'Type': np.array([r.get('type', '') for r in self.resources], dtype=object)[res_idx],
+            'Load': load[week_idx, res_idx],
+            'Limit': limits[week_idx, res_idx],
+            'Shortage': load[week_idx, res_idx] - limits[week_idx, res_idx],
+        })
+
+    def negotiate(self, plan: pd.DataFrame, strategic_skus, value_col: str = 'Constrained_Plan', row_rates=None,
+                  row_priority=None):
+        """
+        Greedy cuts resource by resource, in config order (e.g. plants before lines).
+        Each resource only sees the SKUs routed through it, and later resources see
+        the plan after earlier cuts.
+
+        Returns (cuts, cut_log, violations) like greedy_capacity_cuts, with the
+        resource recorded on every log and violation record. `row_priority` (aligned
+        with the plan rows) replaces the strategic flag as the cut order.
+        """
+        cuts = np.zeros(len(plan))
+        if plan.empty:
+            return cuts, np.empty(0, dtype=CUT_LOG_DTYPE), np.empty(0, dtype=VIOLATION_DTYPE)
+
+        if row_rates is None:
+            row_rates = self.row_rates(plan)
+        # Column slices below rely on rows being in plan order within each resource
+        row_rates = sparse.csc_matrix(row_rates)
+        row_rates.sort_indices()
+        values = plan[value_col].to_numpy(dtype=float)
+        dates = plan['Date'].to_numpy()
+        plan_skus = plan['SKU'].to_numpy()
+
+        # Only resources that are actually over their limit somewhere need a pass
+        weeks, load = self.resource_load(plan, value_col, row_rates=row_rates)
+        weekly_limits = self.weekly_limits(weeks)
+        if self.is_single_total:
+            # Let the greedy pass apply its own exact weekly check
+            over = [0]
+        else:
+            over = np.flatnonzero(self._over_limit(load, weekly_limits).any(axis=0))
+
+        logs, violations = [], []
+        remaining = values.copy()
+        for j in over:
+            rows, sub_cuts, sub_log, sub_violations = self.negotiate_resource(
+                j, remaining, dates, plan_skus, row_rates, weeks, weekly_limits, strategic_skus,
+                value_col=value_col, row_priority=row_priority
+            )
+            cuts[rows] += sub_cuts
+            remaining[rows] -= sub_cuts
+            logs.append(sub_log)
+            violations.append(sub_violations)
+
+        cut_log = np.concatenate(logs) if logs else np.empty(0, dtype=CUT_LOG_DTYPE)
+        violations = np.concatenate(violations) if violations else np.empty(0, dtype=VIOLATION_DTYPE)
+        return cuts, cut_log, violations
+
+    def negotiate_resource(self, j: int, values, dates, plan_skus, row_rates: sparse.csc_matrix, weeks,
+                           weekly_limits, strategic_skus, value_col: str = 'Constrained_Plan', row_priority=None):
+        """
+        One greedy pass over resource `j`, on the rows routed through it.
+        `row_rates` must be a CSC matrix with sorted indices. Returns (rows, cuts, cut_log,
+        violations): the plan rows the resource sees, the cut on each of them, and the
+        log with rows mapped back onto the full plan.
+        """
+        resource = self.resources[j]
+        # Rows routed through this resource, straight from the sparse column
+        start, end = row_rates.indptr[j], row_rates.indptr[j + 1]
+        rows, rates = row_rates.indices[start:end], row_rates.data[start:end]
+        keep = rates > 0
+        rows, rates = rows[keep], rates[keep]
+        if len(rows) == 0:
+            return rows, np.zeros(0), np.empty(0, dtype=CUT_LOG_DTYPE), np.empty(0, dtype=VIOLATION_DTYPE)
+
+        sub = pd.DataFrame({
+            'Date': dates[rows],
+            'SKU': plan_skus[rows],
+            value_col: values[rows],
+        })
+        limits = pd.Series(weekly_limits[:, j], index=weeks)
+        sub_rates = None if np.all(rates == 1.0) else rates
+        sub_cuts, sub_log, sub_violations = greedy_capacity_cuts(
+            sub, limits, strategic_skus, value_col=value_col, rates=sub_rates, resource=resource['name'],
+            priority=None if row_priority is None else row_priority[rows]
+        )
+        # Map positions in the sub-frame back onto the full plan
+        sub_log['row'] = rows[sub_log['row']]
+        return rows, sub_cuts, sub_log, sub_violations
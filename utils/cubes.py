@@ -0,0 +1,221 @@
+import ast
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from utils.sandbox_pool import dataset_version
+
+PLAN_MEASURES = ['Baseline_P50', 'Plan', 'Constrained_Plan', 'Upside', 'Cut']
+SALES_MEASURES = ['Sales', 'Marketing_Spend']
+# Grains for the combined history + plan view charts are drawn from
+CHART_FREQUENCIES = {'month': 'MS', 'quarter': 'QS'}
+
+
+def segment_name(value) -> str:
+    """segmentation.csv holds the whole playbook per SKU; the segment is one field of it."""
+    if isinstance(value, str) and value.startswith('{'):
+        try:
+            return ast.literal_eval(value).get('segment', value)
+        except (ValueError, SyntaxError):
+            return value
+    if isinstance(value, dict):
+        return value.get('segment')
+    return value
+
+
+def build_cubes(sales_data: pd.DataFrame, final_plan: pd.DataFrame,
+                segmentation: Optional[pd.DataFrame] = None) -> Dict[str, pd.DataFrame]:
+    """
+    The aggregates the analyst, charts and dashboard keep asking for, at several grains:
+
+    - sales_by_week / sales_by_month / sales_by_sku / sales_by_sku_month / sales_by_segment_month
+    - plan_by_week / plan_by_month / plan_by_sku / plan_by_sku_month / plan_by_segment
+      (Baseline_P50, Plan, Constrained_Plan, Upside and Cut = Plan - Constrained_Plan;
+      the SKU and segment cubes also count Cut_Weeks)
+    - history_and_plan_by_<month|quarter> and history_and_plan_by_sku_<month|quarter>: every
+      numeric column of history and plan together, summed the way ChartAgent aggregates.
+    """
+    cubes = {}
+    sales = sales_data.assign(Date=pd.to_datetime(sales_data['Date']))
+    sales['Month'] = sales['Date'].dt.to_period('M').dt.to_timestamp()
+    plan = final_plan.assign(
+        Date=pd.to_datetime(final_plan['Date']),
+        Cut=final_plan['Plan'] - final_plan['Constrained_Plan'],
+    )
+    plan['Month'] = plan['Date'].dt.to_period('M').dt.to_timestamp()
+    plan['Cut_Weeks'] = (plan['Cut'] > 0).astype(int)
+    sales_measures = [c for c in SALES_MEASURES if c in sales.columns]
+    plan_measures = [c for c in PLAN_MEASURES if c in plan.columns]
+
+    cubes['sales_by_week'] = sales.groupby('Date', as_index=False)[sales_measures].sum()
+    cubes['sales_by_month'] = sales.groupby('Month', as_index=False)[sales_measures].sum()
+    cubes['sales_by_sku'] = sales.groupby('SKU', as_index=False)[sales_measures].sum()
+    cubes['sales_by_sku_month'] = sales.groupby(['SKU', 'Month'], as_index=False)[sales_measures].sum()
+    cubes['plan_by_week'] = plan.groupby('Date', as_index=False)[plan_measures].sum()
+    cubes['plan_by_month'] = plan.groupby('Month', as_index=False)[plan_measures].sum()
+    cubes['plan_by_sku'] = plan.groupby('SKU', as_index=False)[plan_measures + ['Cut_Weeks']].sum()
+    cubes['plan_by_sku_month'] = plan.groupby(['SKU', 'Month'], as_index=False)[plan_measures].sum()
+
+    if segmentation is not None and not segmentation.empty:
+        segments = segmentation[['SKU']].assign(Segment=segmentation['Segment'].map(segment_name))
+        cubes['sales_by_segment_month'] = (
+            sales.merge(segments, on='SKU').groupby(['Segment', 'Month'], as_index=False)[sales_measures].sum()
+        )
+        cubes['plan_by_segment'] = (
+            plan.merge(segments, on='SKU').groupby('Segment', as_index=False)[plan_measures + ['Cut_Weeks']].sum()
+        )
+
+    # Same frame and resampling as /api/chart + ChartAgent, so the chart cubes match a scan
+    combined = pd.concat([sales_data, final_plan], ignore_index=True)
+    combined['Date'] = pd.to_datetime(combined['Date'])
+    combined = combined.sort_values('Date')
+    numeric_cols = combined.select_dtypes(include=['number']).columns
+    for grain, freq in CHART_FREQUENCIES.items():
+        cubes[f'history_and_plan_by_{grain}'] = (
+            combined.set_index('Date').resample(freq)[numeric_cols].sum().reset_index()
+        )
+        cubes[f'history_and_plan_by_sku_{grain}'] = (
+            combined.groupby('SKU').resample(freq, on='Date')[numeric_cols].sum().reset_index()
+        )
+    return cubes
+
+
+class CubeStore:
+    """
+    Materialised analytic cubes, rebuilt at the end of each planning cycle.
+
+    Each cube is a CSV in `directory` (there is no columnar store in this project), listed
+    in index.json with its dimensions, measures, row count and the dataset version it
+    was built from. Readers get lookups instead of scans: `load(name)` returns the cube
+    (cached in memory until the index changes) and `lookup(name, SKU=...)` filters it on
+    its dimensions. A cube is only `fresh` while the data it was built from is unchanged.
+    """
+
+    def __init__(self, directory: str = "data/cubes", data_dir: str = "data", enabled: bool = True):
+        self.directory = directory
+        self.data_dir = data_dir
+        self.enabled = enabled
+        self._index: Optional[Dict] = None
+        self._index_mtime = None
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._stale = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "CubeStore":
+        cube_config = (config or {}).get('cubes') or {}
+        return cls(
+            directory=cube_config.get('directory', "data/cubes"),
+            data_dir=(config or {}).get('sandbox', {}).get('data_dir', "data"),
+            enabled=cube_config.get('enabled', True),
+        )
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def materialise(self, sales_data: pd.DataFrame = None, final_plan: pd.DataFrame = None,
+                    segmentation: pd.DataFrame = None) -> Dict:
+        """Builds every cube (from the CSVs in data_dir by default) and writes them with a new index."""
+        def read(name):
+            path = os.path.join(self.data_dir, f"{name}.csv")
+            return pd.read_csv(path) if os.path.exists(path) else None
+        sales_data = sales_data if sales_data is not None else read("sales_data")
+        final_plan = final_plan if final_plan is not None else read("final_plan")
+        segmentation = segmentation if segmentation is not None else read("segmentation")
+
+        cubes = build_cubes(sales_data, final_plan, segmentation)
+        os.makedirs(self.directory, exist_ok=True)
+        entries = {}
+        for name, df in cubes.items():
+            df.to_csv(os.path.join(self.directory, f"{name}.csv"), index=False)
+            dims = [c for c in df.columns if c in ('SKU', 'Segment', 'Date', 'Month')]
+            entries[name] = {
+                'file': f"{name}.csv",
+                'dimensions': dims,
+                'measures': [c for c in df.columns if c not in dims],
+                'rows': len(df),
+            }
+        index = {
+            'version': dataset_version(self.data_dir),
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'cubes': entries,
+        }
+        # Index last, and atomically: readers never see it point at half-written cubes
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+        with self._lock:
+            self._stale = False
+        return index
+
+    def index(self) -> Dict:
+        """The current index.json ({} when nothing was materialised), re-read when it changes."""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            if mtime != self._index_mtime:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+                self._index_mtime = mtime
+                self._frames.clear()
+            return self._index
+
+    def names(self) -> List[str]:
+        return list(self.index().get('cubes', {}))
+
+    def mark_stale(self):
+        """The data changed without a new cycle (e.g. plan edits in memory): stop serving cubes."""
+        with self._lock:
+            self._stale = True
+
+    @property
+    def fresh(self) -> bool:
+        index = self.index()
+        return self.enabled and not self._stale and bool(index) and index.get('version') == dataset_version(self.data_dir)
+
+    def load(self, name: str) -> Optional[pd.DataFrame]:
+        """The cube as a DataFrame, or None if it isn't materialised or is out of date."""
+        if not self.fresh:
+            return None
+        entry = self.index().get('cubes', {}).get(name)
+        if entry is None:
+            return None
+        with self._lock:
+            df = self._frames.get(name)
+            if df is None:
+                dates = [c for c in ('Date', 'Month') if c in entry['dimensions']]
+                df = pd.read_csv(os.path.join(self.directory, entry['file']), parse_dates=dates,
+                                 float_precision='round_trip')
+                self._frames[name] = df
+        return df
+
+    def lookup(self, name: str, **filters) -> Optional[pd.DataFrame]:
+        """Rows of a cube matching the given dimension values, e.g. lookup('plan_by_sku', SKU='SKU_001')."""
+        df = self.load(name)
+        if df is None:
+            return None
+        for column, value in filters.items():
+            if value is not None and column in df.columns:
+                df = df[df[column] == value]
+        return df
+
+
+_store: Optional[CubeStore] = None
+_store_lock = threading.Lock()
+
+
+def get_cube_store(config: Dict = None) -> CubeStore:
+    """The process-wide cube store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CubeStore.from_config(config)
+        return _store
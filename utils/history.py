@@ -0,0 +1,193 @@
+import contextvars
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from utils.tokens import estimate_tokens
+
+DEFAULT_SESSION = "default"
+
+# Chat session the current request belongs to (the API sets it per request). Follows
+# calls into tool threads, like the scheduler's request priority.
+current_session = contextvars.ContextVar('history_session', default=DEFAULT_SESSION)
+
+
+@contextmanager
+def session(session_id: Optional[str]):
+    """Runs the enclosed agent calls against the history of the given chat session."""
+    token = current_session.set(session_id or DEFAULT_SESSION)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+class HistoryManager:
+    """
+    Conversation history for one agent, kept within a token budget.
+
+    - Data payloads are stripped when a turn is stored; the model already answered about
+      them. That covers very long lines and tables: runs of more than `max_table_rows`
+      comma-separated lines (the compact CSV PayloadEncoder puts in prompts) keep only
+      their header row.
+    - The last `keep_turns` turns are sent verbatim.
+    - Older turns are folded into a short extractive summary (no model call), which
+      itself is capped at `summary_tokens` by dropping its oldest lines.
+    - If the window is still over `max_tokens`, the oldest verbatim turns move into
+      the summary until it fits.
+
+    So the history sent with each request stops growing with the age of the session.
+    """
+
+    SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+    def __init__(self, max_tokens: int = 4000, keep_turns: int = 6, summary_tokens: int = 500,
+                 max_line_chars: int = 400, max_table_rows: int = 3):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.max_line_chars = max_line_chars
+        self.max_table_rows = max_table_rows
+        self._turns: List[tuple] = []      # (user, model) text, already stripped
+        self._summary: List[str] = []      # one line per folded turn
+        self._contents = None              # built window, reused until the history changes
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "HistoryManager":
+        history_config = (config or {}).get('history') or {}
+        return cls(
+            max_tokens=history_config.get('max_tokens', 4000),
+            keep_turns=history_config.get('keep_turns', 6),
+            summary_tokens=history_config.get('summary_tokens', 500),
+            max_line_chars=history_config.get('max_line_chars', 400),
+            max_table_rows=history_config.get('max_table_rows', 3),
+        )
+
+    def strip_payload(self, text: str) -> str:
+        """Shortens lines and tables that are data rather than conversation."""
+        if not text or len(text) <= self.max_line_chars:
+            return text or ""
+        lines = []
+        for line in self._collapse_tables(text.splitlines()):
+            if len(line) > self.max_line_chars:
+                keep = self.max_line_chars // 2
+                line = f"{line[:keep]} ... [{len(line) - keep} chars of data omitted]"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def _collapse_tables(self, lines: List[str]) -> List[str]:
+        """Replaces CSV blocks (consecutive lines with the same number of commas) by their header."""
+        out, i = [], 0
+        while i < len(lines):
+            commas = lines[i].count(',')
+            end = i + 1
+            if commas:
+                while end < len(lines) and lines[end].count(',') == commas:
+                    end += 1
+            rows = end - i - 1  # the first line is the header
+            if rows > self.max_table_rows:
+                # PayloadEncoder's '# N rows ...' note above the header is kept as is
+                out.append(f"{lines[i]} ... [{rows} rows of data omitted]")
+            else:
+                out.extend(lines[i:end])
+            i = end
+        return out
+
+    @staticmethod
+    def _summarize(user: str, model: str) -> str:
+        def first(text, n):
+            text = " ".join(text.split())
+            return text if len(text) <= n else text[:n] + "..."
+        return f"- User: {first(user, 120)} | Agent: {first(model, 160)}"
+
+    def add_turn(self, user: str, model: str):
+        with self._lock:
+            self._turns.append((self.strip_payload(user), self.strip_payload(model)))
+            self._contents = None
+
+    def clear(self):
+        with self._lock:
+            self._turns = []
+            self._summary = []
+            self._contents = None
+
+    def _fold_oldest(self):
+        user, model = self._turns.pop(0)
+        self._summary.append(self._summarize(user, model))
+        while len(self._summary) > 1 and estimate_tokens("\n".join(self._summary)) > self.summary_tokens:
+            self._summary.pop(0)
+
+    def _window_tokens(self) -> int:
+        return (estimate_tokens("\n".join(self._summary))
+                + sum(estimate_tokens(u) + estimate_tokens(m) for u, m in self._turns))
+
+    def contents(self) -> list:
+        """The history to send with the next request, as a list of types.Content."""
+        with self._lock:
+            if self._contents is not None:
+                return list(self._contents)
+
+            while len(self._turns) > self.keep_turns:
+                self._fold_oldest()
+            while self._turns and self._window_tokens() > self.max_tokens:
+                self._fold_oldest()
+
+            from google.genai import types
+            contents = []
+            if self._summary:
+                contents.append(types.Content(role="user", parts=[
+                    types.Part(text=self.SUMMARY_HEADER + "\n" + "\n".join(self._summary))
+                ]))
+                contents.append(types.Content(role="model", parts=[types.Part(text="Understood.")]))
+            for user, model in self._turns:
+                contents.append(types.Content(role="user", parts=[types.Part(text=user)]))
+                contents.append(types.Content(role="model", parts=[types.Part(text=model)]))
+            self._contents = contents
+            return list(contents)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'turns': len(self._turns),
+                'summary_lines': len(self._summary),
+                'tokens': self._window_tokens(),
+            }
+
+    def __len__(self) -> int:
+        return len(self.contents())
+
+
+class SessionHistories:
+    """
+    One HistoryManager per chat session for an agent, so concurrent sessions on a shared
+    agent don't read or overwrite each other's turns. Sessions beyond `max_sessions`
+    are dropped, least recently used first.
+    """
+
+    def __init__(self, config: Dict = None, max_sessions: int = 100):
+        self.config = config
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, HistoryManager]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SessionHistories":
+        history_config = (config or {}).get('history') or {}
+        return cls(config, max_sessions=history_config.get('max_sessions', 100))
+
+    def get(self, session_id: Optional[str] = None) -> HistoryManager:
+        """The history of a session (default: the current one), created on first use."""
+        session_id = session_id or current_session.get()
+        with self._lock:
+            manager = self._sessions.get(session_id)
+            if manager is None:
+                manager = self._sessions[session_id] = HistoryManager.from_config(self.config)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return manager
+
+    def __len__(self) -> int:
+        return len(self._sessions)
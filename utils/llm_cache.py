@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+def make_cache_key(**parts: Any) -> str:
+    """Stable hash of everything that determines a model response (model, instruction, history, tools, prompt, sampling)."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of raw model responses, stored in a small SQLite file.
+
+    Only the model's response is cached, never tool results: on a hit the agent still
+    executes any function calls in the response, so tool side effects (cuts, saved
+    insights) happen exactly as they would on a live call.
+
+    Entries expire after `ttl_seconds`. When the cache holds more than `max_entries`
+    entries or `max_size_mb` of responses, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = "data/llm_cache.sqlite", ttl_seconds: Optional[float] = 86400,
+                 max_entries: int = 5000, max_size_mb: float = 100, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if enabled:
+            self._connect()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ResponseCache":
+        cache_config = (config or {}).get('cache') or {}
+        return cls(
+            path=cache_config.get('path', "data/llm_cache.sqlite"),
+            ttl_seconds=cache_config.get('ttl_seconds', 86400),
+            max_entries=cache_config.get('max_entries', 5000),
+            max_size_mb=cache_config.get('max_size_mb', 100),
+            enabled=cache_config.get('enabled', True),
+        )
+
+    def _connect(self):
+        try:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+            self._conn.commit()
+        except Exception as e:
+            print(f"[ResponseCache] Error opening cache, caching disabled: {e}")
+            self._conn = None
+            self.enabled = False
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Returns the cached response dict, or None on a miss or an expired entry."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, response: Dict, model: str = None):
+        if not self.enabled:
+            return
+        payload = json.dumps(response, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, model, payload, len(payload), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drops expired entries, then least recently used ones until under the entry and size limits."""
+        if self.ttl_seconds:
+            cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self.expired += max(cur.rowcount, 0)
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        over_count = count - self.max_entries if self.max_entries else 0
+        over_bytes = total - self.max_bytes if self.max_bytes else 0
+        if over_count <= 0 and over_bytes <= 0:
+            return
+
+        # Walk from the least recently used entry until both limits hold
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if over_count <= 0 and over_bytes <= 0:
+                break
+            victims.append((key,))
+            over_count -= 1
+            over_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size = 0, 0
+        if self.enabled:
+            with self._lock:
+                entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "size_bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+_caches: Dict[str, ResponseCache] = {}
+
+
+def get_response_cache(config: Dict) -> ResponseCache:
+    """One cache per cache file, shared by every agent in the process (so counters are per process)."""
+    cache_config = (config or {}).get('cache') or {}
+    path = cache_config.get('path', "data/llm_cache.sqlite")
+    if path not in _caches:
+        _caches[path] = ResponseCache.from_config(config)
+    return _caches[path]
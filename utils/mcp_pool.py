@@ -0,0 +1,236 @@
+import asyncio
+import atexit
+import importlib
+import itertools
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class _Slot:
+    """One long-lived session and its state, owned by the pool's event loop."""
+
+    def __init__(self):
+        self.session = None
+        self.ready = asyncio.Event()
+        self.broken = asyncio.Event()
+
+
+class MCPSessionPool:
+    """
+    A few long-lived MCP client sessions to a stdio server, shared by the whole process.
+
+    Spawning the server and running the MCP handshake costs hundreds of milliseconds, so
+    it happens once per session instead of once per call. The sessions live on a
+    background event loop thread, so callers can be plain threads, tool workers or other
+    event loops. Calls are spread round-robin over the sessions and each session serves
+    many concurrent requests. A session whose transport fails (closed stream, server
+    exited) is torn down and reconnected, and the call is retried on another session (or
+    the reconnected one). A call that times out or that the server rejects only fails
+    for its own caller; the session keeps serving everyone else.
+    """
+
+    def __init__(self, script: str, size: int = 2, call_timeout: float = 10.0, connect_timeout: float = 15.0):
+        self.script = script
+        self.size = max(1, size)
+        self.call_timeout = call_timeout
+        self.connect_timeout = connect_timeout
+        self._slots: List[_Slot] = []
+        self._next = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=loop.run_forever, name="mcp-pool", daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._start(), loop).result()
+            self._loop = loop
+            atexit.register(self.close)
+
+    async def _start(self):
+        self._slots = [_Slot() for _ in range(self.size)]
+        for slot in self._slots:
+            asyncio.create_task(self._keep_open(slot))
+
+    async def _keep_open(self, slot: _Slot):
+        """Holds one session open, reconnecting with backoff until the pool closes."""
+        # Imported here so building agents doesn't pay for the MCP client
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+
+        params = StdioServerParameters(command=sys.executable, args=[self.script], env=None)
+        delay = 0.5
+        while not self._closed:
+            try:
+                async with stdio_client(params) as (read, write):
+                    async with ClientSession(read, write) as session:
+                        await session.initialize()
+                        slot.session = session
+                        slot.broken.clear()
+                        slot.ready.set()
+                        delay = 0.5
+                        await slot.broken.wait()
+            except Exception as e:
+                print(f"[MCPPool] Session to {self.script} failed: {e}")
+            finally:
+                slot.session = None
+                slot.ready.clear()
+            if not self._closed:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10.0)
+
+    async def _pick(self) -> _Slot:
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            ready = [slot for slot in self._slots if slot.ready.is_set()]
+            if ready:
+                return ready[next(self._next) % len(ready)]
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No MCP session to {self.script} became ready")
+            await asyncio.sleep(0.01)
+
+    @staticmethod
+    def _is_transport_error(e: Exception) -> bool:
+        """True when the session itself is gone, rather than just this one call failing."""
+        import anyio
+        from mcp.shared.exceptions import McpError
+        from mcp.types import CONNECTION_CLOSED
+
+        if isinstance(e, McpError):
+            return e.error.code == CONNECTION_CLOSED
+        return isinstance(e, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream,
+                              ConnectionError, EOFError))
+
+    async def _call(self, tool: str, arguments: Dict) -> str:
+        # One attempt per session plus one on a reconnected session, in case the server died
+        attempts = self.size + 1
+        for attempt in range(attempts):
+            slot = await self._pick()
+            session = slot.session
+            if session is None:
+                # Dropped between the pick and the call
+                continue
+            try:
+                result = await asyncio.wait_for(session.call_tool(tool, arguments=arguments), self.call_timeout)
+                break
+            except Exception as e:
+                # A slow or rejected call is this caller's problem; other calls on the session are fine
+                if not self._is_transport_error(e):
+                    raise
+                # Drop the session (it reconnects in the background) and retry elsewhere
+                if slot.session is session:
+                    slot.ready.clear()
+                    slot.broken.set()
+                if attempt == attempts - 1:
+                    raise
+        else:
+            raise TimeoutError(f"No MCP session to {self.script} stayed up for the call")
+        # Result is a list of content, we want the text
+        if result.content:
+            return result.content[0].text
+        return "No content returned."
+
+    def call_tool(self, tool: str, arguments: Dict) -> str:
+        """Calls a server tool from any thread and returns its text result."""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._call(tool, arguments), self._loop).result()
+
+    async def acall_tool(self, tool: str, arguments: Dict) -> str:
+        """call_tool() for code already on an event loop."""
+        self._ensure_started()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._call(tool, arguments), self._loop))
+
+    async def _shutdown(self):
+        for slot in self._slots:
+            slot.broken.set()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=5)
+
+    def close(self):
+        """Stops the server processes and the loop thread."""
+        if self._loop is None or self._closed:
+            return
+        self._closed = True
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=10)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+class InProcessTransport:
+    """
+    Same interface as MCPSessionPool, but calls the server's tool functions directly
+    in this process: no subprocess, no stdio, no JSON-RPC. For evals, benchmarks and
+    batch runs; the stdio pool stays the default for isolation.
+    """
+
+    def __init__(self, script: str):
+        self.script = script
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _server(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    # servers/config_server.py -> servers.config_server
+                    name = os.path.splitext(os.path.normpath(self.script))[0].replace(os.sep, ".")
+                    self._module = importlib.import_module(name)
+        return self._module
+
+    def call_tool(self, tool: str, arguments: Dict) -> str:
+        # Only functions registered with the server's FastMCP instance are callable
+        registered = self._server().mcp._tool_manager.get_tool(tool)
+        if registered is None:
+            raise ValueError(f"Unknown tool: {tool}")
+        return str(registered.fn(**arguments))
+
+    async def acall_tool(self, tool: str, arguments: Dict) -> str:
+        return self.call_tool(tool, arguments)
+
+    def close(self):
+        pass
+
+
+TRANSPORTS = ("stdio", "inprocess")
+
+_pools: Dict[tuple, object] = {}
+_pools_lock = threading.Lock()
+
+
+def get_mcp_pool(config: Dict, script: str = "servers/config_server.py"):
+    """
+    The process-wide client for a server script. `policy_server.transport` (or the
+    POLICY_SERVER_TRANSPORT env var) picks the stdio session pool (default) or the
+    in-process transport.
+    """
+    server_config = (config or {}).get('policy_server') or {}
+    transport = os.environ.get("POLICY_SERVER_TRANSPORT", server_config.get('transport', 'stdio')).lower()
+    if transport not in TRANSPORTS:
+        print(f"[MCPPool] Unknown transport '{transport}', using stdio.")
+        transport = "stdio"
+    with _pools_lock:
+        key = (script, transport)
+        if key not in _pools:
+            if transport == "inprocess":
+                _pools[key] = InProcessTransport(script)
+            else:
+                _pools[key] = MCPSessionPool(
+                    script,
+                    size=server_config.get('pool_size', 2),
+                    call_timeout=server_config.get('call_timeout_seconds', 10.0),
+                )
+        return _pools[key]
@@ -1,5 +1,6 @@
 import json
 import os
+import threading
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
@@ -10,6 +11,8 @@ class MemoryStore:
         if cls._instance is None:
             cls._instance = super(MemoryStore, cls).__new__(cls)
             cls._instance.filepath = filepath
+            # Concurrent chat sessions log through the same store
+            cls._instance._lock = threading.Lock()
             cls._instance._load()
         return cls._instance
 
@@ -39,13 +42,15 @@ class MemoryStore:
             "user_query": user_query,
             "agent_response": agent_response
         }
-        self.data["interactions"].append(interaction)
-        self._save()
+        with self._lock:
+            self.data["interactions"].append(interaction)
+            self._save()
 
     def save_insight(self, key: str, value: str) -> str:
         """Saves a specific insight or fact."""
-        self.data["insights"][key] = value
-        self._save()
+        with self._lock:
+            self.data["insights"][key] = value
+            self._save()
         return f"Insight saved: {key} = {value}"
 
     def get_insight(self, key: str) -> str:
@@ -0,0 +1,181 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+# Orchestrator step the current code runs in ("" outside a planning cycle).
+# A context variable, so it follows the step into tool threads and async tasks.
+current_step = contextvars.ContextVar('current_step', default="")
+
+# Help text for the Prometheus export; also the list of known metric names
+METRIC_HELP = {
+    'agent_model_latency_seconds': ("summary", "Latency of model calls sent to the API (cache misses)."),
+    'agent_prompt_tokens_total': ("counter", "Prompt tokens reported by the model."),
+    'agent_response_tokens_total': ("counter", "Response tokens reported by the model."),
+    'agent_cache_hits_total': ("counter", "Model calls served from the response cache."),
+    'agent_queue_wait_seconds': ("summary", "Time model calls waited for the request scheduler."),
+    'agent_retries_total': ("counter", "Model calls retried after a transient error."),
+    'agent_errors_total': ("counter", "Model calls that failed."),
+    'agent_tool_errors_total': ("counter", "Tool calls that raised."),
+    'agent_tool_duration_seconds': ("summary", "Tool call duration."),
+    'analyst_query_cache_hits_total': ("counter", "Analyst queries answered from the result cache."),
+    'orchestrator_runs_total': ("counter", "Planning cycles run."),
+    'orchestrator_step_duration_seconds': ("summary", "Planning cycle step duration."),
+}
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and summaries (count / sum / max), each keyed by name and labels.
+    Thread-safe; agents, tools and the orchestrator all record into the same registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[tuple, float] = {}
+        self._summaries: Dict[tuple, list] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'summaries': {k: list(v) for k, v in self._summaries.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+    def report(self, since: Optional[dict] = None) -> dict:
+        """
+        JSON-friendly view grouped by agent, tool and step. With `since` (an earlier
+        snapshot()), only what was recorded after it is reported; max is then omitted
+        since it can't be subtracted.
+        """
+        snap = self.snapshot()
+        base = since or {'counters': {}, 'summaries': {}}
+        series = []
+        for (name, labels), value in snap['counters'].items():
+            value -= base['counters'].get((name, labels), 0)
+            if value:
+                series.append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), (count, total, peak) in snap['summaries'].items():
+            prev = base['summaries'].get((name, labels), [0, 0.0, 0.0])
+            count, total = count - prev[0], total - prev[1]
+            if count:
+                entry = {'name': name, 'labels': dict(labels), 'count': count, 'sum': round(total, 6),
+                         'mean': round(total / count, 6)}
+                if since is None:
+                    entry['max'] = round(peak, 6)
+                series.append(entry)
+
+        # Per-agent totals, the first thing to look at when a cycle is slow
+        agents = {}
+        for s in series:
+            agent = s['labels'].get('agent')
+            if not agent:
+                continue
+            totals = agents.setdefault(agent, {'model_calls': 0, 'model_seconds': 0.0, 'prompt_tokens': 0,
+                                               'response_tokens': 0, 'cache_hits': 0, 'tool_calls': 0,
+                                               'tool_seconds': 0.0, 'retries': 0})
+            if s['name'] == 'agent_model_latency_seconds':
+                totals['model_calls'] += s['count']
+                totals['model_seconds'] = round(totals['model_seconds'] + s['sum'], 6)
+            elif s['name'] == 'agent_prompt_tokens_total':
+                totals['prompt_tokens'] += s['value']
+            elif s['name'] == 'agent_response_tokens_total':
+                totals['response_tokens'] += s['value']
+            elif s['name'] == 'agent_cache_hits_total':
+                totals['cache_hits'] += s['value']
+            elif s['name'] == 'agent_tool_duration_seconds':
+                totals['tool_calls'] += s['count']
+                totals['tool_seconds'] = round(totals['tool_seconds'] + s['sum'], 6)
+            elif s['name'] == 'agent_retries_total':
+                totals['retries'] += s['value']
+
+        steps = {
+            s['labels']['step']: s['sum'] for s in series
+            if s['name'] == 'orchestrator_step_duration_seconds'
+        }
+        return {'agents': agents, 'steps': steps, 'series': series}
+
+    def write_report(self, path: str = "data/run_report.json", since: Optional[dict] = None, **extra) -> dict:
+        report = {'generated_at': datetime.now().isoformat(), **extra, **self.report(since)}
+        try:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+        except Exception as e:
+            print(f"[Metrics] Error writing run report: {e}")
+        return report
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (summaries as _count/_sum, plus a separate _max gauge)."""
+        snap = self.snapshot()
+
+        def fmt(labels):
+            if not labels:
+                return ""
+            escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+        def number(value):
+            # Full precision: %g would turn a 1234567-token counter into 1.23457e+06
+            value = float(value)
+            return str(int(value)) if value.is_integer() else repr(value)
+
+        by_name = {}
+        for (name, labels), value in snap['counters'].items():
+            by_name.setdefault(name, []).append(f"{name}{fmt(labels)} {number(value)}")
+        for (name, labels), (count, total, peak) in snap['summaries'].items():
+            by_name.setdefault(name, []).extend([
+                f"{name}_count{fmt(labels)} {count}",
+                f"{name}_sum{fmt(labels)} {number(total)}",
+            ])
+            by_name.setdefault(f"{name}_max", []).append(f"{name}_max{fmt(labels)} {number(peak)}")
+
+        lines = []
+        for name in sorted(by_name):
+            if name.endswith("_max"):
+                kind, help_text = "gauge", f"Largest observed {name[:-len('_max')]}."
+            else:
+                kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(sorted(by_name[name]))
+        return "\n".join(lines) + "\n"
+
+
+# The registry shared by the whole process
+metrics = MetricsRegistry()
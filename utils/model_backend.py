@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+MODES = ("live", "record", "replay")
+
+
+class CassetteMissError(RuntimeError):
+    """Replay mode got a request that was never recorded."""
+
+
+class LiveBackend:
+    """Sends requests to Gemini through the runtime's client."""
+
+    mode = "live"
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    @property
+    def ready(self) -> bool:
+        """Whether requests can be served (live calls need an API key)."""
+        return self.runtime.client is not None
+
+    def generate(self, key: str, model: str, contents, config):
+        return self.runtime.client.models.generate_content(model=model, contents=contents, config=config)
+
+    async def agenerate(self, key: str, model: str, contents, config):
+        return await self.runtime.client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+
+class RecordBackend(LiveBackend):
+    """
+    Live calls, with every request/response pair (function calls included) written to a
+    cassette file named after the request key, so it can be replayed offline later.
+    """
+
+    mode = "record"
+
+    def __init__(self, runtime, cassette_dir: str):
+        super().__init__(runtime)
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+
+    def _save(self, key: str, model: str, contents, response, seconds: float):
+        entry = {
+            'key': key,
+            'model': model,
+            'recorded_at': datetime.now().isoformat(),
+            'latency_seconds': round(seconds, 4),
+            'request': [c.model_dump(mode='json', exclude_none=True) for c in contents],
+            'response': response.model_dump(mode='json', exclude_none=True, exclude={'sdk_http_response'}),
+        }
+        path = os.path.join(self.cassette_dir, f"{key}.json")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(entry, f, indent=1)
+        os.replace(tmp, path)
+
+    def generate(self, key: str, model: str, contents, config):
+        start = time.perf_counter()
+        response = super().generate(key, model, contents, config)
+        self._save(key, model, contents, response, time.perf_counter() - start)
+        return response
+
+    async def agenerate(self, key: str, model: str, contents, config):
+        start = time.perf_counter()
+        response = await super().agenerate(key, model, contents, config)
+        await asyncio.to_thread(self._save, key, model, contents, response, time.perf_counter() - start)
+        return response
+
+
+class ReplayBackend:
+    """
+    Serves recorded responses from cassette files, with no network and no API key.
+    Simulated latency is `latency_ms` when set, otherwise the recorded latency
+    times `latency_scale` (0 replays as fast as possible).
+    """
+
+    mode = "replay"
+    ready = True
+
+    def __init__(self, cassette_dir: str, latency_ms: Optional[float] = None, latency_scale: float = 1.0):
+        self.cassette_dir = cassette_dir
+        self.latency_ms = latency_ms
+        self.latency_scale = latency_scale
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, key: str) -> dict:
+        entry = self._entries.get(key)
+        if entry is None:
+            path = os.path.join(self.cassette_dir, f"{key}.json")
+            if not os.path.exists(path):
+                raise CassetteMissError(f"No recorded response for request {key[:12]} in {self.cassette_dir}")
+            with open(path) as f:
+                entry = json.load(f)
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def _latency(self, entry: dict) -> float:
+        if self.latency_ms is not None:
+            return self.latency_ms / 1000
+        return entry.get('latency_seconds', 0) * self.latency_scale
+
+    @staticmethod
+    def _response(entry: dict):
+        from google.genai import types
+        return types.GenerateContentResponse.model_validate(entry['response'])
+
+    def generate(self, key: str, model: str, contents, config):
+        entry = self._load(key)
+        time.sleep(self._latency(entry))
+        return self._response(entry)
+
+    async def agenerate(self, key: str, model: str, contents, config):
+        entry = self._load(key)
+        await asyncio.sleep(self._latency(entry))
+        return self._response(entry)
+
+
+def create_backend(runtime, config: Dict):
+    """
+    Builds the backend from the `model_backend` config section. The MODEL_BACKEND and
+    MODEL_CASSETTE_DIR environment variables override the mode and cassette directory.
+    """
+    backend_config = (config or {}).get('model_backend') or {}
+    mode = os.environ.get("MODEL_BACKEND", backend_config.get('mode', 'live')).lower()
+    cassette_dir = os.environ.get("MODEL_CASSETTE_DIR", backend_config.get('cassette_dir', "data/cassettes"))
+    if mode not in MODES:
+        print(f"[ModelBackend] Unknown mode '{mode}', using live.")
+        mode = "live"
+
+    if mode == "record":
+        return RecordBackend(runtime, cassette_dir)
+    if mode == "replay":
+        return ReplayBackend(
+            cassette_dir,
+            latency_ms=backend_config.get('replay_latency_ms'),
+            latency_scale=backend_config.get('replay_latency_scale', 1.0),
+        )
+    return LiveBackend(runtime)
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+# One record per cut applied to a SKU-week (the negotiation ledger).
+# 'row' is the positional index into the plan frame the cuts were computed on.
+CUT_LOG_DTYPE = np.dtype([
+    ('row', np.int64),
+    ('date', 'datetime64[ns]'),
+    ('sku', object),
+    ('cut', np.float64),
+    ('resource', object),
+    ('reason', object),
+    ('actor', object),
+])
+
+# Actor recorded for cuts made by the greedy capacity pass
+GREEDY_ACTOR = "Greedy"
+
+# One record per week whose demand exceeded capacity.
+VIOLATION_DTYPE = np.dtype([
+    ('date', 'datetime64[ns]'),
+    ('demand', np.float64),
+    ('limit', np.float64),
+    ('shortage', np.float64),
+    ('resource', object),
+])
+
+
+def greedy_capacity_cuts(plan: pd.DataFrame, capacity_limit, strategic_skus,
+                         value_col: str = 'Constrained_Plan', rates=None, resource: str = 'total',
+                         priority=None):
+    """
+    Vectorized version of the greedy capacity cut.
+
+    Same policy as the original per-week loop: in every week whose total demand
+    exceeds `capacity_limit`, cut non-strategic SKUs first, largest volume first,
+    until the shortage is covered. Ties keep the original row order.
+
+    Instead of copying each week's group and walking it with iterrows, the plan is
+    sorted once by (Date, is_strategic, volume). Weekly totals are one reduceat over
+    the week-sorted values, and the remaining shortage before each row of every
+    violating week comes from one cumulative sum over all of them, less the running
+    total at the start of the row's week.
+
+    `capacity_limit` is either a scalar or a Series of limits indexed by Date.
+    `rates` optionally gives the units of the resource each plan unit consumes
+    (aligned with the rows of `plan`); shortages are then covered in resource units
+    and converted back to plan units. `resource` is only used to label the logs.
+    `priority` optionally replaces the strategic flag as the cut order: a row-aligned
+    array where lower values are cut first (e.g. CompiledPolicy.priority_weights).
+
+    Returns:
+        cuts: float array aligned with the rows of `plan` (0 where nothing was cut).
+        cut_log: structured array (CUT_LOG_DTYPE), one record per cut row.
+        violations: structured array (VIOLATION_DTYPE), one record per violating week.
+    """
+    n = len(plan)
+    cuts = np.zeros(n)
+    if n == 0:
+        return cuts, np.empty(0, dtype=CUT_LOG_DTYPE), np.empty(0, dtype=VIOLATION_DTYPE)
+
+    values = plan[value_col].to_numpy(dtype=float)
+    # Resource units consumed by each row (same as the plan when no rates are given)
+    load = values if rates is None else values * np.asarray(rates, dtype=float)
+    if priority is None:
+        priority = plan['SKU'].isin(list(strategic_skus or [])).to_numpy()
+    week_codes, weeks = pd.factorize(plan['Date'], sort=True)
+
+    # Weekly totals, summed in original row order within each week
+    by_week = np.argsort(week_codes, kind='stable')
+    week_bounds = np.searchsorted(week_codes[by_week], np.arange(len(weeks) + 1))
+    week_values = np.where(np.isnan(load), 0.0, load)[by_week]
+    # reduceat needs in-range starts and returns the element itself for an empty slice
+    empty_weeks = week_bounds[:-1] == week_bounds[1:]
+    totals = np.add.reduceat(week_values, np.minimum(week_bounds[:-1], n - 1))
+    totals[empty_weeks] = 0.0
+
+    if isinstance(capacity_limit, pd.Series):
+        limits = capacity_limit.reindex(pd.DatetimeIndex(weeks)).to_numpy(dtype=float)
+        limits = np.where(np.isnan(limits), np.inf, limits)
+    else:
+        limits = np.full(len(weeks), float(capacity_limit))
+
+    violating = np.flatnonzero(totals > limits)
+    violations = np.empty(len(violating), dtype=VIOLATION_DTYPE)
+    violations['date'] = np.asarray(weeks[violating], dtype='datetime64[ns]')
+    violations['demand'] = totals[violating]
+    violations['limit'] = limits[violating]
+    violations['shortage'] = totals[violating] - limits[violating]
+    violations['resource'] = resource
+    if len(violating) == 0:
+        return cuts, np.empty(0, dtype=CUT_LOG_DTYPE), violations
+
+    # Single sort: week, then non-strategic (lower priority) first, then largest volume first.
+    # lexsort is stable, so ties keep their original order like sort_values did.
+    order = np.lexsort((-values, priority, week_codes))
+    # Only positive volume can be cut (rows at or below zero never consume shortage).
+    sorted_cuttable = np.where(load[order] > 0, load[order], 0.0)
+    sorted_weeks = week_codes[order]
+
+    # Rows of all violating weeks at once, still grouped by week in sorted order
+    shortage_by_week = np.zeros(len(weeks))
+    shortage_by_week[violating] = violations['shortage']
+    rows = np.flatnonzero(shortage_by_week[sorted_weeks] > 0)
+    seg = sorted_cuttable[rows]
+    # Volume ahead of each row: a running total over every violating week, less the
+    # running total where the row's week starts
+    ahead = np.concatenate(([0.0], np.cumsum(seg)[:-1]))
+    group_weeks = sorted_weeks[rows]
+    starts = np.flatnonzero(np.r_[True, group_weeks[1:] != group_weeks[:-1]])
+    ahead -= np.repeat(ahead[starts], np.diff(np.r_[starts, len(rows)]))
+    remaining = shortage_by_week[group_weeks] - ahead
+    cuts[order[rows]] = np.where(remaining > 0, np.minimum(seg, remaining), 0.0)
+
+    if rates is not None:
+        # Back from resource units to plan units (never more than the row holds)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cuts = np.where(cuts > 0, np.minimum(cuts / np.asarray(rates, dtype=float), values), 0.0)
+
+    cut_rows = np.flatnonzero(cuts > 0)
+    cut_log = np.empty(len(cut_rows), dtype=CUT_LOG_DTYPE)
+    cut_log['row'] = cut_rows
+    cut_log['date'] = np.asarray(weeks[week_codes[cut_rows]], dtype='datetime64[ns]')
+    cut_log['sku'] = plan['SKU'].to_numpy()[cut_rows]
+    cut_log['cut'] = cuts[cut_rows]
+    cut_log['resource'] = resource
+    cut_log['reason'] = "capacity limit" if resource == 'total' else f"{resource} capacity limit"
+    cut_log['actor'] = GREEDY_ACTOR
+    return cuts, cut_log, violations
+
+
+def format_cut_messages(cut_log: np.ndarray) -> pd.Series:
+    """Negotiation_Log text per cut row, indexed by row position."""
+    messages = [
+        f"Cut {c:.0f} due to {reason}" if actor == GREEDY_ACTOR
+        else f"Cut {c:.0f} by {actor}" + (f" ({reason})" if reason else "")
+        for c, reason, actor in zip(cut_log['cut'], cut_log['reason'], cut_log['actor'])
+    ]
+    rows, first = np.unique(cut_log['row'], return_index=True)
+    if len(rows) == len(cut_log):
+        return pd.Series(messages, index=cut_log['row'], dtype=object)
+    # A row can be cut more than once (several resources, or repeated tool calls);
+    # join its messages in log order, rows in order of their first cut
+    order = np.argsort(cut_log['row'], kind='stable')
+    bounds = np.searchsorted(cut_log['row'][order], rows)
+    parts = np.split(np.asarray(messages, dtype=object)[order], bounds[1:])
+    joined = pd.Series(["; ".join(p) for p in parts], index=rows, dtype=object)
+    return joined.iloc[np.argsort(first, kind='stable')]
+
+
+class CutLedger:
+    """
+    Typed ledger of every cut applied to a plan (SKU, Date, amount, reason, actor),
+    keyed to plan rows. Cuts are appended as structured-array chunks, so recording
+    is O(cuts) and the plan frame itself only ever holds numbers.
+    """
+
+    def __init__(self, records: np.ndarray = None):
+        self._chunks = []
+        if records is not None:
+            self.append(records)
+
+    def append(self, records: np.ndarray):
+        if len(records):
+            self._chunks.append(records)
+
+    def __len__(self) -> int:
+        return sum(len(c) for c in self._chunks)
+
+    def to_array(self) -> np.ndarray:
+        if not self._chunks:
+            return np.empty(0, dtype=CUT_LOG_DTYPE)
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+    def to_frame(self) -> pd.DataFrame:
+        records = self.to_array()
+        return pd.DataFrame({
+            'Row': records['row'],
+            'SKU': pd.Series(records['sku'], dtype="string"),
+            'Date': records['date'],
+            'Amount': records['cut'],
+            'Reason': pd.Series(records['reason'], dtype="string"),
+            'Actor': pd.Series(records['actor'], dtype="string"),
+            'Resource': pd.Series(records['resource'], dtype="string"),
+        })
+
+    def messages(self) -> pd.Series:
+        return format_cut_messages(self.to_array())
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> "CutLedger":
+        """Inverse of to_frame(), e.g. for the ledger saved next to the committed plan."""
+        records = np.empty(len(frame), dtype=CUT_LOG_DTYPE)
+        records['row'] = frame['Row'].to_numpy(dtype=np.int64)
+        records['date'] = pd.to_datetime(frame['Date']).to_numpy(dtype='datetime64[ns]')
+        records['cut'] = frame['Amount'].to_numpy(dtype=float)
+        for field, col in (('sku', 'SKU'), ('reason', 'Reason'), ('actor', 'Actor'), ('resource', 'Resource')):
+            records[field] = frame[col].astype(object).where(frame[col].notna(), "").to_numpy()
+        return cls(records)
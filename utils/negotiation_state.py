@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils.capacity import CapacityModel
+from utils.negotiation import CUT_LOG_DTYPE, GREEDY_ACTOR, CutLedger, format_cut_messages
+
+
+class NegotiationState:
+    """
+    Live negotiation state for one constrained plan.
+
+    Tracks the week x resource load and slack and the cut ledger, plus the lookups
+    needed to find a (SKU, Date) row or all rows of a week without scanning the plan.
+    Greedy cuts in one week never depend on another week, so a plan edit only needs
+    the weeks it touches re-solved; the plan frame is patched in place.
+    """
+
+    def __init__(self, plan: pd.DataFrame, model: CapacityModel, strategic_skus, cut_log: np.ndarray = None,
+                 row_priority: np.ndarray = None):
+        self.plan = plan
+        self.model = model
+        self.strategic_skus = list(strategic_skus or [])
+        # Cut order per row from the compiled policy (None: strategic flag only)
+        self.row_priority = row_priority
+
+        # Normalise dtypes once so in-place patches never need an upcast
+        if not pd.api.types.is_datetime64_any_dtype(plan['Date']):
+            plan['Date'] = pd.to_datetime(plan['Date'])
+        for col in ('Plan', 'Constrained_Plan'):
+            if plan[col].dtype != np.float64:
+                plan[col] = plan[col].astype(float)
+        if 'Negotiation_Log' not in plan.columns:
+            plan['Negotiation_Log'] = ""
+        else:
+            plan['Negotiation_Log'] = plan['Negotiation_Log'].fillna("").astype(object)
+
+        self._dates = plan['Date'].to_numpy()
+        self._skus = plan['SKU'].to_numpy()
+        # Re-solves work on integer SKU codes; strings are only needed for the ledger
+        self._sku_codes, sku_names = pd.factorize(plan['SKU'])
+        self._sku_names = sku_names.to_numpy()
+        self._strategic_codes = np.flatnonzero(sku_names.isin(self.strategic_skus)).tolist()
+        self._cols = {c: plan.columns.get_loc(c) for c in ('Plan', 'Constrained_Plan', 'Negotiation_Log')}
+        self._plan_values = plan['Plan'].to_numpy(dtype=float, copy=True)
+        self._row_lookup = pd.MultiIndex.from_arrays([plan['SKU'], plan['Date']])
+        # Build the hash engine now rather than on the first edit
+        self._row_lookup.get_indexer(self._row_lookup[:1])
+
+        # Rows of each week, in plan order
+        self.week_codes, weeks = pd.factorize(plan['Date'], sort=True)
+        self.weeks = pd.DatetimeIndex(weeks)
+        self._by_week = np.argsort(self.week_codes, kind='stable')
+        self._week_bounds = np.searchsorted(self.week_codes[self._by_week], np.arange(len(self.weeks) + 1))
+
+        # Row-level routing, sliced per edit instead of re-derived from SKUs
+        self._row_rates = model.row_rates(plan).tocsr()
+        self.limits = model.weekly_limits(self.weeks)
+        _, self.load = model.resource_load(plan, 'Constrained_Plan', row_rates=self._row_rates)
+
+        # Ledger kept per week so a re-solve only swaps out the weeks it touched
+        if cut_log is not None:
+            cut_log = self._align_ledger(cut_log)
+        if cut_log is None:
+            cut_log = self._ledger_from_plan()
+        log_weeks = self.week_codes[cut_log['row']]
+        self._ledger_by_week = {w: cut_log[log_weeks == w] for w in np.unique(log_weeks)}
+
+    def _align_ledger(self, cut_log: np.ndarray):
+        """
+        Maps a ledger onto this plan's rows by (SKU, Date), e.g. one saved next to the plan
+        on disk. None when it doesn't account for the plan's cuts (a stale ledger).
+        """
+        positions = self._row_lookup.get_indexer(pd.MultiIndex.from_arrays([
+            pd.Index(cut_log['sku'], dtype=object), pd.DatetimeIndex(cut_log['date'])
+        ]))
+        cut_log = cut_log[positions >= 0].copy()
+        cut_log['row'] = positions[positions >= 0]
+        recorded = np.bincount(cut_log['row'], weights=cut_log['cut'], minlength=len(self.plan))
+        applied = np.maximum(np.nan_to_num(self._plan_values - self.plan['Constrained_Plan'].to_numpy()), 0.0)
+        if not np.allclose(recorded, applied):
+            print("[NegotiationState] Ledger doesn't match the plan's cuts; rebuilding it from the plan.")
+            return None
+        return cut_log
+
+    def _ledger_from_plan(self) -> np.ndarray:
+        """
+        Reconstructs the ledger from Plan - Constrained_Plan when the cuts themselves are
+        unknown. Each cut is booked as a greedy cut on the first resource its row goes
+        through, so the next edit in its week can re-solve it.
+        """
+        diff = self.plan['Plan'].to_numpy() - self.plan['Constrained_Plan'].to_numpy()
+        rows = np.flatnonzero(diff > 0)
+        routed = self._row_rates[rows] > 0
+        first = np.asarray(routed.argmax(axis=1)).ravel()
+        names = np.array(self.model.resource_names, dtype=object)[first]
+        # Rows routed nowhere can't be re-solved against any resource
+        names[np.asarray(routed.sum(axis=1)).ravel() == 0] = ""
+        ledger = np.empty(len(rows), dtype=CUT_LOG_DTYPE)
+        ledger['row'] = rows
+        ledger['date'] = self._dates[rows]
+        ledger['sku'] = self._skus[rows]
+        ledger['cut'] = diff[rows]
+        ledger['resource'] = names
+        ledger['reason'] = ["capacity limit" if r in ('total', '') else f"{r} capacity limit" for r in names]
+        ledger['actor'] = GREEDY_ACTOR
+        return ledger
+
+    @property
+    def ledger(self) -> CutLedger:
+        """All cuts currently applied to the plan."""
+        if not self._ledger_by_week:
+            return CutLedger()
+        return CutLedger(np.concatenate([self._ledger_by_week[w] for w in sorted(self._ledger_by_week)]))
+
+    @property
+    def slack(self) -> pd.DataFrame:
+        """Remaining capacity per week (rows) and resource (columns)."""
+        return pd.DataFrame(self.limits - self.load, index=self.weeks, columns=self.model.resource_names)
+
+    def week_rows(self, week_codes) -> np.ndarray:
+        return np.concatenate([self._by_week[self._week_bounds[w]:self._week_bounds[w + 1]] for w in week_codes])
+
+    def apply_changes(self, changes) -> dict:
+        """
+        Applies new Plan values and re-negotiates the weeks they fall in.
+
+        Starts from the current Constrained_Plan: cuts made by the agent or by hand (any
+        actor but the greedy pass) stay as they are, and only resources whose input changed
+        get their greedy cuts re-solved. Resources run in config order, so a resource whose
+        cuts move marks the rows it touched as changed for the resources after it.
+        Args:
+            changes: DataFrame or list of dicts with SKU, Date and Plan.
+        """
+        changes = pd.DataFrame(changes)
+        keys = pd.MultiIndex.from_arrays([changes['SKU'], pd.to_datetime(changes['Date'])])
+        positions = self._row_lookup.get_indexer(keys)
+        if (positions < 0).any():
+            missing = changes.loc[positions < 0, ['SKU', 'Date']].astype(str).values.tolist()
+            raise KeyError(f"Rows not in plan: {missing}")
+
+        plan_values = self._plan_values
+        plan_values[positions] = changes['Plan'].to_numpy(dtype=float)
+        self.plan.iloc[positions, self._cols['Plan']] = plan_values[positions]
+
+        weeks_hit = np.unique(self.week_codes[positions])
+        rows = np.sort(self.week_rows(weeks_hit))
+        edited = np.searchsorted(rows, positions)
+        n_resources = len(self.model.resources)
+
+        # Split the touched weeks' ledger into kept cuts and greedy cuts per resource
+        old_log = np.concatenate([self._ledger_by_week.get(w, np.empty(0, dtype=CUT_LOG_DTYPE)) for w in weeks_hit])
+        old_resource = np.array([self.model.resource_index.get(r, -1) for r in old_log['resource']], dtype=np.int64)
+        # Greedy cuts on a resource the model no longer has can't be re-solved, so they stay too
+        greedy = (old_log['actor'] == GREEDY_ACTOR) & (old_resource >= 0)
+        kept, old_greedy, old_resource = old_log[~greedy], old_log[greedy], old_resource[greedy]
+        old_cuts = np.zeros((len(rows), n_resources))
+        np.add.at(old_cuts, (np.searchsorted(rows, old_greedy['row']), old_resource), old_greedy['cut'])
+
+        # Input to the first resource: the current plan with its greedy cuts undone, and
+        # the edited rows at their new Plan less any kept cuts
+        values = self.plan['Constrained_Plan'].to_numpy(dtype=float)[rows] + old_cuts.sum(axis=1)
+        kept_cuts = np.bincount(np.searchsorted(rows, kept['row']), weights=kept['cut'], minlength=len(rows))
+        values[edited] = np.maximum(plan_values[positions] - kept_cuts[edited], 0.0)
+        changed = np.zeros(len(rows), dtype=bool)
+        changed[edited] = True
+
+        sub_rates = self._row_rates[rows]
+        rates = sparse.csc_matrix(sub_rates)
+        rates.sort_indices()
+        weeks = self.weeks[weeks_hit]
+        limits = self.limits[weeks_hit]
+        dates, sku_codes = self._dates[rows], self._sku_codes[rows]
+        row_weeks = np.searchsorted(weeks_hit, self.week_codes[rows])
+        row_priority = None if self.row_priority is None else self.row_priority[rows]
+
+        logs, violations, resolved = [kept], [], []
+        for j in range(n_resources):
+            resource_rows = rates.indices[rates.indptr[j]:rates.indptr[j + 1]]
+            old_j = old_cuts[resource_rows, j]
+            if not changed[resource_rows].any():
+                # Same input as last time, so the same cuts
+                values[resource_rows] -= old_j
+                logs.append(old_greedy[old_resource == j])
+                continue
+
+            if not old_j.any():
+                # Nothing was cut here before; skip the pass unless the resource is now over
+                load = np.bincount(row_weeks[resource_rows], minlength=len(weeks_hit),
+                                   weights=values[resource_rows] * rates.data[rates.indptr[j]:rates.indptr[j + 1]])
+                if not (load > limits[:, j]).any():
+                    continue
+
+            resource_rows, cuts, cut_log, resource_violations = self.model.negotiate_resource(
+                j, values, dates, sku_codes, rates, weeks, limits, self._strategic_codes, row_priority=row_priority
+            )
+            changed[resource_rows] |= ~np.isclose(cuts, old_cuts[resource_rows, j])
+            values[resource_rows] -= cuts
+            cut_log['row'] = rows[cut_log['row']]
+            cut_log['sku'] = self._sku_names[cut_log['sku'].astype(np.int64)]
+            logs.append(cut_log)
+            violations.append(resource_violations)
+            resolved.append(self.model.resource_names[j])
+
+        self.plan.iloc[rows, self._cols['Constrained_Plan']] = values
+        cut_log = np.concatenate(logs)
+        # Log text only changes on rows that were cut before or are cut now
+        touched = np.union1d(old_log['row'], cut_log['row'])
+        log_text = pd.Series("", index=touched, dtype=object)
+        if len(cut_log):
+            messages = format_cut_messages(cut_log)
+            log_text[messages.index.to_numpy()] = messages.to_numpy()
+        self.plan.iloc[touched, self._cols['Negotiation_Log']] = log_text.to_numpy()
+
+        # Slack and ledger for the touched weeks only
+        sub = pd.DataFrame({'Date': dates, 'SKU': sku_codes, 'Constrained_Plan': values})
+        _, self.load[weeks_hit] = self.model.resource_load(sub, 'Constrained_Plan', row_rates=sub_rates)
+        log_weeks = self.week_codes[cut_log['row']]
+        for w in weeks_hit:
+            self._ledger_by_week[w] = cut_log[log_weeks == w]
+
+        return {
+            'rows_changed': len(positions),
+            'weeks_resolved': [str(d.date()) for d in weeks],
+            'resources_resolved': resolved,
+            'cuts': int((cut_log['actor'] == GREEDY_ACTOR).sum()),
+            'violations': sum(len(v) for v in violations),
+        }
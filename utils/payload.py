@@ -0,0 +1,110 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.tokens import estimate_tokens
+
+POLICIES = ("aggregate", "sample", "summarise")
+
+
+def to_compact_csv(df: pd.DataFrame, decimals: int = 2, index: bool = False) -> str:
+    """
+    CSV with the column names once, floats rounded, whole-number floats written as ints
+    and dates as YYYY-MM-DD. Much smaller than to_json(orient='records') or to_string().
+    """
+    out = df.copy()
+    for col in out.columns:
+        values = out[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            out[col] = values.dt.strftime('%Y-%m-%d')
+        elif pd.api.types.is_float_dtype(values):
+            values = values.round(decimals)
+            present = values.dropna()
+            # Int64 can't hold inf (e.g. a CV over a zero mean), so such columns stay float
+            whole = np.isfinite(present).all() and (present == present.round()).all() and present.abs().max() < 2**53
+            out[col] = values.astype('Int64') if whole else values
+    return out.to_csv(index=index).strip()
+
+
+class PayloadEncoder:
+    """
+    Turns a DataFrame into a prompt block within a token budget.
+
+    The frame is sent as compact CSV when it fits `max_tokens`. Otherwise `policy` decides:
+    - aggregate: sum numeric columns per month, quarter, then year (per category, then
+      in total) until it fits; frames without dates fall back to sampling.
+    - sample: evenly spaced rows, first and last included, so trends keep their shape.
+    - summarise: count/mean/std/min/max per numeric column.
+    A comment line at the top tells the model what was done.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = 3000, decimals: int = 2, policy: str = "aggregate"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown payload policy '{policy}' (expected one of {POLICIES})")
+        self.max_tokens = max_tokens
+        self.decimals = decimals
+        self.policy = policy
+
+    @classmethod
+    def from_config(cls, config: Dict, **overrides) -> "PayloadEncoder":
+        payload_config = dict((config or {}).get('payload') or {})
+        payload_config.update(overrides)
+        return cls(
+            max_tokens=payload_config.get('max_tokens', 3000),
+            decimals=payload_config.get('decimals', 2),
+            policy=payload_config.get('policy', "aggregate"),
+        )
+
+    def _fits(self, text: str) -> bool:
+        return self.max_tokens is None or estimate_tokens(text) <= self.max_tokens
+
+    def encode(self, df: pd.DataFrame, index: bool = False) -> str:
+        text = to_compact_csv(df, self.decimals, index)
+        if self._fits(text):
+            return text
+        if index:
+            df = df.reset_index()
+
+        if self.policy == "summarise":
+            return self._summarise(df)
+        if self.policy == "aggregate":
+            aggregated = self._aggregate(df)
+            if aggregated is not None:
+                return aggregated
+        return self._sample(df, text)
+
+    def _aggregate(self, df: pd.DataFrame) -> Optional[str]:
+        date_col = next((c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])), None)
+        if date_col is None and 'Date' in df.columns:
+            df = df.assign(Date=pd.to_datetime(df['Date'], errors='coerce'))
+            date_col = 'Date'
+        if date_col is None:
+            return None
+
+        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+        keys = [c for c in df.columns if c != date_col and c not in numeric_cols]
+        for by in ([keys, []] if keys else [[]]):
+            for freq, label in (('MS', 'monthly'), ('QS', 'quarterly'), ('YS', 'yearly')):
+                grouped = df.groupby(by + [pd.Grouper(key=date_col, freq=freq)])[numeric_cols].sum().reset_index()
+                note = f"# {len(df)} rows summed to {label} totals" + (f" per {', '.join(by)}" if by else "") + f" ({len(grouped)} rows)"
+                text = f"{note}\n{to_compact_csv(grouped, self.decimals)}"
+                if self._fits(text):
+                    return text
+        return None
+
+    def _sample(self, df: pd.DataFrame, full_text: str) -> str:
+        per_row = max(estimate_tokens(full_text) / max(len(df), 1), 1)
+        n = max(2, int(self.max_tokens * 0.9 / per_row))
+        positions = np.unique(np.linspace(0, len(df) - 1, n).round().astype(int))
+        note = f"# Sample of {len(positions)} of {len(df)} rows, evenly spaced"
+        return f"{note}\n{to_compact_csv(df.iloc[positions], self.decimals)}"
+
+    def _summarise(self, df: pd.DataFrame) -> str:
+        numeric = df.select_dtypes(include=['number'])
+        summary = numeric.agg(['count', 'mean', 'std', 'min', 'max']).T
+        note = f"# Summary of {len(df)} rows"
+        date_col = next((c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])), None)
+        if date_col is not None:
+            note += f" from {df[date_col].min():%Y-%m-%d} to {df[date_col].max():%Y-%m-%d}"
+        return f"{note}\n{to_compact_csv(summary.rename_axis('column'), self.decimals, index=True)}"
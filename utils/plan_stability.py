@@ -0,0 +1,81 @@
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+def load_committed_plan(path: str = "data/final_plan.csv") -> pd.DataFrame:
+    """Returns the last committed plan, or None if nothing has been committed yet."""
+    if not os.path.exists(path):
+        return None
+    try:
+        prior = pd.read_csv(path)
+        prior['Date'] = pd.to_datetime(prior['Date'])
+        return prior
+    except Exception as e:
+        print(f"[PlanStability] Error loading committed plan: {e}")
+        return None
+
+
+def commit_plan(plan: pd.DataFrame, path: str = "data/final_plan.csv", history_dir: str = "data/plan_history") -> str:
+    """
+    Commits a new plan. The previously committed plan is archived to `history_dir`
+    first so it is not lost. Returns the archive path (or None if there was nothing to archive).
+    """
+    archived = None
+    if os.path.exists(path):
+        os.makedirs(history_dir, exist_ok=True)
+        stamp = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y%m%d_%H%M%S")
+        # Unique suffix: two commits within the same second must not overwrite each other
+        archived = os.path.join(history_dir, f"final_plan_{stamp}_{uuid.uuid4().hex[:8]}.csv")
+        shutil.copy2(path, archived)
+    plan.to_csv(path, index=False)
+    return archived
+
+
+def apply_plan_stability(new_plan: pd.DataFrame, prior_plan: pd.DataFrame, max_change: float,
+                         value_col: str = 'Plan') -> pd.DataFrame:
+    """
+    Limits how far each SKU-week may move from the last committed plan.
+
+    The new plan's `value_col` is aligned with the same column of the prior plan on
+    (SKU, Date) through an index join, and every value is clamped to
+    prior * (1 -/+ max_change) in one vectorized step. Like is compared with like: the
+    unconstrained Plan against the prior unconstrained Plan, so last cycle's capacity
+    cuts don't hold back this cycle's demand signal. Rows with no prior value (new
+    SKUs, new weeks at the end of the horizon) and NaN values pass through unchanged.
+
+    Adds columns:
+        Prior_Plan: the committed value the row was compared against (NaN if none).
+        Stability_Adjustment: clamped value minus the unconstrained value.
+        Stability_Dampened: True where the change was clamped.
+    """
+    plan = new_plan.copy()
+    if prior_plan is None or prior_plan.empty or value_col not in prior_plan.columns:
+        plan['Prior_Plan'] = np.nan
+        plan['Stability_Adjustment'] = 0.0
+        plan['Stability_Dampened'] = False
+        return plan
+
+    prior = prior_plan[['SKU', 'Date', value_col]].copy()
+    prior['Date'] = pd.to_datetime(prior['Date'])
+    prior = prior.drop_duplicates(['SKU', 'Date'], keep='last').set_index(['SKU', 'Date'])[value_col]
+
+    keys = pd.MultiIndex.from_arrays([plan['SKU'], pd.to_datetime(plan['Date'])])
+    prior_values = prior.reindex(keys).to_numpy(dtype=float)
+
+    values = plan[value_col].to_numpy(dtype=float)
+    has_prior = ~np.isnan(prior_values)
+    # A negative prior flips the band, so order the bounds explicitly
+    band = np.stack([prior_values * (1 - max_change), prior_values * (1 + max_change)])
+    lower, upper = np.min(band, axis=0), np.max(band, axis=0)
+    clamped = np.where(has_prior, np.clip(values, lower, upper), values)
+
+    plan[value_col] = clamped
+    plan['Prior_Plan'] = prior_values
+    plan['Stability_Adjustment'] = np.where(has_prior & ~np.isnan(values), clamped - values, 0.0)
+    plan['Stability_Dampened'] = has_prior & ~np.isclose(clamped, values, equal_nan=True)
+    return plan
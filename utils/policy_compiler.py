@@ -0,0 +1,85 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class CompiledPolicy:
+    """
+    The guardrails of one policy as SKU-indexed arrays, so a stage can enforce them
+    over a whole plan with one lookup instead of walking nested dicts per row:
+
+    - uplift_cap: the global `constraints.max_promo_uplift`, tightened by the
+      `segments.<segment>.allowed_uplift` of the SKU's segment.
+    - is_strategic: membership of `strategic_skus`.
+    - priority_weight: how much a SKU is protected from capacity cuts (lower is cut
+      first). `priorities.sku_weights` sets it per SKU; otherwise strategic SKUs get
+      `priorities.strategic_weight` (default 2) and the rest 1.
+
+    SKUs the policy doesn't mention get the defaults (global cap, not strategic, 1).
+    `policy_version` is the PolicySnapshot version it was compiled from, so holders can
+    tell when config.yaml has moved on.
+    """
+
+    def __init__(self, skus: pd.Index, uplift_cap: np.ndarray, is_strategic: np.ndarray,
+                 priority_weight: np.ndarray, default_uplift_cap: float, policy_version: Optional[int] = None):
+        self.skus = skus
+        self.policy_version = policy_version
+        # One extra slot at the end holds the defaults for unknown SKUs
+        self._uplift_cap = np.append(uplift_cap, default_uplift_cap)
+        self._is_strategic = np.append(is_strategic, False)
+        self._priority_weight = np.append(priority_weight, 1.0)
+
+    @classmethod
+    def compile(cls, policy: Dict, sku_segments: Optional[Dict[str, str]] = None,
+                segment_rules: Optional[Dict] = None, policy_version: Optional[int] = None) -> "CompiledPolicy":
+        """
+        Args:
+            policy: policy context (constraints, strategic_skus, priorities, ...).
+            sku_segments: segment name per SKU, e.g. from segmentation.
+            segment_rules: the `segments` section; defaults to policy['segments'].
+            policy_version: PolicySnapshot version the policy was read at.
+        """
+        policy = policy or {}
+        constraints = policy.get('constraints') if isinstance(policy.get('constraints'), dict) else {}
+        priorities = policy.get('priorities') if isinstance(policy.get('priorities'), dict) else {}
+        strategic = policy.get('strategic_skus') if isinstance(policy.get('strategic_skus'), list) else []
+        rules = segment_rules if segment_rules is not None else policy.get('segments') or {}
+        sku_segments = sku_segments or {}
+        sku_weights = priorities.get('sku_weights') or {}
+
+        global_cap = float(constraints.get('max_promo_uplift', 0.5))
+        skus = pd.Index(list(dict.fromkeys([*sku_segments, *strategic, *sku_weights])))
+
+        segment_caps = {
+            name: float(rule['allowed_uplift'])
+            for name, rule in rules.items()
+            if isinstance(rule, dict) and rule.get('allowed_uplift') is not None
+        }
+        caps = np.array([segment_caps.get(sku_segments.get(sku), np.inf) for sku in skus], dtype=float)
+        uplift_cap = np.minimum(caps, global_cap)
+
+        is_strategic = skus.isin(strategic)
+        weights = np.where(is_strategic, float(priorities.get('strategic_weight', 2.0)), 1.0)
+        overrides = pd.Series(sku_weights, dtype=float).reindex(skus).to_numpy()
+        priority_weight = np.where(np.isnan(overrides), weights, overrides)
+
+        return cls(skus, uplift_cap, np.asarray(is_strategic), priority_weight, global_cap, policy_version)
+
+    def is_current(self, snapshot) -> bool:
+        """Whether the policy snapshot is still at the version this was compiled from."""
+        return self.policy_version is not None and not snapshot.changed_since(self.policy_version)
+
+    def _positions(self, skus) -> np.ndarray:
+        positions = self.skus.get_indexer(pd.Index(skus))
+        positions[positions < 0] = len(self.skus)
+        return positions
+
+    def uplift_caps(self, skus) -> np.ndarray:
+        return self._uplift_cap[self._positions(skus)]
+
+    def strategic_mask(self, skus) -> np.ndarray:
+        return self._is_strategic[self._positions(skus)]
+
+    def priority_weights(self, skus) -> np.ndarray:
+        return self._priority_weight[self._positions(skus)]
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict
+
+import yaml
+
+
+class PolicySnapshot:
+    """
+    The parsed config.yaml, shared by everything in the process that reads policy.
+
+    The file is parsed once and re-parsed only when its mtime/size change and its
+    content hash differs, checked at most every `check_interval` seconds. Each reload
+    bumps `version`, so callers can cheaply ask whether policy changed since they last
+    looked. The returned dict is shared: treat it as read-only.
+    """
+
+    def __init__(self, path: str = "config.yaml", check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._version = 0
+        self._config: Dict = {}
+        self._stat = None
+        self._hash = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Reloads the file if it changed. Returns True if a new version was loaded."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                stat = None
+            else:
+                stat = (st.st_mtime_ns, st.st_size)
+            if stat == self._stat and self._version:
+                return False
+            self._stat = stat
+
+            try:
+                with open(self.path, 'rb') as f:
+                    raw = f.read()
+            except OSError:
+                raw = b""
+            digest = hashlib.sha256(raw).hexdigest()
+            # Touched but not edited (e.g. a save without changes)
+            if digest == self._hash:
+                return False
+
+            try:
+                config = yaml.safe_load(raw) or {}
+            except Exception as e:
+                # Keep serving the last good policy rather than an empty one
+                print(f"[PolicySnapshot] Error parsing {self.path}: {e}")
+                if self._version:
+                    return False
+                config = {}
+            self._config = config
+            self._hash = digest
+            self._version += 1
+            return True
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+
+    def get(self) -> Dict:
+        """The current policy."""
+        self._maybe_refresh()
+        return self._config
+
+    @property
+    def version(self) -> int:
+        self._maybe_refresh()
+        return self._version
+
+    def changed_since(self, version: int) -> bool:
+        """Whether the policy was reloaded after `version` was current."""
+        return self.version != version
+
+    def lookup(self, key: str, default: Any = None) -> Any:
+        """A top-level section, or a key inside one of the sections."""
+        config = self.get()
+        if key in config:
+            return config[key]
+        for section in config.values():
+            if isinstance(section, dict) and key in section:
+                return section[key]
+        return default
+
+
+_snapshots: Dict[str, PolicySnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_policy_snapshot(path: str = "config.yaml") -> PolicySnapshot:
+    """The shared snapshot for a config file, loaded on first use."""
+    with _snapshots_lock:
+        if path not in _snapshots:
+            _snapshots[path] = PolicySnapshot(path)
+        return _snapshots[path]
@@ -0,0 +1,81 @@
+import ast
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def normalize_query(code: str) -> str:
+    """Same key for the same expression regardless of spacing or quote style."""
+    try:
+        return ast.dump(ast.parse(code.strip(), mode="eval"))
+    except SyntaxError:
+        return code.strip()
+
+
+class QueryResultCache:
+    """
+    Results of analyst queries, keyed by the normalised query and the dataset version
+    it ran against. New data means a new version, so stale results are never served;
+    `invalidate()` also drops them eagerly when a plan is committed. Least recently
+    used entries are evicted beyond `max_entries`. Errors are not cached.
+    """
+
+    def __init__(self, max_entries: int = 256, enabled: bool = True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "QueryResultCache":
+        cache_config = (config or {}).get('query_cache') or {}
+        return cls(
+            max_entries=cache_config.get('max_entries', 256),
+            enabled=cache_config.get('enabled', True),
+        )
+
+    def get(self, code: str, version: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = (normalize_query(code), version)
+        with self._lock:
+            output = self._entries.get(key)
+            if output is not None:
+                self._entries.move_to_end(key)
+            return output
+
+    def put(self, code: str, version: str, output: str):
+        if not self.enabled or output.startswith(("Error", "System Error")):
+            return
+        key = (normalize_query(code), version)
+        with self._lock:
+            self._entries[key] = output
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[QueryResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache(config: Dict = None) -> QueryResultCache:
+    """The process-wide query result cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryResultCache.from_config(config)
+        return _cache
+
+
+def invalidate_query_cache():
+    """Drops cached results (e.g. after a plan commit); a no-op if nothing was cached yet."""
+    if _cache is not None:
+        _cache.invalidate()
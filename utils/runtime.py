@@ -0,0 +1,101 @@
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from utils.llm_cache import get_response_cache
+from utils.policy_snapshot import get_policy_snapshot
+from utils.scheduler import RequestScheduler
+
+
+class AgentRuntime:
+    """
+    Process-wide state shared by every agent: the config snapshot, one Gemini client
+    (and its connection pool), the model backend, the request scheduler, the response
+    cache and the tool declarations.
+
+    Agents get it injected instead of each loading .env, parsing config.yaml and
+    building a client. Tool declarations only depend on the function, so they are
+    derived once per function rather than on every model call.
+    """
+
+    def __init__(self, config_path: str = "config.yaml"):
+        # Load environment variables from .env file
+        load_dotenv()
+        self.config_path = config_path
+        # Parsed once and reloaded only when the file changes (shared with other readers)
+        self.policy = get_policy_snapshot(config_path)
+
+        self.api_key = os.environ.get("GOOGLE_API_KEY")
+        self._client = None
+        self._backend = None
+        self.response_cache = get_response_cache(self.config)
+        # One scheduler per process so the rate limits cover every agent
+        self.scheduler = RequestScheduler.from_config(self.config)
+
+        self._declarations: Dict[Callable, dict] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The Gemini client, built on first use (google-genai is slow to import)."""
+        if self._client is None and self.api_key:
+            with self._lock:
+                if self._client is None:
+                    from google import genai
+                    self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    @property
+    def backend(self):
+        """Where model calls go: live, record (live + cassettes) or replay (cassettes only)."""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    from utils.model_backend import create_backend
+                    self._backend = create_backend(self, self.config)
+        return self._backend
+
+    @property
+    def config(self) -> Dict:
+        """The current config; picks up edits to config.yaml without a restart."""
+        return self.policy.get()
+
+    def tool_declaration(self, func: Callable) -> dict:
+        """JSON function declaration for a tool, cached per underlying function."""
+        # Bound methods of different agent instances share one declaration
+        key = getattr(func, '__func__', func)
+        declaration = self._declarations.get(key)
+        if declaration is None:
+            from google.genai import types
+            # Only the API flavour matters here, so replay mode needs no client
+            client = self.client
+            api_option = 'ENTERPRISE' if client is not None and client.vertexai else 'GEMINI_API'
+            declaration = types.FunctionDeclaration.from_callable_with_api_option(
+                callable=func, api_option=api_option
+            ).model_dump(mode='json', exclude_none=True)
+            with self._lock:
+                self._declarations[key] = declaration
+        return declaration
+
+
+_runtimes: Dict[str, AgentRuntime] = {}
+_runtimes_lock = threading.Lock()
+
+
+def get_runtime(config_path: str = "config.yaml") -> AgentRuntime:
+    """The shared runtime for a config file, created on first use."""
+    with _runtimes_lock:
+        if config_path not in _runtimes:
+            _runtimes[config_path] = AgentRuntime(config_path)
+        return _runtimes[config_path]
+
+
+def reset_runtime(config_path: Optional[str] = None):
+    """Drops cached runtimes (e.g. after .env changed) so the next agent rebuilds them."""
+    with _runtimes_lock:
+        if config_path is None:
+            _runtimes.clear()
+        else:
+            _runtimes.pop(config_path, None)
@@ -0,0 +1,313 @@
+import ast
+import operator
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+# What an in-process query may touch. Anything else goes to the sandbox.
+DATASETS = ('sales_data', 'final_plan', 'segmentation')
+
+# pandas/numpy attributes and methods that only read and compute. No I/O (to_csv,
+# to_pickle), no string evaluation (query, eval), no callables (apply, pipe, map), and
+# nothing whose output can outgrow its input (merge, join, pivot, unstack): the time
+# budget is only checked between calls, so one such call could exhaust the API's memory.
+SAFE_ATTRIBUTES = {
+    # selection and shape
+    'loc', 'iloc', 'at', 'iat', 'columns', 'index', 'shape', 'size', 'dtypes', 'empty', 'values',
+    'head', 'tail', 'nlargest', 'nsmallest', 'isin', 'between', 'where', 'mask', 'filter', 'get',
+    'drop', 'drop_duplicates', 'dropna', 'fillna', 'rename', 'reset_index', 'set_index', 'sort_values',
+    'sort_index', 'assign', 'copy', 'astype', 'T', 'transpose',
+    # aggregation
+    'groupby', 'agg', 'aggregate', 'sum', 'mean', 'median', 'min', 'max', 'std', 'var', 'count',
+    'nunique', 'unique', 'value_counts', 'describe', 'idxmax', 'idxmin', 'first', 'last', 'prod',
+    'quantile', 'cumsum', 'cummax', 'cummin', 'diff', 'pct_change', 'shift', 'rank', 'round', 'abs',
+    'any', 'all', 'isna', 'notna', 'isnull', 'notnull', 'clip', 'corr', 'resample', 'rolling',
+    'stack', 'melt', 'size',
+    # conversions that only build Python objects
+    'tolist', 'to_list', 'to_dict', 'to_frame', 'item',
+    # datetime and string accessors
+    'dt', 'str', 'year', 'month', 'day', 'quarter', 'week', 'dayofweek', 'date', 'isocalendar',
+    'strftime', 'contains', 'startswith', 'endswith', 'lower', 'upper', 'strip', 'len', 'split',
+}
+SAFE_MODULE_ATTRIBUTES = {'pd': {'to_datetime', 'to_numeric', 'Timestamp', 'DateOffset', 'Timedelta'}}
+# inplace/out would write into the shared frames
+FORBIDDEN_KEYWORDS = {'inplace', 'out'}
+# String methods whose pattern is a regular expression by default. A regex runs inside
+# a single call, where the time budget can't interrupt it (catastrophic backtracking),
+# so only literal patterns or regex=False stay in-process.
+PATTERN_METHODS = {'contains', 'split', 'count'}
+REGEX_CHARS = set('.^$*+?{}[]\\|()')
+# pandas resolves strings like agg('sum') to methods, so a method name as a string
+# has to pass the same whitelist as `.sum`
+_METHOD_NAMES = {
+    name for cls in (pd.DataFrame, pd.Series, pd.core.groupby.DataFrameGroupBy, pd.core.groupby.SeriesGroupBy)
+    for name in dir(cls) if not name.startswith('_')
+}
+
+BINARY_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+}
+UNARY_OPS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_, ast.Invert: operator.invert}
+COMPARE_OPS = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge, ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+    ast.Is: operator.is_, ast.IsNot: operator.is_not,
+}
+ALLOWED_NODES = (
+    ast.Expression, ast.Attribute, ast.Call, ast.keyword, ast.Subscript, ast.Slice, ast.Name, ast.Constant,
+    ast.List, ast.Tuple, ast.Dict, ast.Compare, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.And, ast.Or,
+    ast.Load, *BINARY_OPS, *UNARY_OPS, *COMPARE_OPS,
+)
+
+
+class UnsafeExpression(ValueError):
+    """The query can't take the in-process path (it goes to the sandbox instead)."""
+
+
+class QueryLimitExceeded(RuntimeError):
+    """An in-process query ran past its time budget."""
+
+
+def validate_expression(code: str, max_calls: int = 50, max_nodes: int = 400) -> ast.Expression:
+    """
+    Parses `code` and checks it is a single expression that only reads the datasets
+    through whitelisted attributes, method calls and literals: no builtins, imports,
+    lambdas, comprehensions, private attributes, I/O methods or in-place edits.
+    Raises UnsafeExpression otherwise.
+    """
+    try:
+        tree = ast.parse(code.strip(), mode="eval")
+    except SyntaxError as e:
+        raise UnsafeExpression(f"not an expression: {e}")
+
+    nodes = list(ast.walk(tree))
+    if len(nodes) > max_nodes:
+        raise UnsafeExpression("expression too large")
+    if sum(isinstance(n, ast.Call) for n in nodes) > max_calls:
+        raise UnsafeExpression("too many operations")
+
+    for node in nodes:
+        if not isinstance(node, ALLOWED_NODES):
+            raise UnsafeExpression(f"{type(node).__name__} not allowed")
+        if isinstance(node, ast.Name) and node.id not in {*DATASETS, 'self', 'pd'}:
+            raise UnsafeExpression(f"name '{node.id}' not allowed")
+        if isinstance(node, ast.keyword) and (node.arg is None or node.arg in FORBIDDEN_KEYWORDS):
+            raise UnsafeExpression("keyword not allowed")
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            if node.value in _METHOD_NAMES and node.value not in SAFE_ATTRIBUTES:
+                raise UnsafeExpression(f"'{node.value}' not allowed")
+        if isinstance(node, ast.Attribute):
+            if node.attr.startswith('_'):
+                raise UnsafeExpression("private attribute")
+            base = node.value
+            if isinstance(base, ast.Name) and base.id == 'self':
+                if node.attr not in DATASETS:
+                    raise UnsafeExpression(f"self.{node.attr} not allowed")
+            elif isinstance(base, ast.Name) and base.id in SAFE_MODULE_ATTRIBUTES:
+                if node.attr not in SAFE_MODULE_ATTRIBUTES[base.id]:
+                    raise UnsafeExpression(f"{base.id}.{node.attr} not allowed")
+            elif node.attr not in SAFE_ATTRIBUTES:
+                raise UnsafeExpression(f".{node.attr} not allowed")
+        if isinstance(node, ast.Call):
+            _check_pattern(node)
+        # `self` and `pd` only as the base of a checked attribute, never on their own
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.Name) and child.id in ('self', 'pd') \
+                    and not (isinstance(node, ast.Attribute) and node.value is child):
+                raise UnsafeExpression(f"bare '{child.id}' not allowed")
+    return tree
+
+
+def _check_pattern(call: ast.Call):
+    """Rejects calls that would run a non-literal regular expression."""
+    regex = next((k.value for k in call.keywords if k.arg == 'regex'), None)
+    if regex is not None:
+        if isinstance(regex, ast.Constant) and regex.value is False:
+            return
+        raise UnsafeExpression("regex patterns not allowed")
+    func = call.func
+    if not (isinstance(func, ast.Attribute) and func.attr in PATTERN_METHODS
+            and isinstance(func.value, ast.Attribute) and func.value.attr == 'str'):
+        return
+    pattern = call.args[0] if call.args else next((k.value for k in call.keywords if k.arg == 'pat'), None)
+    if pattern is None:
+        return
+    if not (isinstance(pattern, ast.Constant) and isinstance(pattern.value, str)
+            and not REGEX_CHARS.intersection(pattern.value)):
+        raise UnsafeExpression("regex patterns not allowed")
+
+
+class SafeEvaluator:
+    """
+    Evaluates a validated expression by walking its AST (no eval, no builtins), checking
+    the time budget before every call so a slow chain stops between operations.
+    """
+
+    def __init__(self, namespace: Dict[str, Any], max_seconds: float = 2.0):
+        self.namespace = namespace
+        self.max_seconds = max_seconds
+        self._deadline = 0.0
+
+    def evaluate(self, tree: ast.Expression) -> Any:
+        self._deadline = time.monotonic() + self.max_seconds
+        return self._eval(tree.body)
+
+    def _eval(self, node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            return self.namespace[node.id]
+        if isinstance(node, ast.Attribute):
+            return getattr(self._eval(node.value), node.attr)
+        if isinstance(node, ast.Call):
+            func = self._eval(node.func)
+            args = [self._eval(a) for a in node.args]
+            kwargs = {k.arg: self._eval(k.value) for k in node.keywords}
+            if time.monotonic() > self._deadline:
+                raise QueryLimitExceeded(f"Query exceeded the {self.max_seconds:g}s in-process limit")
+            return func(*args, **kwargs)
+        if isinstance(node, ast.Subscript):
+            return self._eval(node.value)[self._eval(node.slice)]
+        if isinstance(node, ast.Slice):
+            return slice(*(self._eval(n) if n is not None else None for n in (node.lower, node.upper, node.step)))
+        if isinstance(node, ast.List):
+            return [self._eval(e) for e in node.elts]
+        if isinstance(node, ast.Tuple):
+            return tuple(self._eval(e) for e in node.elts)
+        if isinstance(node, ast.Dict):
+            return {self._eval(k): self._eval(v) for k, v in zip(node.keys, node.values)}
+        if isinstance(node, ast.BinOp):
+            left, right = self._eval(node.left), self._eval(node.right)
+            # "x" * 10**9 would exhaust memory before any deadline check
+            if isinstance(node.op, ast.Mult) and isinstance(left if isinstance(left, (str, list, tuple)) else right, (str, list, tuple)):
+                raise UnsafeExpression("sequence repetition not allowed")
+            return BINARY_OPS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp):
+            return UNARY_OPS[type(node.op)](self._eval(node.operand))
+        if isinstance(node, ast.BoolOp):
+            result = self._eval(node.values[0])
+            for value in node.values[1:]:
+                if isinstance(node.op, ast.And) and not result or isinstance(node.op, ast.Or) and result:
+                    break
+                result = self._eval(value)
+            return result
+        if isinstance(node, ast.Compare):
+            left = self._eval(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self._eval(comparator)
+                result = COMPARE_OPS[type(op)](left, right)
+                if not isinstance(result, bool) or not result:
+                    # Element-wise (Series) comparisons can't be chained; return as is
+                    return result
+                left = right
+            return True
+        raise UnsafeExpression(f"{type(node).__name__} not allowed")
+
+
+_datasets: Dict[str, tuple] = {}  # data_dir -> (version, frames)
+_datasets_lock = threading.Lock()
+
+
+def load_datasets(data_dir: str = "data", version: str = None) -> Dict[str, Optional[pd.DataFrame]]:
+    """
+    The analyst's CSVs, read once per dataset version and shared by everything in the
+    process that queries them (DataAnalystAgent and the in-process path), so there is
+    one copy in memory and both always see the same data. Treat the frames as read-only.
+    """
+    if version is None:
+        from utils.sandbox_pool import dataset_version
+        version = dataset_version(data_dir)
+    with _datasets_lock:
+        cached = _datasets.get(data_dir)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # Same frames the sandbox worker loads
+        frames = {}
+        for name in DATASETS:
+            path = os.path.join(data_dir, f"{name}.csv")
+            frames[name] = pd.read_csv(path) if os.path.exists(path) else None
+        final_plan = frames['final_plan']
+        if final_plan is not None and 'Negotiation_Log' in final_plan.columns:
+            final_plan['Negotiation_Log'] = final_plan['Negotiation_Log'].fillna('').astype(str)
+        _datasets[data_dir] = (version, frames)
+        return frames
+
+
+class InProcessQueries:
+    """
+    The fast path for DataAnalystAgent.query_data: expressions that pass
+    validate_expression are answered against the shared frames from load_datasets,
+    skipping the round trip to a sandbox worker. `query` returns None for anything
+    that needs the sandbox.
+
+    Every query gets its own namespace and evaluator over read-only frames, so
+    concurrent chat sessions can't see each other's work; at most `max_concurrent`
+    evaluate at once (the rest wait their turn).
+    """
+
+    def __init__(self, data_dir: str = "data", max_seconds: float = 2.0, max_operations: int = 50,
+                 enabled: bool = True, max_concurrent: int = 4):
+        self.data_dir = data_dir
+        self.max_seconds = max_seconds
+        self.max_operations = max_operations
+        self.enabled = enabled
+        self.max_concurrent = max(1, max_concurrent)
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "InProcessQueries":
+        sandbox_config = (config or {}).get('sandbox') or {}
+        return cls(
+            data_dir=sandbox_config.get('data_dir', "data"),
+            max_seconds=sandbox_config.get('fast_path_timeout_seconds', 2.0),
+            max_operations=sandbox_config.get('fast_path_max_operations', 50),
+            enabled=sandbox_config.get('fast_path', True),
+            max_concurrent=sandbox_config.get('fast_path_max_concurrent', 4),
+        )
+
+    def frames(self, version: str = None) -> Dict[str, Optional[pd.DataFrame]]:
+        return load_datasets(self.data_dir, version)
+
+    def query(self, code: str, version: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            tree = validate_expression(code, max_calls=self.max_operations)
+        except UnsafeExpression:
+            return None
+        frames = self.frames(version)
+        namespace = {'self': _Datasets(frames), 'pd': pd, **frames}
+        with self._slots:
+            try:
+                return str(SafeEvaluator(namespace, self.max_seconds).evaluate(tree))
+            except UnsafeExpression:
+                return None
+            except Exception as e:
+                # Same shape as the sandbox worker's errors
+                return f"Error: {e}"
+
+
+class _Datasets:
+    """Lets queries keep the agent's `self.sales_data` spelling."""
+
+    def __init__(self, frames):
+        for name, df in frames.items():
+            setattr(self, name, df)
+
+
+_runner: Optional[InProcessQueries] = None
+_runner_lock = threading.Lock()
+
+
+def get_in_process_queries(config: Dict = None) -> InProcessQueries:
+    """The process-wide fast path, sharing one copy of the frames."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = InProcessQueries.from_config(config)
+        return _runner
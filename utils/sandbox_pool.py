@@ -0,0 +1,225 @@
+import atexit
+import hashlib
+import itertools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+from typing import Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_SCRIPT = os.path.join(ROOT, "sandbox", "worker.py")
+DATASETS = ('sales_data', 'final_plan', 'segmentation')
+MODES = ("auto", "docker", "local")
+
+
+def dataset_version(data_dir: str) -> str:
+    """Changes whenever one of the analyst's CSVs is written (mtime and size)."""
+    parts = []
+    for name in DATASETS:
+        try:
+            st = os.stat(os.path.join(data_dir, f"{name}.csv"))
+            parts.append(f"{name}:{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append(f"{name}:-")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:12]
+
+
+def docker_available(image: str) -> bool:
+    if not shutil.which("docker"):
+        return False
+    try:
+        return subprocess.run(["docker", "image", "inspect", image], capture_output=True, timeout=10).returncode == 0
+    except Exception:
+        return False
+
+
+class SandboxWorker:
+    """One warm worker process (sandbox/worker.py) with the datasets loaded."""
+
+    def __init__(self, command, version: str, start_timeout: float = 60.0, container: str = None):
+        self.version = version
+        self.container = container
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1, cwd=ROOT if command[0] != "docker" else None,
+        )
+        # Reader thread, so waiting for an answer can time out
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+        self._ids = itertools.count()
+        ready = self._next_line(start_timeout)
+        if not ready or not ready.get('ready'):
+            self.kill()
+            raise RuntimeError("Sandbox worker failed to start")
+
+    def _read(self):
+        for line in self.process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def _next_line(self, timeout: float) -> Optional[dict]:
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return json.loads(line) if line else None
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def query(self, code: str, timeout: float) -> Optional[str]:
+        """The query's output, or None if the worker died or stopped answering."""
+        request_id = next(self._ids)
+        try:
+            self.process.stdin.write(json.dumps({'id': request_id, 'code': code}) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+        response = self._next_line(timeout)
+        if response is None or response.get('id') != request_id:
+            return None
+        return response['output']
+
+    def kill(self):
+        try:
+            # Killing the docker client alone would leave the container running
+            if self.container:
+                subprocess.Popen(["docker", "kill", self.container],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class SandboxPool:
+    """
+    Warm sandboxed workers for analyst queries, instead of one cold `docker run` per query.
+
+    Each worker loads the CSVs once and answers queries over a pipe, with a per-query
+    timeout (enforced in the worker, and by killing it if it stops answering) and a
+    memory limit. Workers are restarted when the dataset version changes, when they
+    die, and after a timeout.
+
+    mode: 'docker' (pandas-sandbox image, no network, read-only data mount), 'auto'
+    (Docker when the image is available, otherwise no sandbox: only queries that pass
+    the in-process validator can run), or 'local'. 'local' runs the worker as a plain
+    subprocess on the host with restricted builtins and rlimits, which is not real
+    isolation, so it is never chosen automatically and has to be set explicitly.
+    """
+
+    def __init__(self, data_dir: str = "data", mode: str = "auto", image: str = "pandas-sandbox",
+                 workers: int = 2, timeout: float = 30.0, memory_mb: int = 1024):
+        self.data_dir = os.path.abspath(data_dir)
+        self.image = image
+        self.size = max(1, workers)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        if mode not in MODES:
+            raise ValueError(f"Unknown sandbox mode '{mode}' (expected one of {MODES})")
+        if mode == "auto":
+            # Fail closed: no Docker image means no sandbox, never the host
+            mode = "docker" if docker_available(image) else "unavailable"
+        self.mode = mode
+        if mode == "unavailable":
+            print(f"[SandboxPool] WARNING: Docker image '{image}' not found; only validated pandas "
+                  f"expressions will run. Build the image from sandbox/ (or opt in with sandbox.mode: local).")
+        elif mode == "local":
+            print(f"[SandboxPool] WARNING: Running analyst queries in local subprocesses on this host "
+                  f"(sandbox.mode: local). Use Docker outside development.")
+        else:
+            print(f"[SandboxPool] Using {mode} sandbox with {self.size} warm worker(s).")
+
+        # Idle slots; None means the slot has no running worker yet
+        self._idle = queue.Queue()
+        for _ in range(self.size):
+            self._idle.put(None)
+        self._workers = set()
+        self._container_ids = itertools.count()
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SandboxPool":
+        sandbox_config = (config or {}).get('sandbox') or {}
+        return cls(
+            data_dir=sandbox_config.get('data_dir', "data"),
+            mode=sandbox_config.get('mode', "auto"),
+            image=sandbox_config.get('image', "pandas-sandbox"),
+            workers=sandbox_config.get('workers', 2),
+            timeout=sandbox_config.get('timeout_seconds', 30.0),
+            memory_mb=sandbox_config.get('memory_mb', 1024),
+        )
+
+    def _command(self, container: str = None):
+        limits = ["--timeout", str(self.timeout), "--memory-mb", str(self.memory_mb)]
+        if self.mode == "docker":
+            return [
+                "docker", "run", "-i", "--rm", "--name", container, "--network", "none",
+                "--memory", f"{self.memory_mb + 512}m",
+                "-v", f"{self.data_dir}:/data:ro",
+                self.image, "python", "-u", "/app/worker.py", "/data", *limits,
+            ]
+        # -I: ignore the environment and user site-packages
+        return [sys.executable, "-I", "-u", WORKER_SCRIPT, self.data_dir, *limits]
+
+    def _start_worker(self, version: str) -> SandboxWorker:
+        container = f"analyst-sandbox-{os.getpid()}-{next(self._container_ids)}" if self.mode == "docker" else None
+        worker = SandboxWorker(self._command(container), version, container=container)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker: Optional[SandboxWorker]):
+        if worker is not None:
+            worker.kill()
+            with self._lock:
+                self._workers.discard(worker)
+
+    def query(self, code: str, version: str = None) -> str:
+        """Runs a query against the given dataset version (default: the current one)."""
+        if self.mode == "unavailable":
+            return (f"Error: No sandbox available (Docker image '{self.image}' not found). "
+                    f"Only plain pandas expressions over the datasets can be answered.")
+        version = version or dataset_version(self.data_dir)
+        worker = self._idle.get()
+        try:
+            # New data (e.g. a plan commit) or a dead worker: start a fresh one
+            if worker is None or not worker.alive or worker.version != version:
+                self._retire(worker)
+                worker = None
+                worker = self._start_worker(version)
+            # Small grace on top of the worker's own alarm
+            output = worker.query(code, self.timeout + 5)
+            if output is None:
+                self._retire(worker)
+                worker = None
+                return f"Error: Query failed or did not finish within {self.timeout:g}s (sandbox restarted)."
+            return output
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.kill()
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool(config: Dict) -> SandboxPool:
+    """The process-wide sandbox pool, built on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool.from_config(config)
+        return _pool
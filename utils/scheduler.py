@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from utils.metrics import metrics, current_step
+
+INTERACTIVE = 0   # chat and API queries: a user is waiting
+BATCH = 1         # planning cycles, evals
+
+# Priority of the model calls made in the current context. Chat is the default; the
+# orchestrator marks its planning cycle as batch. Follows calls into tool threads.
+request_priority = contextvars.ContextVar('request_priority', default=INTERACTIVE)
+
+# HTTP codes worth retrying: rate limited, or a transient server-side failure
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+
+@contextmanager
+def priority(level: int):
+    """Runs the enclosed model calls at the given priority."""
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def is_retryable(error: Exception) -> bool:
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    if code in RETRYABLE_CODES:
+        return True
+    # Network hiccups (requests/httpx/aiohttp all name theirs this way)
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or 'Timeout' in name or 'Connect' in name
+
+
+class RequestScheduler:
+    """
+    Central gate for model calls from every agent in the process.
+
+    - At most `max_concurrent` calls in flight and `requests_per_minute` started in any
+      60s window.
+    - Waiting calls are admitted by priority, then arrival order, so an interactive chat
+      request goes ahead of queued planning calls instead of waiting behind them.
+    - Transient errors (429, 5xx, timeouts) are retried up to `max_retries` times with
+      jittered exponential backoff. A 429 also pauses admission for everyone for that
+      delay, since the quota is shared.
+    """
+
+    def __init__(self, requests_per_minute: int = 60, max_concurrent: int = 4, max_retries: int = 3,
+                 base_delay: float = 1.0, max_delay: float = 30.0, enabled: bool = True):
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.enabled = enabled
+
+        self._cond = threading.Condition()
+        self._waiting = []                  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._started = deque()             # start times within the last minute
+        self._paused_until = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "RequestScheduler":
+        scheduler_config = (config or {}).get('scheduler') or {}
+        return cls(
+            requests_per_minute=scheduler_config.get('requests_per_minute', 60),
+            max_concurrent=scheduler_config.get('max_concurrent', 4),
+            max_retries=scheduler_config.get('max_retries', 3),
+            base_delay=scheduler_config.get('base_delay_seconds', 1.0),
+            max_delay=scheduler_config.get('max_delay_seconds', 30.0),
+            enabled=scheduler_config.get('enabled', True),
+        )
+
+    def _wait_time(self, now: float) -> float:
+        """Seconds until a slot frees up; 0 if one is free now."""
+        while self._started and now - self._started[0] >= 60:
+            self._started.popleft()
+        wait = max(0.0, self._paused_until - now)
+        if self.requests_per_minute and len(self._started) >= self.requests_per_minute:
+            wait = max(wait, 60 - (now - self._started[0]))
+        return wait
+
+    def acquire(self, level: int):
+        ticket = (level, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket and self._in_flight < self.max_concurrent:
+                        wait = self._wait_time(time.monotonic())
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        # Woken when a call finishes or the head of the queue moves
+                        self._cond.wait(1.0)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            self._in_flight += 1
+            self._started.append(time.monotonic())
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter: spreads out retries from many agents hitting the same limit
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if getattr(error, 'code', None) == 429:
+            with self._cond:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def call(self, func: Callable, agent: str = ""):
+        """Runs func() (one model call) under the limits, retrying transient errors."""
+        if not self.enabled:
+            return func()
+        level = request_priority.get()
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            self.acquire(level)
+            metrics.observe('agent_queue_wait_seconds', time.perf_counter() - start, agent=agent, priority=level)
+            try:
+                return func()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"[{agent}] Transient error ({e}); retrying in {delay:.1f}s.")
+                metrics.inc('agent_retries_total', agent=agent, step=current_step.get())
+            finally:
+                self.release()
+            time.sleep(delay)
+
+    async def _aacquire(self, level: int):
+        task = asyncio.ensure_future(asyncio.to_thread(self.acquire, level))
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # The thread still gets its slot; hand it back once it does
+            task.add_done_callback(lambda t: t.exception() is None and self.release())
+            raise
+
+    async def acall(self, func: Callable, agent: str = ""):
+        """Async call(): func() returns an awaitable. Waiting for a slot happens off the event loop."""
+        if not self.enabled:
+            return await func()
+        level = request_priority.get()
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            await self._aacquire(level)
+            metrics.observe('agent_queue_wait_seconds', time.perf_counter() - start, agent=agent, priority=level)
+            try:
+                return await func()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"[{agent}] Transient error ({e}); retrying in {delay:.1f}s.")
+                metrics.inc('agent_retries_total', agent=agent, step=current_step.get())
+            finally:
+                self.release()
+            await asyncio.sleep(delay)
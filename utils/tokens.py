@@ -0,0 +1,11 @@
+# Rough average for English text and code with Gemini's tokenizer. Good enough for
+# budgeting history; we never need exact counts.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a string (no API call)."""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+